@@ -8,65 +8,120 @@ Last updated: 4/10/2025
 TODO: 
 """
 
-from CoreClasses import *
-from GUIElements import *
+import argparse
+import sys
+import time
+
+# Taken before the Qt imports so the startup profile covers the whole launch
+launchTime = time.perf_counter()
+
+from GUIHelperClasses import (
+    Background,
+    QAction,
+    QApplication,
+    QKeySequence,
+    QLabel,
+    QMainWindow,
+    QPushButton,
+    QSize,
+    QTimer,
+    QVBoxLayout,
+    Qt,
+    backgroundAssets,
+    imageCache,
+    openFont
+)
+
+importTime = time.perf_counter()
+
+# Default limit in seconds for --startup-budget runs
+startupBudget = 2.0
+
+
+"""
+StartupProfiler records how long each phase of launching the app takes.
+Phases are marked in order, each one timed from the end of the previous phase.
+"""
+class StartupProfiler:
+    def __init__(self, start):
+        self.start = start
+        self.last = start
+        self.phases = []
+
+    # Ends the current phase under the given name (at the given time, or now)
+    def mark(self, name, when=None):
+        when = time.perf_counter() if when is None else when
+        self.phases.append((name, when - self.last))
+        self.last = when
+
+    def total(self):
+        return self.last - self.start
+
+    # Builds a readable per-phase breakdown of the launch
+    def report(self):
+        lines = ["Combat Companion startup profile"]
+        for name, elapsed in self.phases:
+            lines.append(f"{name:<32}{elapsed * 1000:>10.1f} ms")
+        lines.append(f"{'Total':<32}{self.total() * 1000:>10.1f} ms")
+        return "\n".join(lines)
 
 
 class MainWindow(QMainWindow):
-    def __init__(self):
+    def __init__(self, profiler=None):
         super().__init__()
+        self.profiler = profiler
 
         # Sets default window name and size
         self.setWindowTitle("Combat Companion")
         self.resize(QSize(1600, 900))
-        # Creates and assigns pages for each database view
-        self.monsterDB = monsterView()
-        self.playerDB = playerView()
-        self.partyDB = partyView()
-        self.speciesDB = speciesView()
-        self.classDB = classView()
-        self.typeDB = monsterTypeView()
-        self.conditionDB = conditionView()
+        # Pages for each database view, built by loadViews once the window is showing
+        self.monsterDB = None
+        self.playerDB = None
+        self.partyDB = None
+        self.speciesDB = None
+        self.classDB = None
+        self.typeDB = None
+        self.conditionDB = None
 
         layout = QVBoxLayout()
 
         # Creates an action for the monsters database to be added to the menu
         monsterAction = QAction("Monsters", self)
         monsterAction.setStatusTip("View the monsters database")
-        monsterAction.triggered.connect(lambda: self.routeDatabase(self.monsterDB))
+        monsterAction.triggered.connect(lambda: self.routeDatabase("monsterDB"))
         monsterAction.setShortcut(QKeySequence("Ctrl+Shift+m"))
 
         # Creates an action for the player character database to be added to the menu
         playerAction = QAction("Players", self)
         playerAction.setStatusTip("View the players database")
-        playerAction.triggered.connect(lambda: self.routeDatabase(self.playerDB))
+        playerAction.triggered.connect(lambda: self.routeDatabase("playerDB"))
         playerAction.setShortcut(QKeySequence("Ctrl+Shift+c"))
 
         # Creates an action for the parties database to be added to the menu
         partyAction = QAction("Parties", self)
         partyAction.setStatusTip("View the parties database")
-        partyAction.triggered.connect(lambda: self.routeDatabase(self.partyDB))
+        partyAction.triggered.connect(lambda: self.routeDatabase("partyDB"))
         partyAction.setShortcut(QKeySequence("Ctrl+Shift+p"))
 
         # Creates an action for the species database to be added to the menu
         speciesAction = QAction("Species", self)
         speciesAction.setStatusTip("View the species database")
-        speciesAction.triggered.connect(lambda: self.routeDatabase(self.speciesDB))
+        speciesAction.triggered.connect(lambda: self.routeDatabase("speciesDB"))
 
         # Creates an action for the player classes database to be added to the menu
         classAction = QAction("Classes", self)
         classAction.setStatusTip("View the classes database")
-        classAction.triggered.connect(lambda: self.routeDatabase(self.classDB))
+        classAction.triggered.connect(lambda: self.routeDatabase("classDB"))
 
         # Creates an action for the monster types database to be added to the menu
         typeAction = QAction("Monster Types", self)
         typeAction.setStatusTip("View the monster types database")
-        typeAction.triggered.connect(lambda: self.routeDatabase(self.typeDB))
+        typeAction.triggered.connect(lambda: self.routeDatabase("typeDB"))
 
         # Creates an action for the conditions database to be added to the menu
         condAction = QAction("Conditions", self)
         condAction.setStatusTip("View the conditions database")
-        condAction.triggered.connect(lambda: self.routeDatabase(self.conditionDB))
+        condAction.triggered.connect(lambda: self.routeDatabase("conditionDB"))
 
         menu = self.menuBar()
         # Creates the portion of the menu for monsters
@@ -101,9 +156,7 @@ class MainWindow(QMainWindow):
         layout.addWidget(name)
         layout.addWidget(start)
 
-        background = QLabel()
-        background.setPixmap(QPixmap("images/background.png"))
-        background.setScaledContents(True)
+        background = Background()
         background.setLayout(layout)
 
         self.setCentralWidget(background)
@@ -111,30 +164,108 @@ class MainWindow(QMainWindow):
     def startEncounter(self):
         print("Encounter Started!")
 
-    def routeDatabase(self, dest):
+    # Builds every database view, reading each table for the first time
+    def loadViews(self):
+        # The views are the heaviest part of the app, so they're only imported here
+        from GUIElements import (
+            classView,
+            conditionView,
+            monsterTypeView,
+            monsterView,
+            partyView,
+            playerView,
+            speciesView
+        )
+        from HelperFunctions import migrateHP
+        # Older monster records store their hit points as text, convert them before the monster view reads them
+        migrateHP()
+        views = [
+            ("monsterDB", monsterView),
+            ("playerDB", playerView),
+            ("partyDB", partyView),
+            ("speciesDB", speciesView),
+            ("classDB", classView),
+            ("typeDB", monsterTypeView),
+            ("conditionDB", conditionView),
+        ]
+        if self.profiler is not None:
+            self.profiler.mark("Import views")
+        for attr, view in views:
+            if getattr(self, attr) is None:
+                setattr(self, attr, view())
+            if self.profiler is not None:
+                self.profiler.mark(f"Build {view.__name__}")
+
+    def routeDatabase(self, attr):
+        # Build the views now if they are requested before loading has finished
+        if getattr(self, attr) is None:
+            self.loadViews()
+        dest = getattr(self, attr)
         if dest.isVisible():
             dest.hide()
         else:
             dest.show()
 
     def closeEvent(self, action):
-        self.monsterDB.close()
-        self.playerDB.close()
-        self.partyDB.close()
-        self.speciesDB.close()
-        self.classDB.close()
-        self.typeDB.close()
-        self.conditionDB.close()
+        for dest in [self.monsterDB, self.playerDB, self.partyDB, self.speciesDB,
+                     self.classDB, self.typeDB, self.conditionDB]:
+            if dest is not None:
+                dest.close()
         super().closeEvent(action)
 
-app = QApplication()
-app.setStyle("windowsvista")
 
-window = MainWindow()
-window.show()
+def parseArgs():
+    parser = argparse.ArgumentParser(description="Combat Companion")
+    parser.add_argument("--profile-startup", nargs="?", const="-", metavar="FILE",
+                        help="write a per-phase startup timing breakdown to FILE (or stdout)")
+    parser.add_argument("--startup-budget", nargs="?", const=startupBudget, type=float, metavar="SECONDS",
+                        help="quit once started and exit with status 1 if startup took longer than SECONDS "
+                             f"(default {startupBudget})")
+    return parser.parse_args()
+
+
+# Writes the startup profile and, for budget runs, quits with a pass/fail status
+def finishStartup(app, profiler, args):
+    if args.profile_startup is not None or args.startup_budget is not None:
+        report = profiler.report()
+        if args.profile_startup in (None, "-"):
+            print(report)
+        else:
+            with open(args.profile_startup, "w") as f:
+                f.write(report + "\n")
+    if args.startup_budget is not None:
+        overBudget = profiler.total() > args.startup_budget
+        if overBudget:
+            print(f"Startup took {profiler.total():.3f}s, over the {args.startup_budget:.3f}s budget")
+        app.exit(1 if overBudget else 0)
+
+
+def main():
+    args = parseArgs()
+    profiler = StartupProfiler(launchTime)
+    profiler.mark("Import Qt and helpers", importTime)
+
+    app = QApplication(sys.argv[:1])
+    app.setStyle("windowsvista")
+    # Start decoding the background images while the window is being built
+    imageCache.preload([path for width, path in backgroundAssets])
+    profiler.mark("Create application")
+
+    window = MainWindow(profiler)
+    window.show()
+    # Let the main window paint before any database is read
+    app.processEvents()
+    profiler.mark("Show main window")
+
+    # Load the database views from the event loop, right after the window is up
+    def loadData():
+        window.loadViews()
+        finishStartup(app, profiler, args)
+    QTimer.singleShot(0, loadData)
+
+    # Start the app on the main screen
+    return app.exec()
 
-# Test line to open the current working window
-window.playerDB.show()
 
-# Start the app on the main screen
-app.exec()
+if __name__ == "__main__":
+    sys.exit(main())
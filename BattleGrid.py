@@ -0,0 +1,256 @@
+"""
+File: BattleGrid.py
+Brief: Positions of combatants on a square battle map, with range and area queries.
+Description: The map is a grid of 5 foot squares. Combatants are kept in a spatial hash of buckets
+    (square blocks of the map), so asking who is within 30 feet, who a fireball or cone catches, or
+    which enemy is nearest only looks at the buckets the question covers instead of every token on
+    the map. The results are plain lists of combatants, ready for Encounter.applyAreaEffect and
+    Encounter.attack.
+Author: Brandon Dennis
+Version: 0.0.0
+Last updated: 4/3/2025
+TODO:
+"""
+
+import math
+import numpy as np
+from HelperFunctions import *
+
+# Feet covered by one side of a square
+squareFeet = 5
+
+# Squares a creature covers along each side, by size doc_id (Tiny, Small and Medium take one square)
+sizeSquares = {1: 1, 2: 1, 3: 1, 4: 2, 5: 3, 6: 4}
+
+"""
+BattleGrid keeps where every token on the map is
+Positions are the top left square a creature covers, counted in squares from the top left of the map.
+Points for areas (the center of a sphere, the start of a cone or line) are given in feet, so they can
+    sit on the corners between squares like the rules place them.
+Distances between creatures count diagonals as 5 feet, and a creature is inside an area when the
+    center of any square it covers is.
+width, height: Size of the map in squares
+bucketSize: Squares along each side of a bucket in the spatial hash
+"""
+class BattleGrid:
+    def __init__(self, width, height, bucketSize=8):
+        self.width = width
+        self.height = height
+        self.bucketSize = bucketSize
+        # Top left square of every token
+        self.positions = {}
+        # Tokens covering any square of each bucket, keyed by (bucket x, bucket y)
+        self.buckets = {}
+        # Functions called with (combatant, old position, new position) when a token is placed, moved
+        # or removed (positions are None when the token wasn't or isn't on the map)
+        self.listeners = []
+        # Terrain value (see Terrain) of every square, indexed [x, y]
+        self.terrain = np.zeros((width, height), dtype=np.uint8)
+        # Goes up with every token move or terrain change, so cached paths know when they're stale
+        self.version = 0
+
+    def __len__(self):
+        return len(self.positions)
+
+    def __contains__(self, combatant):
+        return combatant in self.positions
+
+    # Squares the combatant covers along each side
+    def footprint(self, combatant):
+        return sizeSquares.get(combatant.size, 1)
+
+    # Every square the combatant covers, or an empty list if they aren't on the map
+    def squares(self, combatant):
+        if combatant not in self.positions:
+            return []
+        x, y = self.positions[combatant]
+        n = self.footprint(combatant)
+        return [(x + i, y + j) for i in range(n) for j in range(n)]
+
+    # Keys of the buckets covering a block of squares (inclusive bounds)
+    def bucketKeys(self, x0, y0, x1, y1):
+        size = self.bucketSize
+        return [(bx, by) for bx in range(x0 // size, x1 // size + 1) for by in range(y0 // size, y1 // size + 1)]
+
+    """
+    place puts a token on the map, or moves it if it is already there
+    combatant: Combatant the token stands for
+    x, y: Top left square the combatant will cover
+    Raises: ValueError if the combatant wouldn't fit on the map there
+    """
+    def place(self, combatant, x, y):
+        n = self.footprint(combatant)
+        if x < 0 or y < 0 or x + n > self.width or y + n > self.height:
+            raise ValueError(f"{combatant.name} doesn't fit on the map at ({x}, {y})")
+        before = self.positions.get(combatant)
+        if before == (x, y):
+            return
+        if before is not None:
+            self.unbucket(combatant, before)
+        self.positions[combatant] = (x, y)
+        for key in self.bucketKeys(x, y, x + n - 1, y + n - 1):
+            self.buckets.setdefault(key, set()).add(combatant)
+        self.notify(combatant, before, (x, y))
+
+    # Takes a token off the map
+    def remove(self, combatant):
+        before = self.positions.pop(combatant, None)
+        if before is not None:
+            self.unbucket(combatant, before)
+            self.notify(combatant, before, None)
+
+    def unbucket(self, combatant, position):
+        x, y = position
+        n = self.footprint(combatant)
+        for key in self.bucketKeys(x, y, x + n - 1, y + n - 1):
+            bucket = self.buckets[key]
+            bucket.discard(combatant)
+            if len(bucket) == 0:
+                del self.buckets[key]
+
+    # Sets the terrain of a block of squares (inclusive bounds)
+    def setTerrain(self, x0, y0, x1, y1, terrain):
+        self.terrain[x0:x1 + 1, y0:y1 + 1] = terrain.value
+        self.version += 1
+
+    def notify(self, combatant, before, after):
+        self.version += 1
+        for listener in self.listeners:
+            listener(combatant, before, after)
+
+    # Every token in the buckets covering a block of squares (a superset of the tokens inside it)
+    def candidates(self, x0, y0, x1, y1):
+        x0, y0 = max(x0, 0), max(y0, 0)
+        x1, y1 = min(x1, self.width - 1), min(y1, self.height - 1)
+        found = set()
+        for key in self.bucketKeys(x0, y0, x1, y1):
+            found.update(self.buckets.get(key, ()))
+        return found
+
+    """
+    distance measures the feet between two tokens, from the nearest squares they cover
+    Creatures in neighbouring squares (diagonals included) are 5 feet apart
+    Returns: The distance in feet, or None if either isn't on the map
+    """
+    def distance(self, a, b):
+        if a not in self.positions or b not in self.positions:
+            return None
+        ax, ay = self.positions[a]
+        bx, by = self.positions[b]
+        n = self.footprint(a)
+        m = self.footprint(b)
+        gapX = max(bx - (ax + n), ax - (bx + m), -1) + 1
+        gapY = max(by - (ay + n), ay - (by + m), -1) + 1
+        return max(gapX, gapY) * squareFeet
+
+    """
+    within finds every token within a distance of a combatant
+    combatant: Combatant to measure from (not included in the results)
+    feet: Distance in feet, like an attack's range or an aura's radius
+    Returns: The combatants within that distance
+    """
+    def within(self, combatant, feet):
+        if combatant not in self.positions:
+            return []
+        x, y = self.positions[combatant]
+        n = self.footprint(combatant)
+        reach = feet // squareFeet
+        return [c for c in self.candidates(x - reach, y - reach, x + n - 1 + reach, y + n - 1 + reach)
+                if c is not combatant and self.distance(combatant, c) <= feet]
+
+    # Combatants the attacker can reach with one of their Attacks (its range is in feet)
+    def inRange(self, attacker, action):
+        return self.within(attacker, action.range)
+
+    """
+    inArea collects the tokens with a square center that passes a test
+    bounds: (x0, y0, x1, y1) in feet, the area must fit inside it
+    inside: Function taking the (x, y) center of a square in feet, True if the point is in the area
+    Returns: The combatants in the area
+    """
+    def inArea(self, bounds, inside):
+        x0, y0, x1, y1 = bounds
+        found = []
+        for c in self.candidates(math.floor(x0 / squareFeet), math.floor(y0 / squareFeet),
+                                 math.floor(x1 / squareFeet), math.floor(y1 / squareFeet)):
+            if any(inside((sx + 0.5) * squareFeet, (sy + 0.5) * squareFeet) for sx, sy in self.squares(c)):
+                found.append(c)
+        return found
+
+    # Tokens caught in a sphere (or cylinder, seen from above) centered on the point (x, y) in feet
+    def sphere(self, x, y, radius):
+        return self.inArea((x - radius, y - radius, x + radius, y + radius),
+                           lambda px, py: (px - x) ** 2 + (py - y) ** 2 <= radius * radius)
+
+    """
+    cone finds the tokens caught in a cone, which is as wide at any point as it is far from its start
+    x, y: Point the cone starts from, in feet
+    angle: Direction the cone points in degrees (0 is right, 90 is down the map)
+    length: Length of the cone in feet
+    Returns: The combatants in the cone
+    """
+    def cone(self, x, y, angle, length):
+        dx, dy = math.cos(math.radians(angle)), math.sin(math.radians(angle))
+
+        def inside(px, py):
+            along = (px - x) * dx + (py - y) * dy
+            across = abs((px - x) * dy - (py - y) * dx)
+            return 0 < along <= length and across <= along / 2
+        return self.inArea((x - length, y - length, x + length, y + length), inside)
+
+    """
+    line finds the tokens caught in a line
+    x, y: Point the line starts from, in feet
+    angle: Direction of the line in degrees (0 is right, 90 is down the map)
+    length, width: Size of the line in feet
+    Returns: The combatants in the line
+    """
+    def line(self, x, y, angle, length, width=5):
+        dx, dy = math.cos(math.radians(angle)), math.sin(math.radians(angle))
+
+        def inside(px, py):
+            along = (px - x) * dx + (py - y) * dy
+            across = abs((px - x) * dy - (py - y) * dx)
+            return 0 < along <= length and across <= width / 2
+        return self.inArea((x - length, y - length, x + length, y + length), inside)
+
+    """
+    nearest finds the closest conscious enemy (or ally) of a combatant
+    Searches rings of buckets outward from the combatant and stops once no closer token can turn up
+    combatant: Combatant looking for a target
+    reach: Optional distance in feet, nothing further away is returned
+    enemies: True for the other side (monsters for players and the other way around), False for their own side
+    Returns: The nearest combatant, or None if there is nobody in reach
+    """
+    def nearest(self, combatant, reach=None, enemies=True):
+        if combatant not in self.positions:
+            return None
+        x, y = self.positions[combatant]
+        n = self.footprint(combatant)
+        size = self.bucketSize
+        bx0, by0 = x // size, y // size
+        bx1, by1 = (x + n - 1) // size, (y + n - 1) // size
+        limit = max(self.width, self.height) // size + 1
+        best = None
+        bestDistance = math.inf if reach is None else reach + 1
+        for ring in range(limit + 1):
+            # Tokens first found in this ring have at least ring - 1 whole buckets between them and the combatant
+            if ring > 0 and bestDistance <= ((ring - 1) * size + 1) * squareFeet:
+                break
+            for key in self.ringKeys(bx0 - ring, by0 - ring, bx1 + ring, by1 + ring, ring):
+                for c in self.buckets.get(key, ()):
+                    if c is combatant or not c.conscious or (c.kind != combatant.kind) != enemies:
+                        continue
+                    d = self.distance(combatant, c)
+                    if d < bestDistance:
+                        best = c
+                        bestDistance = d
+        return best
+
+    # Bucket keys on the edge of a block of buckets (the whole block for the first ring)
+    def ringKeys(self, bx0, by0, bx1, by1, ring):
+        if ring == 0:
+            return [(bx, by) for bx in range(bx0, bx1 + 1) for by in range(by0, by1 + 1)]
+        keys = [(bx, by) for bx in range(bx0, bx1 + 1) for by in (by0, by1)]
+        keys.extend((bx, by) for bx in (bx0, bx1) for by in range(by0 + 1, by1))
+        return keys
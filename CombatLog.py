@@ -0,0 +1,281 @@
+"""
+File: CombatLog.py
+Brief: Append-only record of every change made to an encounter, used for undo and redo.
+Description: Changes to combat values are recorded as small event tuples and grouped into entries,
+    one entry for each action taken by the user (an HP change, a condition, a fireball hitting five
+    targets). Entries can be stepped back and forward, snapshots taken every few entries let large
+    jumps restore a copy of the state instead of replaying every entry, and entries older than the
+    horizon are dropped so a long fight doesn't grow the log forever.
+Author: Brandon Dennis
+Version: 0.0.0
+Last updated: 4/3/2025
+TODO:
+"""
+
+import numpy as np
+from contextlib import contextmanager
+
+"""
+Event formats (stored as tuples to keep the log small):
+("set", column, slot, before, after): One value in an EncounterState column changed
+("setMany", column, slots, before, after): Several values in a column changed in one batch (arrays)
+("init", combatant, before, after): A combatant's initiative changed
+("order", before, after): Tiebreaks changed and the order was rebuilt (dictionaries from combatant to tiebreak)
+("sources", combatant, before, after): The sources of a combatant's conditions changed (tuples of dict items)
+("turn", beforeCombatant, beforeRound, afterCombatant, afterRound): The turn moved
+("xp", before, after): The encounter's xp total changed
+("effects", before, after): The effect scheduler's heap changed (captures from EffectScheduler.capture)
+"""
+
+"""
+CombatLog records the changes made to an encounter and can undo or redo them
+encounter: Encounter the log belongs to
+snapshotInterval: Number of entries between snapshots of the whole state
+horizon: Number of entries kept before older ones are compacted away
+"""
+class CombatLog:
+    def __init__(self, encounter, snapshotInterval=25, horizon=500):
+        self.encounter = encounter
+        self.snapshotInterval = snapshotInterval
+        self.horizon = horizon
+        # Entries are (label, events) pairs, entries[0] sits at position base
+        self.entries = []
+        self.base = 0
+        # Number of entries currently applied, anything past it can be redone
+        self.position = 0
+        # (position, state) pairs in increasing position order
+        self.snapshots = []
+        # Events waiting for the outermost transaction to finish
+        self.pending = []
+        self.depth = 0
+        # Turned off while undoing or redoing so restored values aren't logged again
+        self.tracking = True
+        # Functions called with (position, label, events) after each entry is added
+        # (events is None when the state moved without a new entry, like an undo)
+        self.listeners = []
+        self.snapshots.append((0, self.capture()))
+
+    def __len__(self):
+        return len(self.entries)
+
+    # Clears the history and starts again from the current state
+    # (used when combatants join or leave, since their slots in the state change)
+    def reset(self):
+        self.entries = []
+        self.base = self.position
+        self.snapshots = [(self.position, self.capture())]
+        self.notify("Reset", None)
+
+    # Position of the last entry in the log
+    @property
+    def end(self):
+        return self.base + len(self.entries)
+
+    def canUndo(self):
+        return self.position > self.base
+
+    def canRedo(self):
+        return self.position < self.end
+
+    # Groups every event recorded inside the block into one entry
+    # If the block raises, its changes are taken back and nothing is logged for it
+    @contextmanager
+    def transaction(self, label):
+        start = len(self.pending)
+        self.depth += 1
+        try:
+            yield self
+        except BaseException:
+            self.rollback(start)
+            raise
+        finally:
+            self.depth -= 1
+            if self.depth == 0 and len(self.pending) > 0:
+                events = tuple(self.pending)
+                self.pending = []
+                self.commit(label, events)
+
+    # Undoes the events recorded since the given point in the open transaction and forgets them
+    def rollback(self, start):
+        events = self.pending[start:]
+        del self.pending[start:]
+        tracking = self.tracking
+        self.tracking = False
+        try:
+            for event in reversed(events):
+                self.apply(event, False)
+        finally:
+            self.tracking = tracking
+
+    # Adds an event, either to the open transaction or as an entry of its own
+    def record(self, event):
+        if not self.tracking:
+            return
+        if self.depth > 0:
+            self.pending.append(event)
+        else:
+            self.commit(None, (event,))
+
+    def commit(self, label, events):
+        # A new change after an undo replaces whatever could have been redone
+        if self.position < self.end:
+            del self.entries[self.position - self.base:]
+            while self.snapshots[-1][0] > self.position:
+                self.snapshots.pop()
+        self.entries.append((label, events))
+        self.position += 1
+        if self.position % self.snapshotInterval == 0:
+            self.snapshots.append((self.position, self.capture()))
+        self.compact()
+        self.notify(label, events)
+
+    def notify(self, label, events):
+        for listener in self.listeners:
+            listener(self.position, label, events)
+
+    """
+    compact drops entries older than the horizon
+    The log is only cut at a snapshot so the oldest entry kept can still be undone
+    """
+    def compact(self):
+        if len(self.entries) <= self.horizon:
+            return
+        cutoff = self.end - self.horizon
+        keep = 0
+        for i in range(len(self.snapshots)):
+            if self.snapshots[i][0] <= cutoff:
+                keep = i
+        newBase = self.snapshots[keep][0]
+        if newBase <= self.base:
+            return
+        del self.entries[:newBase - self.base]
+        del self.snapshots[:keep]
+        self.base = newBase
+
+    # Copies everything the log can change
+    def capture(self):
+        encounter = self.encounter
+        state = encounter.state
+        columns = {name: getattr(state, name).copy() for name in state.columns.keys()}
+        combatants = [(c, c.init, dict(c.sources), c.order.keyOf[c][3] if c.order is not None else None)
+                      for c in state.owners if c is not None]
+        return (columns, combatants, encounter.current, encounter.round, encounter.effects.capture(), encounter.xp)
+
+    # Puts a captured state back in place
+    def restore(self, snapshot):
+        columns, combatants, current, round, effects, xp = snapshot
+        encounter = self.encounter
+        state = encounter.state
+        for name, values in columns.items():
+            getattr(state, name)[:len(values)] = values
+        state.rebuildIndex()
+        tiebreaks = {}
+        for c, init, sources, tiebreak in combatants:
+            if c.state is not state:
+                continue
+            c.sources = dict(sources)
+            if c.init != init:
+                self.setInit(c, init)
+            if c.order is not None:
+                c.order.setActive(c, c.conscious)
+                if tiebreak is not None:
+                    tiebreaks[c] = tiebreak
+        encounter.order.rebuild(tiebreaks)
+        # After the initiative changes, so retiming the old heap can't disturb the one put back
+        encounter.effects.restore(effects)
+        encounter.xp = xp
+        self.setTurn(current, round)
+
+    # Steps back the given number of entries
+    def undo(self, steps=1):
+        return self.jump(self.position - steps)
+
+    # Steps forward the given number of entries
+    def redo(self, steps=1):
+        return self.jump(self.position + steps)
+
+    """
+    jump moves the encounter to the state it was in after the given entry
+    Long jumps back start from the nearest snapshot and replay forward from there
+    target: Position to move to (clamped to the entries still in the log)
+    Returns: The position reached
+    """
+    def jump(self, target):
+        target = max(self.base, min(target, self.end))
+        self.tracking = False
+        try:
+            if target < self.position - self.snapshotInterval:
+                position, snapshot = self.nearestSnapshot(target)
+                self.restore(snapshot)
+                self.position = position
+            while self.position > target:
+                self.position -= 1
+                for event in reversed(self.entries[self.position - self.base][1]):
+                    self.apply(event, False)
+            while self.position < target:
+                for event in self.entries[self.position - self.base][1]:
+                    self.apply(event, True)
+                self.position += 1
+        finally:
+            self.tracking = True
+        self.notify("Jump", None)
+        return self.position
+
+    # Latest snapshot taken at or before the given position
+    def nearestSnapshot(self, target):
+        best = self.snapshots[0]
+        for snapshot in self.snapshots:
+            if snapshot[0] > target:
+                break
+            best = snapshot
+        return best
+
+    # Applies an event forward (redo) or backward (undo)
+    def apply(self, event, forward):
+        state = self.encounter.state
+        match event[0]:
+            case "set" | "setMany":
+                _, column, slots, before, after = event
+                values = getattr(state, column)
+                changed = values[slots]
+                values[slots] = after if forward else before
+                if column == "conditions":
+                    for slot, old in zip(np.atleast_1d(slots), np.atleast_1d(changed)):
+                        state.reindex(int(slot), int(old), int(values[slot]))
+                if column == "conscious":
+                    self.syncActive(state.combatantsAt(slots if event[0] == "setMany" else [slots]))
+            case "init":
+                _, combatant, before, after = event
+                self.setInit(combatant, after if forward else before)
+            case "order":
+                _, before, after = event
+                self.encounter.order.rebuild(after if forward else before)
+            case "sources":
+                _, combatant, before, after = event
+                combatant.sources = dict(after if forward else before)
+            case "turn":
+                _, beforeCurrent, beforeRound, afterCurrent, afterRound = event
+                if forward:
+                    self.setTurn(afterCurrent, afterRound)
+                else:
+                    self.setTurn(beforeCurrent, beforeRound)
+            case "xp":
+                _, before, after = event
+                self.encounter.xp = after if forward else before
+            case "effects":
+                _, before, after = event
+                self.encounter.effects.restore(after if forward else before)
+
+    # Lets the initiative order know who can act again after conscious flags are restored
+    def syncActive(self, combatants):
+        for c in combatants:
+            if c is not None and c.order is not None:
+                c.order.setActive(c, c.conscious)
+
+    def setInit(self, combatant, init):
+        combatant.init = init
+        if combatant.order is not None:
+            combatant.order.rekey(combatant)
+
+    def setTurn(self, current, round):
+        self.encounter.order.moveTo(current, round)
@@ -0,0 +1,287 @@
+"""
+File: Commands.py
+Brief: Short text commands that change many combatants at once.
+Description: A command picks its targets with selectors and then lists what happens to them, like
+    "goblin* -2d6+3 fire half-on-save dex 14" or "all-enemies +frightened 1r". Commands are compiled
+    into a plan once and cached, so typing the same command again skips parsing. Running a plan
+    resolves the selectors against the encounter's name and condition indexes and applies every step
+    inside one transaction: the whole command is a single undo entry and listeners on the combat
+    log (like the tracker) hear about it once.
+Author: Brandon Dennis
+Version: 0.0.0
+Last updated: 4/3/2025
+TODO:
+"""
+
+import shlex
+import bisect
+import fnmatch
+from functools import lru_cache
+from CoreClasses import *
+
+"""
+Command grammar:
+command   := selectors step [step...]
+selectors := selector[,selector...]
+selector  := all | all-enemies | all-allies | all-<condition> | NAME | NAME* (wildcards * and ?)
+step      := -DICE [TYPE] [half-on-save | none-on-save] [STAT DC]   damage, rolled once for every target
+           | +DICE                                                  healing, up to max HP
+           | =NUMBER                                                set HP
+           | temp DICE                                              temp HP (kept if already higher)
+           | +CONDITION [DURATION]                                  add a condition, DURATION like 1r or 1m
+           | -CONDITION                                             remove a condition
+Names with spaces can be quoted, DICE is a rollDice expression like 2d6+3 and STAT can be shortened
+    to three letters (dex). A save without half-on-save or none-on-save halves the damage.
+"""
+
+dicePattern = re.compile(r"(\d*d\d+|\d+)(\+(\d*d\d+|\d+))*")
+durationPattern = re.compile(r"(\d+)(r|m)")
+saveWords = {"half-on-save": True, "none-on-save": False}
+
+"""
+CommandPlan is a compiled command
+selectors: Tuple of lowercase selector strings
+steps: Tuple of step tuples, one of
+    ("damage", dice, type index or None, stat or None, dc, halfOnSave)
+    ("heal", dice), ("set", hp), ("temp", dice), ("condition", name, add, rounds or None)
+Plans are cached and shared, so they are immutable
+"""
+class CommandPlan:
+    __slots__ = ("text", "selectors", "steps")
+
+    def __init__(self, text, selectors, steps):
+        object.__setattr__(self, "text", text)
+        object.__setattr__(self, "selectors", selectors)
+        object.__setattr__(self, "steps", steps)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Command plans are cached and shared, compile a new command instead")
+
+
+"""
+compileCommand parses a command into a plan (cached, so repeated commands are only parsed once)
+text: Command text
+Returns: The CommandPlan
+Raises: UnexpectedSyntax if the command doesn't follow the grammar
+"""
+@lru_cache(maxsize=256)
+def compileCommand(text):
+    try:
+        words = shlex.split(text)
+    except ValueError as error:
+        raise UnexpectedSyntax(str(error))
+    if len(words) < 2:
+        raise UnexpectedSyntax("A command needs targets and at least one step")
+    selectors = tuple(s.strip() for s in words[0].lower().split(",") if s.strip() != "")
+    steps = []
+    i = 1
+    while i < len(words):
+        word = words[i].lower()
+        if word == "temp":
+            if i + 1 == len(words) or not dicePattern.fullmatch(words[i + 1].lower()):
+                raise UnexpectedSyntax("temp needs a dice expression")
+            steps.append(("temp", words[i + 1].lower()))
+            i += 2
+        elif word[0] == "=" and word[1:].isdigit():
+            steps.append(("set", int(word[1:])))
+            i += 1
+        elif word[0] in "+-" and dicePattern.fullmatch(word[1:]):
+            if word[0] == "+":
+                steps.append(("heal", word[1:]))
+                i += 1
+            else:
+                i = compileDamage(words, i, steps)
+        elif word[0] in "+-" and len(word) > 1:
+            rounds = None
+            if word[0] == "+" and i + 1 < len(words):
+                duration = durationPattern.fullmatch(words[i + 1].lower())
+                if duration is not None:
+                    # A minute is ten rounds
+                    rounds = int(duration[1]) * (10 if duration[2] == "m" else 1)
+                    i += 1
+            steps.append(("condition", word[1:], word[0] == "+", rounds))
+            i += 1
+        else:
+            raise UnexpectedSyntax(f"Unexpected '{words[i]}'")
+    return CommandPlan(text, selectors, tuple(steps))
+
+
+# Reads a damage step starting at words[i] into steps, returns the index of the next step
+def compileDamage(words, i, steps):
+    dice = words[i].lower()[1:]
+    typeIndex = None
+    stat = None
+    dc = 0
+    halfOnSave = True
+    i += 1
+    types = [t.lower() for t in damageType]
+    if i < len(words) and words[i].lower() in types:
+        typeIndex = types.index(words[i].lower())
+        i += 1
+    saveWord = i < len(words) and words[i].lower() in saveWords
+    if saveWord:
+        halfOnSave = saveWords[words[i].lower()]
+        i += 1
+    if i < len(words) and statName(words[i]) is not None:
+        if i + 1 == len(words) or not words[i + 1].isdigit():
+            raise UnexpectedSyntax(f"{words[i]} needs a save DC")
+        stat = statName(words[i])
+        dc = int(words[i + 1])
+        i += 2
+    elif saveWord:
+        raise UnexpectedSyntax(f"{words[i - 1]} needs a save stat and DC")
+    steps.append(("damage", dice, typeIndex, stat, dc, halfOnSave))
+    return i
+
+
+# Full stat name for a stat or its first three (or more) letters, None if it isn't one
+def statName(word):
+    word = word.lower()
+    if len(word) < 3:
+        return None
+    for stat in statDict.keys():
+        if stat.lower().startswith(word):
+            return stat
+    return None
+
+
+"""
+select resolves a plan's selectors to combatants
+Members of a group are left out when the group itself was selected, so nothing is hit twice
+encounter: Encounter to search
+selectors: Selector strings from a CommandPlan
+Returns: The selected combatants in turn order
+Raises: UnexpectedSyntax if a selector matches nobody
+"""
+def select(encounter, selectors):
+    chosen = set()
+    for selector in selectors:
+        found = selectOne(encounter, selector)
+        if len(found) == 0:
+            raise UnexpectedSyntax(f"Nobody matches '{selector}'")
+        chosen.update(found)
+    ordered = []
+    for c in encounter.combatants:
+        if c in chosen:
+            ordered.append(c)
+        elif isinstance(c, MonsterGroup):
+            ordered.extend(m for m in c.members if m in chosen)
+    return ordered
+
+
+def selectOne(encounter, selector):
+    if selector == "all":
+        return list(encounter.combatants)
+    if selector in ("all-enemies", "all-monsters"):
+        return [c for c in encounter.combatants if c.kind == CombatantType.MONSTER]
+    if selector in ("all-allies", "all-players"):
+        return [c for c in encounter.combatants if c.kind == CombatantType.PLAYER]
+    if selector.startswith("all-"):
+        return list(encounter.withCondition(conditionName(selector[4:])))
+    index = encounter.nameIndex()
+    # Only names starting with the text before the first wildcard can match, found with a binary search
+    prefix = re.split(r"[*?\[]", selector, maxsplit=1)[0]
+    start = bisect.bisect_left(index, prefix, key=lambda pair: pair[0])
+    found = []
+    for i in range(start, len(index)):
+        name, c = index[i]
+        if not name.startswith(prefix):
+            break
+        if fnmatch.fnmatchcase(name, selector):
+            found.append(c)
+    return found
+
+
+# Name of a condition in the conditions table, matched without case
+def conditionName(word):
+    for name in catalog.names("conditions"):
+        if name.lower() == word.lower():
+            return name
+    raise UnexpectedSyntax(f"Unknown condition '{word}'")
+
+
+"""
+runCommand compiles (or fetches the cached plan for) a command and applies it to an encounter
+Every step lands in one combat log entry, so a single undo takes the whole command back, and a step
+    that fails takes back the steps before it (nothing is applied or logged)
+encounter: Encounter to change
+text: Command text
+Returns: A list with one (step, results) pair per step, results being a list of dictionaries
+    (applyAreaEffect's breakdown for damage, combatant and new values for everything else)
+Raises: UnexpectedSyntax if the command can't be parsed or a selector matches nobody
+"""
+def runCommand(encounter, text):
+    plan = compileCommand(text)
+    targets = select(encounter, plan.selectors)
+    # Look up every condition before changing anything, so a typo doesn't leave half a command applied
+    conditions = [conditionName(step[1]) for step in plan.steps if step[0] == "condition"]
+    results = []
+    with encounter.state.transaction(plan.text):
+        for step in plan.steps:
+            match step[0]:
+                case "damage":
+                    _, dice, typeIndex, stat, dc, halfOnSave = step
+                    results.append((step, encounter.applyAreaEffect(targets, stat, dc, dice, typeIndex, halfOnSave)))
+                case "heal":
+                    results.append((step, heal(encounter, targets, rollDice(step[1], hasAvg=False))))
+                case "set":
+                    results.append((step, setHP(encounter, targets, step[1])))
+                case "temp":
+                    results.append((step, giveTempHP(encounter, targets, rollDice(step[1], hasAvg=False))))
+                case "condition":
+                    cond = conditions.pop(0)
+                    for c in targets:
+                        if not step[2]:
+                            c.removeCondition(cond)
+                        elif step[3] is None:
+                            c.addCondition(cond)
+                        else:
+                            encounter.effects.condition(c, cond, rounds=step[3])
+                    results.append((step, [{"combatant": c, "conditions": c.conditions} for c in everyMember(targets)]))
+    return results
+
+
+# Swaps groups for all their members, standing or not, so healing can bring members back up
+def everyMember(targets):
+    expanded = []
+    for c in targets:
+        expanded.extend(c.members if isinstance(c, MonsterGroup) else [c])
+    return expanded
+
+
+# Heals every target by the same amount in one write
+def heal(encounter, targets, amount):
+    targets = everyMember(targets)
+    state = encounter.state
+    slots = state.slotsOf(targets)
+    state.writeMany("currentHP", slots, np.minimum(state.currentHP[slots] + amount, state.maxHP[slots]))
+    return hpResults(targets)
+
+
+# Sets every target's HP (capped at their max) in one write
+def setHP(encounter, targets, hp):
+    targets = everyMember(targets)
+    state = encounter.state
+    slots = state.slotsOf(targets)
+    state.writeMany("currentHP", slots, np.minimum(hp, state.maxHP[slots]))
+    return hpResults(targets)
+
+
+# Temp HP doesn't stack, each target keeps whichever is higher
+def giveTempHP(encounter, targets, amount):
+    targets = encounter.expandGroups(targets)
+    state = encounter.state
+    slots = state.slotsOf(targets)
+    state.writeMany("tempHP", slots, np.maximum(state.tempHP[slots], amount))
+    return hpResults(targets)
+
+
+# Updates conscious flags (and the xp total for monsters dropped to 0) and describes the new values
+def hpResults(targets):
+    results = []
+    for c in targets:
+        if c.conscious and c.currentHP == 0 and c.kind == CombatantType.MONSTER:
+            awardXP(c.state, c.xp)
+        c.setConscious(c.currentHP > 0)
+        results.append({"combatant": c, "currentHP": c.currentHP, "tempHP": c.tempHP})
+    return results
@@ -8,55 +8,1186 @@ Last updated: 4/3/2025
 TODO:
 """
 
+import bisect
+from contextlib import nullcontext
+import numpy as np
+from types import MappingProxyType
 from HelperFunctions import *
 from ErrorClasses import *
+from CombatLog import CombatLog
+from EffectScheduler import EffectScheduler, Effect
+from BattleGrid import BattleGrid
+from Pathfinder import Pathfinder
+
+# Random generator used for rolls made across many combatants at once
+rng = np.random.default_rng()
+
+# Legendary actions a monster gets each round (stat blocks list the actions but not how many)
+legendaryBudget = 3
+
+# Damage multiplier for each damage modifier value in damageDict
+damageMultipliers = {
+    damageDict["Neutral"]: 1.0,
+    damageDict["Vulnerable"]: 2.0,
+    damageDict["Resistant"]: 0.5,
+    damageDict["Immune"]: 0.0,
+}
 
 class Encounter:
     # Expected format for a combatant entry:
-    # [Monster_Flag, combatant data, initiative score, current_hp, max_hp]
+    # [Monster_Flag, combatant data, initiative score, current_hp, max_hp(, group size)]
+    # Monster entries with a group size become a MonsterGroup, with current and max hp per member
+    # (a single value shared by every member or one value each, see monsterEntries)
     def __init__(self, entries):
-        # Build objects for each combatant in the encounter
-        combatants = []
+        self.order = InitiativeOrder()
+        # Mutable combat values for every combatant, stored column by column
+        rows = sum(c[5] + 1 if c[0] and len(c) > 5 else 1 for c in entries)
+        self.state = EncounterState(max(rows, 1))
+        # Build objects for each combatant in the encounter and place them in initiative order
         for c in entries:
-            if c[0]: combatants.append(Monster(c[1]. c[2], c[3], c[4]))
-            else: combatants.append(Player(c[1], c[2], c[3]))
-        # Sort by initiative value (highest value first)
-        self.combatants = sorted(combatants, key=lambda combatant: combatant.init, reverse=True)
-        # Assign highest initiative to the current focus and 
-        self.currentIndex = 0
-        self.current = self.combatants[0]
+            if c[0] and len(c) > 5: self.order.insert(MonsterGroup(c[1], c[2], c[3], c[4], c[5], state=self.state))
+            elif c[0]: self.order.insert(Monster(c[1], c[2], c[3], c[4], state=self.state))
+            else: self.order.insert(Player(c[1], c[2], c[3], state=self.state))
+        # Assign highest initiative to the current focus
+        self.order.start()
+        # Conditions and spells that end on their own as turns go by
+        self.effects = EffectScheduler(self.order)
+        # Legendary actions refill and lair actions come up through the effect scheduler
+        self.lairListeners = []
+        for c in self.order:
+            self.addHooks(c)
+        # Total xp of the monsters defeated in this encounter (see awardXP)
+        self.xp = 0
+        # Every change made from here on is recorded so it can be undone
+        self.log = CombatLog(self)
+        self.state.log = self.log
+        self.effects.log = self.log
+        # Damage from any source triggers concentration saves
+        self.state.damageListeners.append(self.checkConcentration)
+        # Functions called with the results of each batch of concentration saves (for the tracker)
+        self.concentrationListeners = []
+        # Sorted (lowercase name, combatant) pairs for looking combatants up by name, built when first needed
+        self.names = None
+        # Combatants who joined since initiative was last rolled for them
+        self.unrolled = set(self.order)
+        # Optional battle map with everyone's positions, and movement over it (see useGrid)
+        self.grid = None
+        self.pathfinder = None
+
+    # Combatant whose turn it is
+    @property
+    def current(self):
+        return self.order.current()
+
+    # All combatants in turn order (highest initiative first)
+    @property
+    def combatants(self):
+        return self.order.entries
+
+    @property
+    def currentIndex(self):
+        return self.order.index(self.current)
+
+    @property
+    def round(self):
+        return self.order.round
+
+    # Adds a combatant (like reinforcements) to initiative without disturbing whose turn it is
+    def addCombatant(self, combatant):
+        if combatant.state is not self.state:
+            combatant.attach(self.state)
+        self.order.insert(combatant)
+        if self.current is None:
+            self.order.start()
+        self.addHooks(combatant)
+        self.names = None
+        self.unrolled.add(combatant)
+        # Slots have changed hands, so earlier entries can't be safely undone any more
+        self.log.reset()
+
+    # Schedules the legendary and lair hooks of a monster with legendary or lair actions
+    # (the editor keeps those apart from the Legendary flag, so the flag isn't checked)
+    def addHooks(self, combatant):
+        if combatant.kind == CombatantType.MONSTER and (len(combatant.lAct) > 0 or len(combatant.lair) > 0):
+            self.effects.legendary(combatant, self.lairActions)
+
+    # Lets the tracker know a monster's lair actions are up
+    def lairActions(self, effect):
+        for listener in self.lairListeners:
+            listener(effect.target)
+
+    """
+    useLegendary spends a monster's legendary actions
+    Legendary actions are taken at the end of another creature's turn, never on the monster's own
+    monster: Monster taking the action
+    cost: Number of legendary actions the action costs
+    Returns: True if the monster had enough actions left and it isn't their turn
+    """
+    def useLegendary(self, monster, cost=1):
+        if monster is self.current or monster.legendaryActions < cost:
+            return False
+        monster.legendaryActions -= cost
+        return True
+
+    # Spends a legendary resistance to turn a failed save into a success, returns False if none are left
+    def useLegendaryResistance(self, monster):
+        if monster.legendaryResistances <= 0:
+            return False
+        monster.legendaryResistances -= 1
+        return True
+
+    # Removes a combatant from initiative, the turn moves on from their slot when advanced
+    def removeCombatant(self, combatant):
+        self.order.remove(combatant)
+        # Give the combatant its own state so it stays usable outside the encounter
+        for c in [combatant] + (combatant.members if isinstance(combatant, MonsterGroup) else []):
+            self.effects.clear(c)
+        combatant.attach(EncounterState(1))
+        if self.grid is not None:
+            for c in [combatant] + (combatant.members if isinstance(combatant, MonsterGroup) else []):
+                self.grid.remove(c)
+        self.names = None
+        self.unrolled.discard(combatant)
+        self.log.reset()
+
+    """
+    useGrid gives the encounter a battle map, tokens are then placed with grid.place
+    and moves are planned with pathfinder.reachable and pathfinder.path
+    width, height: Size of the map in 5 foot squares
+    Returns: The BattleGrid
+    """
+    def useGrid(self, width, height):
+        self.grid = BattleGrid(width, height)
+        self.pathfinder = Pathfinder(self.grid, self)
+        return self.grid
+
+    """
+    nameIndex returns every combatant (and group member) sorted by name, for prefix searches with bisect
+    The index is rebuilt when combatants join or leave, call refreshNames after renaming anyone
+    Returns: A sorted list of (lowercase name, combatant) pairs
+    """
+    def nameIndex(self):
+        if self.names is None:
+            pairs = []
+            for c in self.combatants:
+                pairs.append((c.name.lower(), c))
+                if isinstance(c, MonsterGroup):
+                    pairs.extend((m.name.lower(), m) for m in c.members)
+            pairs.sort(key=lambda pair: pair[0])
+            self.names = pairs
+        return self.names
+
+    def refreshNames(self):
+        self.names = None
+
+    """
+    applyDamage takes damage off a group of combatants in one pass, temp HP first and then HP
+    targets: List of combatants taking damage (a MonsterGroup's row holds no HP, so damage aimed at the
+        group lands on its first standing member)
+    amounts: Array of damage values, one for each target
+    Returns: Arrays of the temp HP absorbed and HP lost by each target
+    """
+    def applyDamage(self, targets, amounts):
+        targets = [t.front() if isinstance(t, MonsterGroup) else t for t in targets]
+        state = self.state
+        slots = state.slotsOf(targets)
+        amounts = np.asarray(amounts, dtype=np.int32)
+        absorbed = np.minimum(state.tempHP[slots], amounts)
+        before = state.currentHP[slots]
+        after = np.maximum(before - (amounts - absorbed), 0)
+        with state.transaction("Damage"):
+            state.writeMany("tempHP", slots, state.tempHP[slots] - absorbed)
+            state.writeMany("currentHP", slots, after)
+            # Let the initiative order (and the xp total) know about anyone who just went down
+            for i in np.flatnonzero(state.conscious[slots] & (after == 0)):
+                target = targets[i]
+                target.setConscious(False)
+                if state.monster[target.slot]:
+                    awardXP(state, target.xp)
+            state.damaged(slots, amounts)
+        return absorbed, before - after
+
+    """
+    applyAreaEffect resolves a damaging effect against many creatures at once (like a fireball)
+    targets: List of combatants caught in the area (groups are replaced by their standing members)
+    saveStat: Name of the stat each target saves with, or None if there is no save
+    dc: Difficulty class of the saving throw
+    damageExpr: Dice expression for the damage, rolled once for every target (like "8d6")
+    dmgType: Damage type name (or index into damageType) used to look up resistances, or None to ignore them
+    halfOnSave: True if a successful save halves the damage, False if it negates it
+    Returns: A list with one dictionary per target describing the save and the damage taken
+    """
+    def applyAreaEffect(self, targets, saveStat, dc, damageExpr, dmgType, halfOnSave=True):
+        targets = self.expandGroups(targets)
+        if len(targets) == 0:
+            return []
+        rolled = rollDice(damageExpr, hasAvg=False)
+        if dmgType is None:
+            typeIndex = None
+        else:
+            typeIndex = dmgType if isinstance(dmgType, int) else damageType.index(dmgType.capitalize())
+        count = len(targets)
+        # Roll every saving throw at once
+        if saveStat is not None:
+            bonuses = np.fromiter((c.saveBonus(saveStat) for c in targets), dtype=np.int32, count=count)
+            rolls = rng.integers(1, 21, size=count) + bonuses
+            saved = rolls >= dc
+        else:
+            rolls = np.zeros(count, dtype=np.int32)
+            saved = np.zeros(count, dtype=np.bool_)
+        amounts = np.full(count, rolled, dtype=np.int32)
+        amounts[saved] = rolled // 2 if halfOnSave else 0
+        # Apply vulnerability, resistance and immunity for the damage type
+        if typeIndex is None:
+            modifiers = np.full(count, damageDict["Neutral"], dtype=np.int32)
+        else:
+            modifiers = np.fromiter((c.damages[typeIndex] for c in targets), dtype=np.int32, count=count)
+        multipliers = np.fromiter((damageMultipliers[m] for m in modifiers), dtype=np.float64, count=count)
+        amounts = np.floor(amounts * multipliers).astype(np.int32)
+        with self.state.transaction("Area effect"):
+            absorbed, lost = self.applyDamage(targets, amounts)
+        # Build the breakdown for the tracker
+        results = []
+        for i in range(count):
+            results.append({
+                "combatant": targets[i],
+                "rolled": rolled,
+                "save": int(rolls[i]) if saveStat is not None else None,
+                "saved": bool(saved[i]),
+                "modifier": damageInv[int(modifiers[i])],
+                "damage": int(amounts[i]),
+                "tempAbsorbed": int(absorbed[i]),
+                "hpLost": int(lost[i]),
+                "currentHP": targets[i].currentHP,
+                "conscious": targets[i].conscious,
+            })
+        return results
+
+    """
+    attack resolves one attack roll and its damage against a target
+    attacker: Combatant making the attack
+    action: Name of one of the attacker's actions, or an Attack
+    target: Combatant being attacked
+    Returns: A dictionary with the roll, whether it hit or crit, and the damage dealt by type
+    """
+    def attack(self, attacker, action, target):
+        if not isinstance(action, Attack):
+            action = attacker.attacks[action]
+        natural = int(rng.integers(1, 21))
+        total = natural + action.hitBonus
+        # A natural 20 always hits and a natural 1 always misses
+        critical = natural == 20
+        hit = critical or (natural != 1 and total >= target.ac)
+        result = {
+            "attacker": attacker,
+            "target": target,
+            "action": action.name,
+            "natural": natural,
+            "roll": total,
+            "hit": hit,
+            "critical": critical,
+            "damage": 0,
+            "byType": [],
+        }
+        if not hit:
+            return result
+        damage = 0
+        for count, sides, flat, typeIndex in action.damage:
+            # Critical hits roll the damage dice twice
+            if critical:
+                count *= 2
+            rolled = int(rng.integers(1, sides + 1, size=count).sum()) + flat if count > 0 else flat
+            dealt = max(int(rolled * damageMultipliers[target.damages[typeIndex]]), 0)
+            result["byType"].append((damageType[typeIndex], dealt))
+            damage += dealt
+        result["damage"] = damage
+        with self.state.transaction("Attack"):
+            self.applyDamage([target], [damage])
+        return result
+
+    """
+    mobAttack resolves an attack made by every standing member of a group at once
+    group: MonsterGroup making the attack
+    action: Name of one of the group's actions, or an Attack
+    target: Combatant being attacked
+    expected: True to deal the average damage for the average number of hits instead of rolling
+    Returns: A dictionary with the number of attackers, hits, crits, the damage dealt and the expected values
+    """
+    def mobAttack(self, group, action, target, expected=False):
+        if not isinstance(action, Attack):
+            action = group.attacks[action]
+        attackers = len(group.living())
+        # Chance to hit: anything but a natural 1 that meets the AC, and a natural 20 always hits
+        needed = min(max(target.ac - action.hitBonus, 2), 20)
+        chance = (21 - needed) / 20
+        crit = 1 / 20
+        multipliers = [damageMultipliers[target.damages[t]] for _, _, _, t in action.damage]
+        averageHit = sum((count * (sides + 1) / 2 + flat) * m for (count, sides, flat, _), m in zip(action.damage, multipliers))
+        averageCrit = sum(count * (sides + 1) / 2 * m for (count, sides, _, _), m in zip(action.damage, multipliers))
+        expectedDamage = attackers * (chance * averageHit + crit * averageCrit)
+        result = {
+            "attackers": attackers,
+            "expectedHits": attackers * chance,
+            "expectedDamage": expectedDamage,
+        }
+        if expected:
+            hits = round(attackers * chance)
+            crits = 0
+            damage = int(expectedDamage)
+        else:
+            natural = rng.integers(1, 21, size=attackers)
+            critical = natural == 20
+            hit = critical | ((natural != 1) & (natural + action.hitBonus >= target.ac))
+            hits = int(hit.sum())
+            crits = int(critical.sum())
+            damage = 0
+            # Every hit rolls the dice once, and crits roll them again
+            for (count, sides, flat, _), m in zip(action.damage, multipliers):
+                dice = count * (hits + crits)
+                rolled = int(rng.integers(1, sides + 1, size=dice).sum()) if dice > 0 else 0
+                damage += max(int((rolled + flat * hits) * m), 0)
+        result["hits"] = hits
+        result["critical"] = crits
+        result["damage"] = damage
+        with self.state.transaction("Mob attack"):
+            self.applyDamage([target], [damage])
+        return result
+
+    # Swaps any monster groups in a list of targets for their standing members
+    def expandGroups(self, targets):
+        expanded = []
+        for target in targets:
+            if isinstance(target, MonsterGroup):
+                expanded.extend(target.living())
+            else:
+                expanded.append(target)
+        return expanded
+
+    # All combatants currently at 0 HP
+    def unconscious(self):
+        state = self.state
+        return state.combatantsAt(np.flatnonzero(state.inUse & ~state.group & ~state.conscious))
+
+    # All combatants with every condition bit in the given mask
+    def withConditions(self, mask):
+        state = self.state
+        mask = np.uint64(mask)
+        return state.combatantsAt(np.flatnonzero(state.inUse & ((state.conditions & mask) == mask)))
+
+    # Every combatant with the given condition
+    def withCondition(self, cond):
+        return set(self.state.conditionIndex[conditionBit(cond)])
+
+    """
+    checkConcentration rolls the Constitution saves for every concentrating combatant in one damage event
+    Each save is against DC 10 or half the damage taken, whichever is higher, and anyone left at 0 HP
+        loses concentration without a save
+    slots: Slots of the combatants that took damage
+    amounts: Damage taken by each of them
+    Returns: A list with one dictionary per save made
+    """
+    def checkConcentration(self, slots, amounts):
+        state = self.state
+        slots = np.asarray(slots, dtype=np.intp)
+        amounts = np.asarray(amounts, dtype=np.int32)
+        hit = state.concentration[slots] & (amounts > 0)
+        if not hit.any():
+            return []
+        slots = slots[hit]
+        casters = state.combatantsAt(slots)
+        dcs = np.maximum(10, amounts[hit] // 2)
+        con = statDict["Constitution"]
+        bonuses = np.fromiter((c.block.saveBonuses[con] for c in casters), dtype=np.int32, count=len(casters))
+        rolls = rng.integers(1, 21, size=len(casters)) + bonuses
+        kept = (rolls >= dcs) & state.conscious[slots]
+        results = []
+        with state.transaction("Concentration"):
+            for i in range(len(casters)):
+                if not kept[i]:
+                    self.dropConcentration(casters[i])
+                results.append({
+                    "combatant": casters[i],
+                    "dc": int(dcs[i]),
+                    "save": int(rolls[i]),
+                    "kept": bool(kept[i]),
+                })
+        for listener in self.concentrationListeners:
+            listener(results)
+        return results
+
+    """
+    concentrate starts concentration on a spell that ends on its own after the given number of rounds
+    caster: Combatant casting the spell
+    rounds: Duration of the spell (a minute is 10 rounds)
+    spell: Name of the spell, used as the source of any conditions it causes so they end with it
+    """
+    def concentrate(self, caster, rounds, spell=""):
+        with self.state.transaction("Concentration"):
+            # Only one spell can be concentrated on at a time
+            if caster in self.effects.concentrating:
+                self.dropConcentration(caster)
+            self.effects.concentrate(caster, rounds, spell, lambda effect: self.dropConcentration(effect.target))
+
+    # Ends a combatant's concentration along with the conditions caused by their spell
+    def dropConcentration(self, caster):
+        with self.state.transaction("Concentration"):
+            caster.updateConcentrate(False)
+            effect = self.effects.endConcentration(caster)
+            if effect is not None:
+                if effect.label != "":
+                    self.endSource(effect.label)
+
+    """
+    rearm puts back a timed effect saved outside the encounter (like in the journal), giving it its callback
+    kind: Effect kind ("condition", "concentration", "legendary" or "lair")
+    anchor, target: Combatants the effect is timed against and changes
+    round, key, phase: Moment the effect fires (see EffectScheduler)
+    label, args: See Effect
+    Returns: The Effect, or None if the kind can't be rebuilt
+    """
+    def rearm(self, kind, anchor, target, round, key, phase, label="", args=()):
+        match kind:
+            case "condition":
+                cond, source = args
+                callback = lambda effect: effect.target.removeCondition(cond, source)
+            case "concentration":
+                callback = lambda effect: self.dropConcentration(effect.target)
+            case "legendary":
+                callback = lambda effect: effect.target.refreshLegendary()
+            case "lair":
+                callback = self.lairActions
+            case _:
+                return None
+        effect = Effect(anchor, target, phase, callback, label, kind in ("legendary", "lair"), kind, args)
+        with self.effects.change():
+            self.effects.push(round, key, effect)
+            if kind == "concentration":
+                self.effects.concentrating[target] = effect
+        return effect
+
+    # Removes every condition that came from the given source
+    def endSource(self, source):
+        names = catalog.names("conditions")
+        ended = []
+        with self.state.transaction("End " + str(source)):
+            for bit in range(len(names)):
+                for c in [c for c in self.state.conditionIndex[bit] if source in c.sources[bit]]:
+                    c.removeCondition(names[bit], source)
+                    ended.append(c)
+        return ended
+
+    """
+    endCondition removes a condition from everyone who has it, or only where it came from one source
+    cond: Name of the condition
+    source: Optional source (like the combatant or spell that caused it)
+    Returns: The combatants that lost the condition (or that source of it)
+    """
+    def endCondition(self, cond, source=None):
+        bit = conditionBit(cond)
+        ended = [c for c in self.state.conditionIndex[bit] if source is None or source in c.sources[bit]]
+        with self.state.transaction("End " + cond):
+            for c in ended:
+                c.removeCondition(cond, source)
+        return ended
+
+    # The conscious monster (or player, if monsters is False) with the fewest hit points
+    def lowestHP(self, monsters=True):
+        state = self.state
+        candidates = state.inUse & ~state.group & state.conscious & (state.monster == monsters)
+        if not candidates.any():
+            return None
+        hp = np.where(candidates, state.currentHP, np.iinfo(state.currentHP.dtype).max)
+        return state.owners[int(np.argmin(hp))]
+
+    # Moves the focus to the next combatant able to act and ends any effects that run out
+    def next(self):
+        with self.state.transaction("Turn"):
+            current = self.moveTurn(self.order.next)
+            self.effects.advance()
+        return current
+
+    # Moves the focus back to the previous combatant able to act
+    def previous(self):
+        return self.moveTurn(self.order.previous)
+
+    # Moves the turn with the given order method and records the move in the log
+    def moveTurn(self, step):
+        before, beforeRound = self.current, self.round
+        current = step()
+        if current is not before or self.round != beforeRound:
+            self.log.record(("turn", before, beforeRound, current, self.round))
+        return current
+
+    """
+    rollInitiative rolls initiative for many combatants in one pass and re-sorts the order once
+    Each roll is a d20 plus the initiative bonus from the combatant's database entry, members of a group
+        share the group's roll, and everyone rolled gets a fresh tiebreak
+    who: "all", "new" (combatants who joined since their last roll) or a list of combatants
+    Returns: A dictionary from each combatant rolled for to their new initiative
+    """
+    def rollInitiative(self, who="all"):
+        if who == "all":
+            targets = list(self.combatants)
+        elif who == "new":
+            targets = [c for c in self.combatants if c in self.unrolled]
+        else:
+            # A group member rolls with (and for) their group
+            targets = list(dict.fromkeys(c.group if c.kind == CombatantType.MONSTER and c.group is not None else c
+                                         for c in who))
+        count = len(targets)
+        if count == 0:
+            return {}
+        bonuses = np.fromiter((c.block.initMod for c in targets), dtype=np.int32, count=count)
+        totals = rng.integers(1, 21, size=count) + bonuses
+        tiebreaks = rng.random(count)
+        with self.state.transaction("Initiative"):
+            for c, total in zip(targets, totals.tolist()):
+                for member in [c] + (c.members if isinstance(c, MonsterGroup) else []):
+                    if member.init != total:
+                        self.log.record(("init", member, member.init, total))
+                    member.init = total
+            # The tiebreaks are logged too, so an undo puts tied combatants back the way they were
+            before = {c: self.order.keyOf[c][3] for c in targets}
+            after = dict(zip(targets, tiebreaks.tolist()))
+            self.log.record(("order", before, after))
+            self.order.rebuild(after)
+            # Rolling for everyone starts the fight over from the top of the order
+            if who == "all":
+                self.moveTurn(self.order.start)
+        self.unrolled.difference_update(targets)
+        return dict(zip(targets, totals.tolist()))
+
+    # Steps back the last change(s) made to the encounter
+    def undo(self, steps=1):
+        return self.log.undo(steps)
+
+    # Re-applies change(s) stepped back by undo
+    def redo(self, steps=1):
+        return self.log.redo(steps)
+
+
+"""
+InitiativeOrder keeps combatants sorted by a (initiative, dexterity, side, tiebreak) key.
+Ties on initiative go to the higher Dexterity score, then players go before monsters, and anything
+    still tied is settled by a random number drawn once when the combatant joins (or rolls initiative).
+Keys are stored negated in ascending sorted lists so every lookup is a binary search.
+A second list holds only the combatants able to act, so advancing the turn skips removed
+    and unconscious combatants without scanning past them.
+The turn cursor is the key of the current combatant rather than a list index, so inserts,
+    removals and re-keys elsewhere in the order never shift whose turn it is.
+"""
+class InitiativeOrder:
+    def __init__(self):
+        self.keys = []
+        self.entries = []
+        self.activeKeys = []
+        self.activeEntries = []
+        self.keyOf = {}
+        self.cursor = None
+        self.round = 1
+        # Functions called with a dictionary from old to new keys whenever combatants change places
+        self.rekeyListeners = []
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __iter__(self):
+        return iter(self.entries)
+
+    def __contains__(self, combatant):
+        return combatant in self.keyOf
+
+    # Builds the sort key for a combatant (negated so the highest initiative sorts first)
+    def makeKey(self, combatant, tiebreak=None):
+        if tiebreak is None:
+            tiebreak = float(rng.random())
+        side = 0 if combatant.kind == CombatantType.PLAYER else 1
+        return (-combatant.init, -combatant.stats[statDict["Dexterity"]], side, tiebreak)
+
+    def insert(self, combatant, tiebreak=None):
+        key = self.makeKey(combatant, tiebreak)
+        self.keyOf[combatant] = key
+        i = bisect.bisect_left(self.keys, key)
+        self.keys.insert(i, key)
+        self.entries.insert(i, combatant)
+        if combatant.conscious:
+            self.addActive(key, combatant)
+        combatant.order = self
+
+    def remove(self, combatant):
+        key = self.keyOf.pop(combatant)
+        i = bisect.bisect_left(self.keys, key)
+        del self.keys[i]
+        del self.entries[i]
+        self.removeActive(key)
+        combatant.order = None
+
+    # Moves a combatant to the right place after their initiative changes
+    def rekey(self, combatant):
+        oldKey = self.keyOf[combatant]
+        self.remove(combatant)
+        # Reuse the old tiebreak so undoing an initiative change restores the same order
+        key = self.makeKey(combatant, oldKey[3])
+        self.keyOf[combatant] = key
+        i = bisect.bisect_left(self.keys, key)
+        self.keys.insert(i, key)
+        self.entries.insert(i, combatant)
+        if combatant.conscious:
+            self.addActive(key, combatant)
+        combatant.order = self
+        # Keep the turn with the current combatant if they were the one re-keyed
+        if self.cursor == oldKey:
+            self.cursor = self.keyOf[combatant]
+        self.notifyRekey({oldKey: key})
+
+    """
+    rebuild re-sorts the whole order in one pass, for when many initiatives change at once
+    (re-keying each combatant would shift the lists once per combatant)
+    tiebreaks: Optional dictionary of new tiebreak values, everyone else keeps their own
+    """
+    def rebuild(self, tiebreaks=None):
+        tiebreaks = tiebreaks if tiebreaks is not None else {}
+        current = self.current()
+        moved = {}
+        keyed = []
+        for c in self.entries:
+            oldKey = self.keyOf[c]
+            key = self.makeKey(c, tiebreaks.get(c, oldKey[3]))
+            if key != oldKey:
+                moved[oldKey] = key
+            keyed.append((key, c))
+        keyed.sort(key=lambda pair: pair[0])
+        self.keys = [key for key, c in keyed]
+        self.entries = [c for key, c in keyed]
+        self.keyOf = {c: key for key, c in keyed}
+        self.activeKeys = [key for key, c in keyed if c.conscious]
+        self.activeEntries = [c for key, c in keyed if c.conscious]
+        if current is not None:
+            self.cursor = self.keyOf[current]
+        self.notifyRekey(moved)
+
+    def notifyRekey(self, moved):
+        if len(moved) > 0:
+            for listener in self.rekeyListeners:
+                listener(moved)
+
+    # Marks a combatant as able or unable to take turns
+    def setActive(self, combatant, active):
+        key = self.keyOf.get(combatant)
+        if key is None:
+            return
+        if active:
+            self.addActive(key, combatant)
+        else:
+            self.removeActive(key)
+
+    def addActive(self, key, combatant):
+        i = bisect.bisect_left(self.activeKeys, key)
+        if i == len(self.activeKeys) or self.activeKeys[i] != key:
+            self.activeKeys.insert(i, key)
+            self.activeEntries.insert(i, combatant)
+
+    def removeActive(self, key):
+        i = bisect.bisect_left(self.activeKeys, key)
+        if i < len(self.activeKeys) and self.activeKeys[i] == key:
+            del self.activeKeys[i]
+            del self.activeEntries[i]
+
+    # Combatant the cursor is on, or None if they have left the order
+    def current(self):
+        if self.cursor is None:
+            return None
+        i = bisect.bisect_left(self.keys, self.cursor)
+        if i < len(self.keys) and self.keys[i] == self.cursor:
+            return self.entries[i]
+        return None
+
+    # Puts the cursor on the given combatant and round (used when undoing turn changes)
+    def moveTo(self, combatant, round):
+        self.round = round
+        if combatant is None:
+            self.cursor = None
+        elif combatant in self.keyOf:
+            self.cursor = self.keyOf[combatant]
+
+    # Position of a combatant in the full turn order
+    def index(self, combatant):
+        if combatant not in self.keyOf:
+            return None
+        return bisect.bisect_left(self.keys, self.keyOf[combatant])
+
+    # Puts the cursor on the highest initiative combatant able to act
+    def start(self):
+        self.round = 1
+        if len(self.activeKeys) == 0:
+            self.cursor = None
+            return None
+        self.cursor = self.activeKeys[0]
+        return self.activeEntries[0]
+
+    # Advances the cursor to the next combatant able to act, starting a new round after the last one
+    def next(self):
+        if len(self.activeKeys) == 0:
+            return None
+        if self.cursor is None:
+            return self.start()
+        i = bisect.bisect_right(self.activeKeys, self.cursor)
+        if i == len(self.activeKeys):
+            i = 0
+            self.round += 1
+        self.cursor = self.activeKeys[i]
+        return self.activeEntries[i]
+
+    # Moves the cursor back to the previous combatant able to act
+    def previous(self):
+        if len(self.activeKeys) == 0:
+            return None
+        if self.cursor is None:
+            return self.start()
+        i = bisect.bisect_left(self.activeKeys, self.cursor) - 1
+        if i < 0:
+            # Don't rewind past the first turn of the encounter
+            if self.round == 1:
+                self.cursor = self.activeKeys[0]
+                return self.activeEntries[0]
+            i = len(self.activeKeys) - 1
+            self.round -= 1
+        self.cursor = self.activeKeys[i]
+        return self.activeEntries[i]
+
+"""
+EncounterState stores the mutable combat values of every combatant in parallel NumPy arrays.
+Each combatant owns one slot (row) and reads and writes its values through it, so questions
+    about the whole encounter (who is down, who has a condition, lowest HP) are array
+    operations rather than loops over combatant objects.
+Arrays double in size when they run out of free slots and released slots are reused.
+"""
+class EncounterState:
+    # Column names and their types
+    columns = {
+        "currentHP": np.int32,
+        "maxHP": np.int32,
+        "tempHP": np.int32,
+        "ac": np.int32,
+        "conscious": np.bool_,
+        "concentration": np.bool_,
+        "conditions": np.uint64,  # One bit per condition, see conditionBit
+        "monster": np.bool_,
+        "group": np.bool_,  # Row of a MonsterGroup itself, its members have rows of their own
+        "legendaryActions": np.int32,  # Legendary actions left before the monster's next turn
+        "legendaryResistances": np.int32,  # Legendary resistances left for the encounter
+        "inUse": np.bool_,
+    }
+
+    def __init__(self, capacity=8):
+        self.capacity = capacity
+        for name, dtype in EncounterState.columns.items():
+            setattr(self, name, np.zeros(capacity, dtype=dtype))
+        # Combatant object that owns each slot
+        self.owners = [None] * capacity
+        # Free slots, lowest numbers handed out first
+        self.free = list(range(capacity - 1, -1, -1))
+        # Combat log changes are recorded in (set by Encounter)
+        self.log = None
+        # Combatants holding each condition bit, kept in step with the conditions column
+        self.conditionIndex = [set() for i in range(64)]
+        # Functions called with (slots, amounts) whenever combatants take damage
+        self.damageListeners = []
+
+    # Doubles the size of every column
+    def grow(self):
+        extra = self.capacity
+        for name, dtype in EncounterState.columns.items():
+            setattr(self, name, np.concatenate([getattr(self, name), np.zeros(extra, dtype=dtype)]))
+        self.owners.extend([None] * extra)
+        self.free = list(range(self.capacity + extra - 1, self.capacity - 1, -1)) + self.free
+        self.capacity += extra
+
+    # Hands out a free slot for the given combatant
+    def allocate(self, owner):
+        if len(self.free) == 0:
+            self.grow()
+        slot = self.free.pop()
+        self.inUse[slot] = True
+        self.owners[slot] = owner
+        return slot
+
+    # Clears a slot so it can be reused
+    def release(self, slot):
+        self.reindex(slot, int(self.conditions[slot]), 0)
+        for name in EncounterState.columns.keys():
+            getattr(self, name)[slot] = 0
+        self.owners[slot] = None
+        self.free.append(slot)
+
+    # Sets one value in a column, recording the change in the combat log
+    def write(self, column, slot, value):
+        values = getattr(self, column)
+        before = values[slot].item()
+        values[slot] = value
+        if column == "conditions":
+            self.reindex(slot, before, int(values[slot]))
+        if self.log is not None and before != values[slot]:
+            self.log.record(("set", column, slot, before, values[slot].item()))
+
+    # Sets a batch of values in a column as a single event in the combat log
+    def writeMany(self, column, slots, newValues):
+        values = getattr(self, column)
+        before = values[slots]
+        values[slots] = newValues
+        if self.log is not None:
+            self.log.record(("setMany", column, slots.copy(), before, values[slots]))
+
+    # Lets the listeners know the given slots took damage
+    def damaged(self, slots, amounts):
+        for listener in self.damageListeners:
+            listener(slots, amounts)
+
+    # Groups the changes made inside the block into one combat log entry
+    def transaction(self, label):
+        if self.log is None:
+            return nullcontext()
+        return self.log.transaction(label)
+
+    # Moves a slot's owner between condition index sets for every bit that changed
+    def reindex(self, slot, before, after):
+        changed = before ^ after
+        owner = self.owners[slot]
+        while changed:
+            low = changed & -changed
+            bit = low.bit_length() - 1
+            if after & low:
+                self.conditionIndex[bit].add(owner)
+            else:
+                self.conditionIndex[bit].discard(owner)
+            changed ^= low
+
+    # Rebuilds the condition index from the conditions column (after a snapshot is restored)
+    def rebuildIndex(self):
+        self.conditionIndex = [set() for i in range(64)]
+        for slot in np.flatnonzero(self.inUse & (self.conditions != 0)):
+            self.reindex(int(slot), 0, int(self.conditions[slot]))
+
+    # Returns the combatants that own the given slots
+    def combatantsAt(self, slots):
+        return [self.owners[int(i)] for i in slots]
+
+    # Returns the slots owned by the given combatants as an index array
+    def slotsOf(self, combatants):
+        return np.fromiter((c.slot for c in combatants), dtype=np.intp, count=len(combatants))
+
+
+# Bit position for a condition, following the order of the conditions table
+def conditionBit(cond):
+    return catalog.position("conditions", cond)
+
+
+# Adds a defeated monster's xp to its encounter's total, recording it so an undo takes it back
+# (a combatant outside any encounter has no total to add to)
+def awardXP(state, xp):
+    if state.log is None:
+        return
+    encounter = state.log.encounter
+    state.log.record(("xp", encounter.xp, encounter.xp + xp))
+    encounter.xp += xp
+
+
+"""
+StatBlock holds the permanent values from a creature's database entry.
+Blocks are immutable and shared: every combatant built from the same document points at the
+    one block kept in statBlocks, so fifty skeletons hold a single copy of the skeleton's stats.
+List values are stored as tuples and dictionaries as read-only views.
+"""
+class StatBlock:
+    __slots__ = (
+        "kind", "index", "name", "ac", "size", "alignment", "languages", "initiative", "speed",
+        "stats", "saves", "skillProf", "senses", "damages", "notes", "proficiency",
+        # Bonuses worked out from the values above
+        "saveBonuses", "skillBonuses", "passivePerception", "initMod",
+        # Player only values
+        "level", "playerClass", "species", "hp", "jackOfTrades",
+        # Monster only values
+        "cr", "xp", "type", "actions", "traits", "legend", "lAct", "lRes", "lair", "attacks", "hitDice",
+    )
+
+    def __init__(self, kind, source):
+        # Stat blocks refuse normal assignment, so values are set through object's setter
+        values = {
+            "kind": kind,
+            "index": source.doc_id,
+            "name": source["name"],
+            "ac": source["ac"],
+            "size": source["size"],
+            "alignment": source["alignment"],
+            "languages": source.get("languages", ""),  # Not every record stores languages yet
+            "initiative": source.get("initiative", 0),
+            "speed": tuple(source["speed"]),
+            "stats": tuple(source["ability_scores"]),
+            "saves": tuple(source["saves"]),
+            "skillProf": tuple(source["skills"]),
+            "senses": tuple(source["senses"]),
+            "damages": tuple(source["damage_types"]),
+            "notes": source["notes"],
+        }
+        match kind:
+            case CombatantType.PLAYER:
+                values["level"] = source["level"]
+                values["playerClass"] = MappingProxyType(dict(source["class"]))
+                values["species"] = source["species"]
+                values["hp"] = source["hp"]
+                values["jackOfTrades"] = source.get("jack_of_trades", False)
+                values["proficiency"] = profByLevel(source["level"])
+            case CombatantType.MONSTER:
+                values["cr"] = source["cr"]
+                values["xp"] = source["xp"]
+                values["type"] = source["type"]
+                # Average HP, with the (count, sides, bonus) hit dice kept for rolling
+                hp = hitPoints(source["hp"])
+                values["hp"] = hp["average"]
+                values["hitDice"] = (hp["count"], hp["sides"], hp["bonus"])
+                values["actions"] = MappingProxyType(dict(source["actions"]))
+                # Actions ready to resolve without reading their text again
+                values["attacks"] = MappingProxyType(
+                    {name: Attack(name, action) for name, action in source["actions"].items()})
+                values["traits"] = MappingProxyType(dict(source["special_traits"]))
+                values["legend"] = source["legendary"]
+                values["lAct"] = MappingProxyType(dict(source["legendary_actions"]))
+                values["lRes"] = source["legendary_resistances"]
+                values["lair"] = MappingProxyType(dict(source["lair_actions"]))
+                values["proficiency"] = profByLevel(source["cr"])
+        # Ability scores don't change mid-fight, so every bonus is worked out once per block
+        # (editing the database entry drops the block through invalidateStatBlock)
+        mods = tuple(getBonus(score) for score in values["stats"])
+        prof = values["proficiency"]
+        values["saveBonuses"] = tuple(mods[i] + (prof if values["saves"][i] == 1 else 0) for i in range(len(mods)))
+        # Jack of all trades adds half proficiency (rounded down) to skills without proficiency
+        jack = prof // 2 if values.get("jackOfTrades") else 0
+        skillBonuses = []
+        for skill, level in zip(catalog.all("skills"), values["skillProf"]):
+            bonus = mods[statDict[skill["stat"]]]
+            # Proficient adds proficiency once, expertise adds it twice
+            bonus += prof * level if level > 0 else jack
+            skillBonuses.append(bonus)
+        values["skillBonuses"] = tuple(skillBonuses)
+        values["passivePerception"] = 10 + skillBonuses[catalog.position("skills", "Perception")]
+        values["initMod"] = source["initiative"] if "initiative" in source else mods[statDict["Dexterity"]]
+        for name in StatBlock.__slots__:
+            object.__setattr__(self, name, values.get(name))
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Stat blocks are shared between combatants, edit the database entry instead")
+
+
+"""
+Attack is a monster action compiled into numbers when its stat block is loaded
+damage holds one (dice count, dice sides, flat bonus, index into damageType) tuple per damage entry
+Like stat blocks, attacks are immutable and shared by every combatant of the same monster
+"""
+class Attack:
+    __slots__ = ("name", "hitBonus", "range", "area", "damage", "extra")
+
+    def __init__(self, name, action):
+        values = {
+            "name": name,
+            "hitBonus": action["hit_bonus"],
+            "range": action["range"],
+            "area": action["targets"] == "Area of Effect",
+            "damage": tuple(term for term in map(parseDamage, action["damage"]) if term is not None),
+            "extra": action["extra"],
+        }
+        for name in Attack.__slots__:
+            object.__setattr__(self, name, values[name])
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Attacks are shared between combatants, edit the database entry instead")
+
+
+# Shared stat blocks keyed by (CombatantType, doc_id)
+statBlocks = {}
+
+
+# Returns the shared stat block for a database document, building it the first time it's seen
+def getStatBlock(kind, source):
+    # Already a stat block (like one from loadStatBlock)
+    if isinstance(source, StatBlock):
+        return source
+    key = (kind, source.doc_id)
+    block = statBlocks.get(key)
+    if block is None:
+        block = StatBlock(kind, source)
+        statBlocks[key] = block
+    return block
+
+
+# Returns the shared stat block for a doc_id, only reading the database if it isn't cached
+def loadStatBlock(kind, doc_id):
+    key = (kind, doc_id)
+    if key not in statBlocks:
+        table = monsters if kind == CombatantType.MONSTER else players
+        getStatBlock(kind, table.get(doc_id=doc_id))
+    return statBlocks[key]
+
+
+"""
+rollHP works out hit points for several copies of a monster in one call
+block: Monster stat block
+count: Number of copies
+method: HitPointMethod.AVERAGE, ROLLED (every copy rolls its hit dice) or MAX (every die at its highest)
+Returns: Array of hit points, one for each copy (never below 1)
+"""
+def rollHP(block, count=1, method=HitPointMethod.AVERAGE):
+    dice, sides, bonus = block.hitDice
+    match method:
+        case HitPointMethod.AVERAGE:
+            hp = np.full(count, block.hp)
+        case HitPointMethod.ROLLED:
+            hp = rng.integers(1, sides + 1, size=(count, dice)).sum(axis=1) + bonus
+        case HitPointMethod.MAX:
+            hp = np.full(count, dice * sides + bonus)
+    return np.maximum(hp, 1).astype(np.int32)
+
+
+"""
+monsterEntries builds Encounter entries for several copies of a monster, with their HP from rollHP
+doc_id: Database doc_id of the monster
+count: Number of copies
+method: How the copies get their hit points
+init: Initiative to start them at (roll it afterwards with Encounter.rollInitiative)
+group: True to add the copies as one MonsterGroup rather than separate combatants
+Returns: A list of entries in the format Encounter expects
+"""
+def monsterEntries(doc_id, count, method=HitPointMethod.AVERAGE, init=0, group=False):
+    block = loadStatBlock(CombatantType.MONSTER, doc_id)
+    hp = rollHP(block, count, method)
+    if group:
+        return [[True, block, init, hp, hp, count]]
+    return [[True, block, init, int(h), int(h)] for h in hp]
+
+
+# Drops a cached stat block (or every block of that kind) so new combatants see database edits
+def invalidateStatBlock(kind, doc_id=None):
+    for key in list(statBlocks.keys()):
+        if key[0] == kind and (doc_id is None or key[1] == doc_id):
+            del statBlocks[key]
+
 
 """
 Combatant class is a general template for all monsters and players in combat
-Contains shared attributes like Armor Class, Maximum HP, and Notes
+Permanent values like Armor Class and ability scores are read from the shared stat block,
+    while the combatant itself only holds what changes during combat, like HP and conditions.
 Methods serve to manipulate data that is not permanently saved in the database
 """
 class Combatant:
-    def __init__(self, source, init, currentHP):
-        # Permanent values assigned from the database entry
-        self.index = source.doc_id
-        self.name = source["name"]
-        self.ac = source['ac']
-        self.size = source['size']
-        self.alignment = source['alignment']
-        self.languages = source['languages']
-        self.speed = source['speed']
-        self.stats = source['ability_scores']
-        self.saves = source['saves']
-        self.skillProf = source['skills']
-        self.senses = source['senses']
-        self.damages = source['damage_types']
-        self.notes = source['notes']
+    __slots__ = ("block", "name", "notes", "init", "sources", "order", "state", "slot")
+
+    def __init__(self, block, init, currentHP, state=None):
+        # Permanent values are shared through the stat block
+        self.block = block
+        self.name = block.name
+        self.notes = block.notes
+        # HP, AC and other values that change in combat live in a row of the encounter state
+        # (combatants built outside an encounter get a state of their own)
+        self.state = state if state is not None else EncounterState(1)
+        self.slot = self.state.allocate(self)
+        self.state.monster[self.slot] = block.kind == CombatantType.MONSTER
         # Temporary values assigned during combat
-        self.init = init + source['ability_scores'][1] / 100 # Add dex score at the end to help sort ties.
+        self.init = init
         self.tempHP = 0
-        self.conditions = []
+        self.ac = block.ac
+        # What caused each condition, keyed by condition bit (the conditions themselves are a bitmask)
+        self.sources = {}
         self.concentration = False
         self.conscious = True
         # Set HP stats to zero as a baseline (overridden later)
         self.maxHP = 0
         self.currentHP = currentHP
-        self.proficiency = 1
+        # Initiative order the combatant is in, if any (set by InitiativeOrder)
+        self.order = None
+
+    # Moves this combatant's row into another encounter state
+    def attach(self, state):
+        slot = state.allocate(self)
+        for name in EncounterState.columns.keys():
+            getattr(state, name)[slot] = getattr(self.state, name)[self.slot]
+        state.reindex(slot, 0, int(state.conditions[slot]))
+        self.state.release(self.slot)
+        self.state = state
+        self.slot = slot
+
+    # Values stored in the encounter state
+    @property
+    def currentHP(self):
+        return int(self.state.currentHP[self.slot])
+
+    @currentHP.setter
+    def currentHP(self, value):
+        self.state.write("currentHP", self.slot, value)
+
+    @property
+    def maxHP(self):
+        return int(self.state.maxHP[self.slot])
+
+    @maxHP.setter
+    def maxHP(self, value):
+        self.state.write("maxHP", self.slot, value)
+
+    @property
+    def tempHP(self):
+        return int(self.state.tempHP[self.slot])
+
+    @tempHP.setter
+    def tempHP(self, value):
+        self.state.write("tempHP", self.slot, value)
+
+    @property
+    def ac(self):
+        return int(self.state.ac[self.slot])
+
+    @ac.setter
+    def ac(self, value):
+        self.state.write("ac", self.slot, value)
+
+    @property
+    def conscious(self):
+        return bool(self.state.conscious[self.slot])
+
+    @conscious.setter
+    def conscious(self, value):
+        self.state.write("conscious", self.slot, value)
+
+    @property
+    def concentration(self):
+        return bool(self.state.concentration[self.slot])
+
+    @concentration.setter
+    def concentration(self, value):
+        self.state.write("concentration", self.slot, value)
+
+    @property
+    def legendaryActions(self):
+        return int(self.state.legendaryActions[self.slot])
+
+    @legendaryActions.setter
+    def legendaryActions(self, value):
+        self.state.write("legendaryActions", self.slot, value)
+
+    @property
+    def legendaryResistances(self):
+        return int(self.state.legendaryResistances[self.slot])
+
+    @legendaryResistances.setter
+    def legendaryResistances(self, value):
+        self.state.write("legendaryResistances", self.slot, value)
+
+    # Any permanent value not held on the combatant (stats, saves, ac...) comes from the stat block
+    def __getattr__(self, name):
+        if name == "block":
+            raise AttributeError(name)
+        return getattr(self.block, name)
+
+    @property
+    def index(self):
+        return self.block.index
 
     """
     setCurrentHP takes in an expression and adjusts a combatant's currentHP attribute to match
@@ -65,22 +1196,33 @@ class Combatant:
     def setCurrentHP(self, val):
         # Trim all unexpected characters from the string
         val = re.sub(r"[^0-9+-]", '', val)
-        # Check if user wants to add to the current hp (and ensures hp isn't over max)
-        if val[0] == '+' and '+' not in val[1:]:
-            self.currentHP += int(val[1:])
-            if self.currentHP > self.maxHP: self.currentHP = self.maxHP
-        # Check if user wants to subtract from current hp (and checks for unconsciousness)
-        elif val[0] == '-' and '-' not in val[1:]:
-            self.currentHP -= int(val[1:])
-            if self.currentHP <= 0:
-                self.currentHP = 0
-                self.conscious = False
-        # Check to see if the expression only contains digits
-        elif '+' not in val and '-' not in val:
-            self.currentHP = int(val)
-        # Raises an exception if the expression contains extra characters
-        else:
-            raise UnexpectedSyntax
+        with self.state.transaction("HP"):
+            # Check if user wants to add to the current hp (and ensures hp isn't over max)
+            if val[0] == '+' and '+' not in val[1:]:
+                self.currentHP += int(val[1:])
+                if self.currentHP > self.maxHP: self.currentHP = self.maxHP
+            # Check if user wants to subtract from current hp (and checks for unconsciousness)
+            elif val[0] == '-' and '-' not in val[1:]:
+                self.currentHP -= int(val[1:])
+                if self.currentHP <= 0:
+                    self.currentHP = 0
+            # Check to see if the expression only contains digits
+            elif '+' not in val and '-' not in val:
+                self.currentHP = int(val)
+            # Raises an exception if the expression contains extra characters
+            else:
+                raise UnexpectedSyntax
+            self.setConscious(self.currentHP > 0)
+            # Damage (not healing or setting hp directly) can break concentration
+            if val[0] == '-' and int(val[1:]) > 0:
+                self.state.damaged([self.slot], [int(val[1:])])
+
+    # Updates the conscious flag and lets the initiative order know whether to skip this combatant
+    def setConscious(self, conscious):
+        if conscious != self.conscious:
+            self.conscious = conscious
+            if self.order is not None:
+                self.order.setActive(self, conscious)
  
     """
     updateTempHP takes in an expression and adjusts a combatant's tempHP attribute to match
@@ -89,95 +1231,133 @@ class Combatant:
     def updateTempHP(self, val):
         # Trim all unexpected characters from the string
         val = re.sub(r"[^0-9+-]", '', val)
-        # Check if user wants to add to the current hp (and ensures hp isn't over max)
-        if val[0] == '+' and '+' not in val[1:]:
-            self.tempHP += int(val[1:])
-        # Check if user wants to subtract from current hp (and checks for unconsciousness)
-        elif val[0] == '-' and '-' not in val[1:]:
-            self.tempHP -= int(val[1:])
-            if self.tempHP <= 0:
-                self.tempHP = 0
-        # Check to see if the expression only contains digits
-        elif '+' not in val and '-' not in val:
-            self.tempHP = int(val)
-        # Raises an exception if the expression contains extra characters
-        else:
-            raise UnexpectedSyntax
+        with self.state.transaction("Temp HP"):
+            # Check if user wants to add to the current hp (and ensures hp isn't over max)
+            if val[0] == '+' and '+' not in val[1:]:
+                self.tempHP += int(val[1:])
+            # Check if user wants to subtract from current hp (and checks for unconsciousness)
+            elif val[0] == '-' and '-' not in val[1:]:
+                self.tempHP -= int(val[1:])
+                if self.tempHP <= 0:
+                    self.tempHP = 0
+            # Check to see if the expression only contains digits
+            elif '+' not in val and '-' not in val:
+                self.tempHP = int(val)
+            # Raises an exception if the expression contains extra characters
+            else:
+                raise UnexpectedSyntax
 
     # Sets maximum HP to a set value temporarily (Doesn't save to database)
     def setMaxHP(self, newMax):
         self.maxHP = newMax
 
+    # Total bonus added to a saving throw for the given stat.
+    def saveBonus(self, stat):
+        return self.block.saveBonuses[statDict[stat]]
+
+    # Total bonus added to a check with the given skill.
+    def skillBonus(self, skillName):
+        return self.block.skillBonuses[catalog.position("skills", skillName)]
+
     # Rolls a saving throw for the given stat.
     def rollSave(self, stat):
-        # Builds a statement for rolling a d20 + ability modifier
-        stmt = "d20+" + str(getBonus(self.stats[statDict[stat]]))
-        if self.saves[statDict[stat]] == 1:
-            stmt += str(self.proficiency)
-        return rollDice(stmt)
+        return rd.randint(1, 20) + self.saveBonus(stat)
 
     # Rolls a skill check using the name of the skill.
     def rollSkill(self, skillName):
-        # Looks for the requested skill in reference database
-        lookup = Query()
-        skill = skills.search(lookup.skill == skillName)[0]
-        # Finds the proper list in the ability array
-        stat = statDict[skill['stat']]
-        # Builds the rolling statement for d20 + ability modifier
-        stmt = "d20+" + str(getBonus(self.stats[stat]))
-        match self.skillProf[skill.doc_id]:
-            case 1:
-                stmt += "+" + str(self.proficiency)
-            case 2:
-                stmt += "+" + str(self.proficiency * 2)
-        return rollDice(stmt)
+        return rd.randint(1, 20) + self.skillBonus(skillName)
+
+    # Rolls initiative for the combatant.
+    def rollInit(self):
+        return rd.randint(1, 20) + self.block.initMod
 
     # Updates the notes field for the given combatant.
     def updateNotes(self, txt):
         self.notes = txt
     
-    # Updates the initiative attribute.
+    # Updates the initiative attribute and moves the combatant to their new place in the order.
     def updateInit(self, newInit):
-        self.init = newInit + self.stats[1] / 100 # Add dex score at the end to help sort ties.
+        if self.state.log is not None and newInit != self.init:
+            self.state.log.record(("init", self, self.init, newInit))
+        self.init = newInit
+        if self.order is not None:
+            self.order.rekey(self)
 
     # Updates the concentration field to represent if the combatant is concentration or not
     def updateConcentrate(self, con):
         self.concentration = con
 
-    # Adds a condition to the combatant's list
-    def addCondition(self, cond):
-        self.conditions.append(cond)
+    # Names of the combatant's conditions, in the order of the conditions table
+    @property
+    def conditions(self):
+        names = catalog.names("conditions")
+        mask = int(self.state.conditions[self.slot])
+        return [names[bit] for bit in range(mask.bit_length()) if mask >> bit & 1]
+
+    # Checks for a condition with a single bit test
+    def hasCondition(self, cond):
+        return bool(int(self.state.conditions[self.slot]) >> conditionBit(cond) & 1)
+
+    """
+    addCondition gives the combatant a condition
+    cond: Name of the condition
+    source: Optional cause of the condition (like a combatant or spell name), several sources can stack
+    """
+    def addCondition(self, cond, source=None):
+        bit = conditionBit(cond)
+        before = tuple(self.sources.items())
+        with self.state.transaction("Condition"):
+            self.sources[bit] = self.sources.get(bit, ()) + (source,)
+            self.recordSources(before)
+            self.state.write("conditions", self.slot, int(self.state.conditions[self.slot]) | 1 << bit)
+
+    """
+    removeCondition takes a condition off the combatant
+    cond: Name of the condition
+    source: Optional source, only that source is removed and the condition stays while others remain
+    """
+    def removeCondition(self, cond, source=None):
+        bit = conditionBit(cond)
+        if bit not in self.sources:
+            return
+        before = tuple(self.sources.items())
+        with self.state.transaction("Condition"):
+            remaining = () if source is None else tuple(s for s in self.sources[bit] if s != source)
+            if len(remaining) > 0:
+                self.sources[bit] = remaining
+            else:
+                del self.sources[bit]
+            self.recordSources(before)
+            if len(remaining) == 0:
+                self.state.write("conditions", self.slot, int(self.state.conditions[self.slot]) & ~(1 << bit))
 
-    # Removes a condition from the combatant's list
-    def removeCondition(self, cond):
-        self.conditions.remove(cond)
+    def recordSources(self, before):
+        if self.state.log is not None:
+            self.state.log.record(("sources", self, before, tuple(self.sources.items())))
 
 """
 Player class is used for player characters in initiative order
 Contains player-specific stats like species, class, and death saves
 """
 class Player(Combatant):
-    def __init__(self, pc, init, currentHP):
+    __slots__ = ("deathSaves",)
+
+    def __init__(self, pc, init, currentHP, state=None):
         # Set all shared values through the super method
-        super().__init__(pc, init, currentHP)
+        super().__init__(getStatBlock(CombatantType.PLAYER, pc), init, currentHP, state)
         # Set values unique to a player character
-        self.level = pc['level']
-        self.playerClass = pc['class']
-        self.species = pc['species']
-        self.currentHP = self.maxHP
         self.deathSaves = [0, 0]
         # Override default values
-        self.maxHP = pc['hp']
-        self.proficiency = profByLevel(self.level)
+        self.maxHP = self.block.hp
 
     # Handles death saves either by inserted value or by rolling dice
     def deathSave(self, val, roll=True):
         if roll:
-            val = rollDice("d20")
+            val = rollDice("d20", hasAvg=False)
         if val >= 10:
-            self.deathSave[1] += 1
+            self.deathSaves[1] += 1
         else:
-            self.deathSave[0] += 1
+            self.deathSaves[0] += 1
 
 
 """
@@ -185,25 +1365,139 @@ Monster class is used for monster combatants in initiative
 Contains monster-specific stats like their Challenge Rating, XP gained, and legendary status
 """
 class Monster(Combatant):
-    def __init__(self, monst, init, currentHP, maxHP):
+    __slots__ = ("group",)
+
+    # HP left out (None) defaults to the average from the stat block
+    def __init__(self, monst, init, currentHP=None, maxHP=None, state=None):
+        # Group the monster belongs to, if any (set by MonsterGroup)
+        self.group = None
+        block = getStatBlock(CombatantType.MONSTER, monst)
+        maxHP = block.hp if maxHP is None else maxHP
         # Set all shared values through the super method
-        super().__init__(monst, init, currentHP)
-        # Set values unique to a monster
-        self.cr = monst["cr"]
-        self.xp = monst["xp"]
-        self.type = monst["type"]
-        self.actions = monst["actions"]
-        self.traits = monst["special_traits"]
-        self.legend = monst["legendary"]
-        self.lAct = monst["legendary_actions"]
-        self.lRes = monst["legendary_resistances"]
-        self.lair = monst["lair_actions"]
+        super().__init__(block, init, maxHP if currentHP is None else currentHP, state)
         # Override default values
         self.maxHP = maxHP
-        self.proficiency = profByLevel(self.cr)
+        self.refreshLegendary()
+        self.legendaryResistances = self.lRes
+
+    # Refills the monster's legendary actions (at the start of its turn)
+    def refreshLegendary(self):
+        self.legendaryActions = legendaryBudget if len(self.lAct) > 0 else 0
+
+    # Lets the monster's group know when a member goes down or gets back up
+    def setConscious(self, conscious):
+        super().setConscious(conscious)
+        if self.group is not None:
+            self.group.memberChanged()
 
     # Overrides default method to add xp to encounter when monster is defeated.
     def setCurrentHP(self, val):
-        super().setCurrentHP(val)
-        if self.conscious == False:
-            encounterXP += self.xp
+        wasConscious = self.conscious
+        with self.state.transaction("HP"):
+            super().setCurrentHP(val)
+            # Only award the xp the moment the monster goes down
+            if wasConscious and self.conscious == False:
+                awardXP(self.state, self.xp)
+
+
+"""
+MonsterGroup is a mob of identical monsters that takes one turn in initiative
+Every member shares the group's stat block and initiative, but has its own HP and conditions in
+    the encounter state, so damage and area effects still land on members one by one.
+The group is conscious while any member is.
+"""
+class MonsterGroup(Monster):
+    __slots__ = ("members",)
+
+    # currentHP and maxHP are either one value for every member or a sequence with one per member
+    def __init__(self, monst, init, currentHP, maxHP, count, state=None):
+        self.members = []
+        # The group's own row doesn't hold HP, its totals are read from the members
+        super().__init__(monst, init, 0, 0, state)
+        self.state.group[self.slot] = True
+        maxHP = np.broadcast_to(self.block.hp if maxHP is None else maxHP, count)
+        currentHP = maxHP if currentHP is None else np.broadcast_to(currentHP, count)
+        for i in range(count):
+            member = Monster(self.block, init, int(currentHP[i]), int(maxHP[i]), self.state)
+            member.name = f"{self.name} {i + 1}"
+            member.group = self
+            self.members.append(member)
+        self.memberChanged()
+
+    # Total HP of every member
+    @property
+    def currentHP(self):
+        return int(self.state.currentHP[self.memberSlots()].sum())
+
+    @currentHP.setter
+    def currentHP(self, value):
+        self.state.write("currentHP", self.slot, value)
+
+    @property
+    def maxHP(self):
+        return int(self.state.maxHP[self.memberSlots()].sum())
+
+    @maxHP.setter
+    def maxHP(self, value):
+        self.state.write("maxHP", self.slot, value)
+
+    # Total temp HP of every member
+    @property
+    def tempHP(self):
+        return int(self.state.tempHP[self.memberSlots()].sum())
+
+    @tempHP.setter
+    def tempHP(self, value):
+        self.state.write("tempHP", self.slot, value)
+
+    def memberSlots(self):
+        return self.state.slotsOf(self.members)
+
+    # Members still standing
+    def living(self):
+        return [m for m in self.members if m.conscious]
+
+    # Member that takes anything aimed at the group as a whole (the first one standing)
+    def front(self):
+        standing = self.living()
+        return standing[0] if len(standing) > 0 else self.members[0]
+
+    def memberChanged(self):
+        self.setConscious(bool(self.state.conscious[self.memberSlots()].any()))
+
+    # Moves the members along with the group
+    def attach(self, state):
+        super().attach(state)
+        for member in self.members:
+            member.attach(state)
+
+    # Changes the HP of one member (the first one standing unless another is given)
+    def setCurrentHP(self, val, member=None):
+        if member is None:
+            member = self.front()
+        member.setCurrentHP(val)
+
+    # Changes the temp HP of every standing member
+    def updateTempHP(self, val):
+        with self.state.transaction("Temp HP"):
+            for member in self.living():
+                member.updateTempHP(val)
+
+    # Gives every standing member the condition
+    def addCondition(self, cond, source=None):
+        with self.state.transaction("Condition"):
+            for member in self.living():
+                member.addCondition(cond, source)
+
+    # Takes the condition off every member
+    def removeCondition(self, cond, source=None):
+        with self.state.transaction("Condition"):
+            for member in self.members:
+                member.removeCondition(cond, source)
+
+    # Changes the initiative of the group and all its members
+    def updateInit(self, newInit):
+        with self.state.transaction("Initiative"):
+            for member in self.members:
+                member.updateInit(newInit)
+            super().updateInit(newInit)
@@ -0,0 +1,263 @@
+"""
+File: EffectScheduler.py
+Brief: Timed effects that end (or repeat) on their own as turns go by.
+Description: Effects like "frightened until the end of its next turn" or a one minute concentration spell are
+    held in a heap ordered the same way turns are taken: by round, then initiative key, then start or end of
+    the turn. When the turn moves on, every effect whose moment has passed is popped off the top of the heap
+    and its callback is run, so nothing has to be remembered by the DM or scanned each turn. Every change to
+    the heap is recorded in the combat log, so undoing a turn puts back the effects it fired.
+Author: Brandon Dennis
+Version: 0.0.0
+Last updated: 4/3/2025
+TODO:
+"""
+
+import math
+import heapq
+from contextlib import contextmanager, nullcontext
+from HelperFunctions import *
+
+"""
+Effect is a single scheduled callback
+anchor: Combatant whose turn the effect is timed against
+target: Combatant the effect changes (often the same as the anchor)
+callback: Function called with the effect when it fires
+repeat: True if the effect fires again every round until cancelled
+kind: What the effect does ("condition", "concentration", "legendary" or "lair"), so a saved effect can
+    be given its callback again, or "" for a callback that can't be rebuilt
+args: Values the callback works with (the condition and its source for "condition")
+"""
+class Effect:
+    __slots__ = ("anchor", "target", "phase", "callback", "label", "repeat", "kind", "args", "cancelled")
+
+    def __init__(self, anchor, target, phase, callback, label="", repeat=False, kind="", args=()):
+        self.anchor = anchor
+        self.target = target
+        self.phase = phase
+        self.callback = callback
+        self.label = label
+        self.repeat = repeat
+        self.kind = kind
+        self.args = args
+        self.cancelled = False
+
+    # Cancelled effects stay in the heap and are skipped when they reach the top
+    def cancel(self):
+        self.cancelled = True
+
+
+"""
+EffectScheduler keeps the timed effects of one encounter
+Heap entries are (round, initiative key, phase, serial, effect), which sort in the order turns are taken
+order: InitiativeOrder the effects are timed against
+"""
+class EffectScheduler:
+    def __init__(self, order):
+        self.order = order
+        self.heap = []
+        # Keeps effects scheduled for the same moment in the order they were added
+        self.serial = 0
+        # Functions called with the list of effects fired by each advance (for the tracker to refresh)
+        self.listeners = []
+        # Effect ending each caster's current concentration spell
+        self.concentrating = {}
+        # Combat log changes are recorded in (set by Encounter)
+        self.log = None
+        # Depth of nested change blocks
+        self.changing = 0
+        order.rekeyListeners.append(self.retime)
+
+    def __len__(self):
+        return sum(1 for entry in self.heap if not entry[4].cancelled)
+
+    # Copies the heap, which effects are cancelled and who is concentrating, for the combat log
+    def capture(self):
+        return (tuple(self.heap), tuple(entry[4].cancelled for entry in self.heap),
+                tuple(self.concentrating.items()), self.serial)
+
+    # Puts a captured heap back in place (on undo and redo)
+    def restore(self, snapshot):
+        heap, cancelled, concentrating, serial = snapshot
+        self.heap = list(heap)
+        for entry, flag in zip(heap, cancelled):
+            entry[4].cancelled = flag
+        self.concentrating = dict(concentrating)
+        self.serial = serial
+
+    # Records the changes made to the heap inside the block as one combat log event
+    # (only the outermost block records, since an undo of the inner one would land on a half made change)
+    @contextmanager
+    def change(self):
+        before = None
+        if self.changing == 0 and self.log is not None and self.log.tracking:
+            before = self.capture()
+        self.changing += 1
+        try:
+            yield
+        finally:
+            self.changing -= 1
+        if before is not None:
+            self.log.record(("effects", before, self.capture()))
+
+    # Groups the changes made inside the block into one combat log entry
+    def transaction(self, label):
+        if self.log is None:
+            return nullcontext()
+        return self.log.transaction(label)
+
+    # Moment the encounter is at: the start of the current combatant's turn
+    def now(self):
+        return (self.order.round, self.order.cursor, TurnPhase.START.value)
+
+    """
+    schedule adds an effect that fires at the start or end of a combatant's turn
+    anchor: Combatant whose turn the effect is timed against
+    callback: Function called with the effect when it fires
+    rounds: 1 fires the next time the moment comes up, 2 the time after that, and so on
+    phase: TurnPhase.START or TurnPhase.END of the anchor's turn
+    target: Combatant the effect is on (defaults to the anchor)
+    label: Text shown by the tracker
+    repeat: True if the effect fires every round until cancelled
+    kind, args: See Effect
+    Returns: The Effect, which can be cancelled (with cancel, so the combat log sees it)
+    """
+    def schedule(self, anchor, callback, rounds=1, phase=TurnPhase.END, target=None, label="", repeat=False,
+                 kind="", args=()):
+        effect = Effect(anchor, anchor if target is None else target, phase, callback, label, repeat, kind, args)
+        self.scheduleAt(self.keyFor(anchor), effect, rounds)
+        return effect
+
+    # Initiative key of the turn a combatant's effects are timed against (members of a group take the group's turn)
+    # Raises: KeyError if the combatant has no turn in the order
+    def keyFor(self, combatant):
+        turnTaker = combatant
+        if turnTaker not in self.order and getattr(turnTaker, "group", None) is not None:
+            turnTaker = turnTaker.group
+        if turnTaker not in self.order:
+            raise KeyError(f"{combatant.name} has no turn in the initiative order")
+        return self.order.keyOf[turnTaker]
+
+    # Places an effect at a point in the turn order given by an initiative key (see initiativeKey)
+    def scheduleAt(self, key, effect, rounds=1):
+        round = self.order.round
+        # Moments already reached this round come up next round
+        if self.order.cursor is not None and (round, key, effect.phase.value) <= self.now():
+            round += 1
+        self.push(round + rounds - 1, key, effect)
+
+    def push(self, round, key, effect):
+        with self.change():
+            self.serial += 1
+            heapq.heappush(self.heap, (round, key, effect.phase.value, self.serial, effect))
+
+    # Drops every effect (before a saved set is put back)
+    def reset(self):
+        with self.change():
+            self.heap = []
+            self.concentrating = {}
+
+    # Cancels an effect, recording it so an undo brings the effect back
+    def cancel(self, effect):
+        with self.change():
+            effect.cancel()
+
+    # Keeps effects timed against combatants who changed places in the order with them
+    def retime(self, moved):
+        self.heap = [(round, moved.get(key, key), phase, serial, effect) for round, key, phase, serial, effect in self.heap]
+        heapq.heapify(self.heap)
+
+    """
+    advance fires every effect whose moment has been reached
+    Called after the turn moves forward
+    Returns: The list of effects that fired
+    """
+    def advance(self):
+        if self.order.cursor is None:
+            return []
+        now = self.now()
+        fired = []
+        if len(self.heap) == 0 or self.heap[0][:3] > now:
+            return fired
+        with self.change():
+            while len(self.heap) > 0 and self.heap[0][:3] <= now:
+                round, key, _, _, effect = heapq.heappop(self.heap)
+                if effect.cancelled:
+                    continue
+                effect.callback(effect)
+                fired.append(effect)
+                if effect.repeat and not effect.cancelled:
+                    self.push(round + 1, key, effect)
+        if len(fired) > 0:
+            for listener in self.listeners:
+                listener(fired)
+        return fired
+
+    """
+    legendary gives a legendary monster its hooks: legendary actions refill at the start of its turn,
+        and lair actions come up on initiative count 20 (losing ties) every round
+    monster: Monster with legendary or lair actions
+    onLair: Function called with the effect when lair actions come up (for the tracker to prompt)
+    """
+    def legendary(self, monster, onLair=None):
+        if len(monster.lAct) > 0:
+            self.schedule(monster, lambda effect: effect.target.refreshLegendary(),
+                          1, TurnPhase.START, monster, "Legendary actions", True, "legendary")
+        if len(monster.lair) > 0:
+            effect = Effect(monster, monster, TurnPhase.START, onLair if onLair is not None else lambda effect: None,
+                            "Lair actions", True, "lair")
+            self.scheduleAt(initiativeKey(20), effect)
+
+    # Effects still waiting that are on (or timed against) the given combatant
+    def effectsOn(self, combatant):
+        return [entry[4] for entry in sorted(self.heap)
+                if not entry[4].cancelled and (entry[4].target is combatant or entry[4].anchor is combatant)]
+
+    # Cancels everything on or timed against a combatant (like when they leave the encounter)
+    def clear(self, combatant):
+        with self.change():
+            for effect in self.effectsOn(combatant):
+                effect.cancel()
+            self.concentrating.pop(combatant, None)
+
+    # Cancels the effect ending a caster's concentration and forgets it, returns the effect (or None)
+    def endConcentration(self, caster):
+        with self.change():
+            effect = self.concentrating.pop(caster, None)
+            if effect is not None:
+                effect.cancel()
+        return effect
+
+    """
+    condition gives a combatant a condition that ends on its own
+    target: Combatant gaining the condition
+    cond: Name of the condition
+    anchor: Combatant whose turn ends it (defaults to the target, as in "until the end of its next turn")
+    rounds, phase: See schedule
+    source: Optional cause of the condition, only this source is removed when the effect ends
+    Returns: The Effect that will remove the condition
+    """
+    def condition(self, target, cond, anchor=None, rounds=1, phase=TurnPhase.END, source=None):
+        # Fail before the condition goes on if the effect can't be timed
+        self.keyFor(anchor if anchor is not None else target)
+        with self.transaction("Condition"):
+            target.addCondition(cond, source)
+            return self.schedule(anchor if anchor is not None else target,
+                                 lambda effect: effect.target.removeCondition(cond, source),
+                                 rounds, phase, target, cond, kind="condition", args=(cond, source))
+
+    # Starts concentration on a spell lasting the given number of rounds (a minute is 10)
+    # onEnd replaces the default callback, which only clears the concentration flag
+    def concentrate(self, caster, rounds, label="", onEnd=None):
+        self.keyFor(caster)
+        with self.transaction("Concentration"), self.change():
+            caster.updateConcentrate(True)
+            if onEnd is None:
+                onEnd = lambda effect: effect.target.updateConcentrate(False)
+            effect = self.schedule(caster, onEnd, rounds, TurnPhase.START, caster, label, kind="concentration")
+            self.concentrating[caster] = effect
+        return effect
+
+
+# Key for a point in the turn order at the given initiative count, after every combatant tied with it
+def initiativeKey(count):
+    return (-count, math.inf, 0)
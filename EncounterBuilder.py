@@ -0,0 +1,153 @@
+"""
+File: EncounterBuilder.py
+Brief: Suggests groups of monsters that fit a party's XP budget.
+Description: The builder keeps a small index of the bestiary grouped by XP value, then runs a beam search
+    over XP values (not individual monsters) to find mixes whose adjusted XP lands in the requested
+    difficulty band. Because there are only a few dozen distinct XP values, the search costs the same
+    for a library of ten monsters or ten thousand. Monsters are picked from each XP group afterwards.
+Author: Brandon Dennis
+Version: 0.0.0
+Last updated: 4/3/2025
+TODO:
+"""
+
+from CoreClasses import *
+
+"""
+partyThreshold adds up the XP thresholds of every character in a party
+levels: List of character levels
+difficulty: Difficulty of the encounter
+Returns: The party's XP threshold for that difficulty
+"""
+def partyThreshold(levels, difficulty):
+    return sum(xpThresholds[level][difficulty.value] for level in levels)
+
+
+# Returns the levels of the given player characters
+def partyLevels(docIDs):
+    return [players.get(doc_id=i)["level"] for i in docIDs]
+
+
+"""
+EncounterBuilder searches the bestiary for monster groups that fit a difficulty
+table: Monster table to search
+Call refresh after monsters are added, edited or deleted
+"""
+class EncounterBuilder:
+    def __init__(self, table=monsters):
+        self.table = table
+        self.rows = None
+
+    # Drops the index so the next search reads the table again
+    def refresh(self):
+        self.rows = None
+
+    # Reads the fields the search needs from every monster once
+    def index(self):
+        if self.rows is None:
+            self.rows = [(doc.doc_id, doc["xp"], doc["type"], tuple(doc.get("environments", ())))
+                         for doc in self.table]
+        return self.rows
+
+    """
+    buckets groups matching monsters by XP value
+    types: Optional list of type names or types table doc_ids (what a monster's "type" field holds) to keep
+    environment: Optional environment name, only monsters listing it in "environments" are kept
+    Returns: A dictionary from XP value to the doc_ids of the monsters worth that much
+    """
+    def buckets(self, types=None, environment=None):
+        if types is not None:
+            # Monsters store the doc_id of their type, which counts from 1
+            ids = {name: doc.doc_id for name, doc in zip(catalog.names("types"), catalog.all("types"))}
+            types = {t if isinstance(t, int) else ids[t] for t in types}
+        groups = {}
+        for doc_id, xp, type, environments in self.index():
+            if xp <= 0:
+                continue
+            if types is not None and type not in types:
+                continue
+            if environment is not None and environment not in environments:
+                continue
+            groups.setdefault(xp, []).append(doc_id)
+        return groups
+
+    """
+    build searches for groups of monsters that match a difficulty
+    levels: List of party member levels (see partyLevels)
+    difficulty: Difficulty the encounter should reach
+    k: Number of suggestions to return
+    types, environment: Filters passed on to buckets
+    maxMonsters: Largest number of monsters in one suggestion
+    maxKinds: Largest number of different monsters in one suggestion
+    beamWidth: Number of partial groups kept at each step of the search
+    Returns: Up to k dictionaries with the raw xp, adjusted xp and a list of (doc_id, count) pairs,
+        closest to the middle of the difficulty band first
+    """
+    def build(self, levels, difficulty, k=5, types=None, environment=None, maxMonsters=8, maxKinds=3, beamWidth=200):
+        groups = self.buckets(types, environment)
+        low = partyThreshold(levels, difficulty)
+        if difficulty == Difficulty.DEADLY:
+            high = low * 3 // 2
+        else:
+            high = partyThreshold(levels, Difficulty(difficulty.value + 1))
+        target = (low + high) / 2
+        partySize = len(levels)
+        multipliers = [groupMultiplier(n, partySize) for n in range(maxMonsters + 1)]
+        values = sorted(xp for xp in groups.keys() if xp * multipliers[1] < high)
+        # A partial group is a sorted tuple of (xp, count) pairs
+        beam = [((), 0, 0)]
+        found = {}
+        for n in range(1, maxMonsters + 1):
+            children = {}
+            for kinds, raw, _ in beam:
+                for xp in values:
+                    adjusted = (raw + xp) * multipliers[n]
+                    # Adding monsters only ever raises the adjusted xp
+                    if adjusted >= high:
+                        break
+                    counts = dict(kinds)
+                    if xp not in counts and len(counts) == maxKinds:
+                        continue
+                    counts[xp] = counts.get(xp, 0) + 1
+                    key = tuple(sorted(counts.items()))
+                    if key not in children:
+                        children[key] = (key, raw + xp, adjusted)
+            for child in children.values():
+                if child[2] >= low:
+                    found[child[0]] = child
+            beam = sorted(children.values(), key=lambda c: abs(target - c[2]))[:beamWidth]
+            if len(beam) == 0:
+                break
+        # Prefer groups near the middle of the band, then smaller groups
+        best = sorted(found.values(), key=lambda c: (abs(target - c[2]), sum(n for _, n in c[0])))[:k]
+        results = []
+        for kinds, raw, adjusted in best:
+            picks = [(rd.choice(groups[xp]), count) for xp, count in kinds]
+            results.append({"xp": raw, "adjustedXP": adjusted, "monsters": picks})
+        return results
+
+
+"""
+suggestionEntries turns a suggestion from EncounterBuilder.build into entries for Encounter
+Party members (optional doc_ids) get their full HP, everyone starts at initiative 0
+    until Encounter.rollInitiative is called (suggestionEncounter does this)
+suggestion: One of the dictionaries returned by build
+party: Optional list of player doc_ids to add to the encounter
+hp: HitPointMethod the monsters get their hit points with
+Returns: A list of entries in the format Encounter expects
+"""
+def suggestionEntries(suggestion, party=(), hp=HitPointMethod.AVERAGE):
+    entries = []
+    for doc_id, count in suggestion["monsters"]:
+        entries.extend(monsterEntries(doc_id, count, hp))
+    for doc_id in party:
+        block = loadStatBlock(CombatantType.PLAYER, doc_id)
+        entries.append([False, block, 0, block.hp])
+    return entries
+
+
+# Builds an Encounter from a suggestion returned by EncounterBuilder.build and rolls initiative for everyone
+def suggestionEncounter(suggestion, party=(), hp=HitPointMethod.AVERAGE):
+    encounter = Encounter(suggestionEntries(suggestion, party, hp))
+    encounter.rollInitiative()
+    return encounter
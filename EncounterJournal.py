@@ -0,0 +1,348 @@
+"""
+File: EncounterJournal.py
+Brief: Keeps a running encounter saved to disk so it can be resumed after a crash.
+Description: The journal listens to an encounter's combat log and appends every entry to a file as one
+    line of JSON. Lines are written by a background thread that groups whatever arrives close together
+    into one write and one fsync, so the GUI thread never waits on the disk. Every so often (and after
+    undos, redos and combatants joining or leaving) a checkpoint holding the whole encounter replaces
+    the file, which keeps it small and means restoring only replays the entries after one checkpoint.
+Author: Brandon Dennis
+Version: 0.0.0
+Last updated: 4/3/2025
+TODO:
+"""
+
+import os
+import json
+import time
+import queue
+import threading
+from CoreClasses import *
+
+# Where the running encounter is saved unless told otherwise
+autosavePath = "Autosave/encounter.journal"
+
+"""
+EncounterJournal saves an encounter's changes to a file as they happen
+encounter: Encounter to save
+path: File the journal is written to
+checkpointEvery: Number of entries written before the file is replaced by a fresh checkpoint
+flushDelay: Seconds the writer waits to gather more lines before each fsync
+"""
+class EncounterJournal:
+    def __init__(self, encounter, path=autosavePath, checkpointEvery=200, flushDelay=0.05):
+        self.encounter = encounter
+        self.path = path
+        self.checkpointEvery = checkpointEvery
+        self.flushDelay = flushDelay
+        # Stable numbers for combatants, since their slots change when the roster does
+        self.ids = {}
+        self.nextID = 0
+        self.sinceCheckpoint = 0
+        # Lines waiting for the writer thread as (kind, text) pairs
+        self.pending = queue.Queue()
+        self.writer = threading.Thread(target=self.writeLoop, daemon=True)
+        folder = os.path.dirname(path)
+        if folder != "":
+            os.makedirs(folder, exist_ok=True)
+        self.checkpoint()
+        self.writer.start()
+        encounter.log.listeners.append(self.onChange)
+
+    # Number used for a combatant in the file
+    def idOf(self, combatant):
+        if combatant is None:
+            return None
+        if combatant not in self.ids:
+            self.ids[combatant] = self.nextID
+            self.nextID += 1
+        return self.ids[combatant]
+
+    # Called by the combat log for every new entry (events is None after undo, redo and roster changes)
+    # Changes to the effect scheduler hold callbacks that can't be written out, so they bring a checkpoint instead
+    def onChange(self, position, label, events):
+        if events is None or self.sinceCheckpoint >= self.checkpointEvery or any(e[0] == "effects" for e in events):
+            self.checkpoint()
+            return
+        record = {
+            "type": "entry",
+            "label": label,
+            "xp": self.encounter.xp,
+            "events": [self.encodeEvent(e) for e in events],
+        }
+        self.sinceCheckpoint += 1
+        self.pending.put(("append", json.dumps(record)))
+
+    # Queues a record of the whole encounter that replaces everything written before it
+    def checkpoint(self):
+        encounter = self.encounter
+        record = {
+            "type": "checkpoint",
+            "round": encounter.round,
+            "current": self.idOf(encounter.current),
+            "xp": encounter.xp,
+            "combatants": [self.describe(c) for c in encounter.combatants],
+            "effects": [self.describeEffect(entry) for entry in sorted(encounter.effects.heap)
+                        if not entry[4].cancelled and entry[4].kind != ""],
+        }
+        self.sinceCheckpoint = 0
+        self.pending.put(("checkpoint", json.dumps(record)))
+
+    # Everything needed to rebuild one combatant (and the members of a group)
+    def describe(self, c):
+        values = {
+            "id": self.idOf(c),
+            "monster": c.kind == CombatantType.MONSTER,
+            "index": c.index,
+            "name": c.name,
+            "notes": c.notes,
+            "init": c.init,
+            "tiebreak": c.order.keyOf[c][3] if c.order is not None else None,
+            "currentHP": c.currentHP,
+            "maxHP": c.maxHP,
+            "tempHP": c.tempHP,
+            "ac": c.ac,
+            "conscious": c.conscious,
+            "concentration": c.concentration,
+            "legendaryActions": c.legendaryActions,
+            "legendaryResistances": c.legendaryResistances,
+            "conditions": [[cond, self.encodeSources(c.sources[conditionBit(cond)])] for cond in c.conditions],
+            "deathSaves": list(c.deathSaves) if isinstance(c, Player) else None,
+        }
+        if isinstance(c, MonsterGroup):
+            values["members"] = [self.describe(m) for m in c.members]
+        return values
+
+    # Everything needed to put a timed effect back (its callback is rebuilt from its kind)
+    def describeEffect(self, entry):
+        round, key, phase, _, effect = entry
+        args = list(effect.args)
+        if effect.kind == "condition":
+            args[1] = self.encodeSources([args[1]])[0]
+        return {
+            "kind": effect.kind,
+            "anchor": self.idOf(effect.anchor),
+            "target": self.idOf(effect.target),
+            "round": round,
+            "key": list(key),
+            "phase": phase,
+            "label": effect.label,
+            "args": args,
+        }
+
+    # Swaps slots and combatant objects in an event for the ids used in the file
+    def encodeEvent(self, event):
+        state = self.encounter.state
+        match event[0]:
+            case "set":
+                _, column, slot, before, after = event
+                return ["set", column, self.idOf(state.owners[slot]), before, after]
+            case "setMany":
+                _, column, slots, before, after = event
+                ids = [self.idOf(c) for c in state.combatantsAt(slots)]
+                return ["setMany", column, ids, before.tolist(), after.tolist()]
+            case "init":
+                _, combatant, before, after = event
+                return ["init", self.idOf(combatant), before, after]
+            case "order":
+                _, before, after = event
+                return ["order", [[self.idOf(c), t] for c, t in before.items()],
+                        [[self.idOf(c), t] for c, t in after.items()]]
+            case "sources":
+                _, combatant, before, after = event
+                return ["sources", self.idOf(combatant),
+                        [[bit, self.encodeSources(s)] for bit, s in before],
+                        [[bit, self.encodeSources(s)] for bit, s in after]]
+            case "turn":
+                _, beforeCurrent, beforeRound, afterCurrent, afterRound = event
+                return ["turn", self.idOf(beforeCurrent), beforeRound, self.idOf(afterCurrent), afterRound]
+            case "xp":
+                return list(event)
+
+    # Condition sources that are combatants are saved by id, anything else (like a spell name) as it is
+    def encodeSources(self, sources):
+        return [{"id": self.idOf(s)} if isinstance(s, Combatant) else s for s in sources]
+
+    """
+    writeLoop runs on the writer thread
+    Waits for a line, gives others a moment to arrive, then writes them all with a single fsync
+    """
+    def writeLoop(self):
+        file = None
+        running = True
+        while running:
+            batch = [self.pending.get()]
+            time.sleep(self.flushDelay)
+            while True:
+                try:
+                    batch.append(self.pending.get_nowait())
+                except queue.Empty:
+                    break
+            # Only the newest checkpoint in the batch matters, the lines before it are replaced anyway
+            for i in range(len(batch) - 1, -1, -1):
+                if batch[i][0] == "checkpoint":
+                    if file is not None:
+                        file.close()
+                    file = self.replaceFile(batch[i][1])
+                    batch = batch[i + 1:]
+                    break
+            for kind, text in batch:
+                if kind is None:
+                    running = False
+                else:
+                    file.write(text + "\n")
+            file.flush()
+            os.fsync(file.fileno())
+        file.close()
+
+    # Writes a checkpoint to a temporary file and moves it over the journal so a crash can't leave it half written
+    def replaceFile(self, text):
+        temp = self.path + ".tmp"
+        with open(temp, "w") as file:
+            file.write(text + "\n")
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp, self.path)
+        return open(self.path, "a")
+
+    # Stops listening and waits for everything queued to reach the disk
+    def close(self):
+        if self.onChange in self.encounter.log.listeners:
+            self.encounter.log.listeners.remove(self.onChange)
+        self.pending.put((None, None))
+        self.writer.join()
+
+    # Closes the journal and deletes it (for an encounter that ended normally)
+    def finish(self):
+        self.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+"""
+restoreEncounter rebuilds an encounter from a journal
+Combatants are rebuilt from the stat blocks of their database entries, the last checkpoint is
+    put back in place and the entries written after it are replayed
+path: Journal file to read
+Returns: The restored Encounter, or None if there is nothing to restore
+"""
+def restoreEncounter(path=autosavePath):
+    if not os.path.exists(path):
+        return None
+    records = []
+    with open(path) as file:
+        for line in file:
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                # The last line may have been cut off by the crash
+                break
+    start = None
+    for i in range(len(records)):
+        if records[i]["type"] == "checkpoint":
+            start = i
+    if start is None:
+        return None
+    saved = records[start]
+    # Build the combatants in their saved turn order
+    entries = []
+    for c in saved["combatants"]:
+        kind = CombatantType.MONSTER if c["monster"] else CombatantType.PLAYER
+        entry = [c["monster"], loadStatBlock(kind, c["index"]), c["init"], c["currentHP"], c["maxHP"]]
+        if "members" in c:
+            entry[3:] = [c["members"][0]["currentHP"], c["members"][0]["maxHP"], len(c["members"])]
+        entries.append(entry)
+    encounter = Encounter(entries)
+    log = encounter.log
+    byID = {}
+    everyone = []
+    log.tracking = False
+    # Slots are handed out in the order the entries were given, which ties in initiative may not keep
+    built = sorted(encounter.combatants, key=lambda c: c.slot)
+    for c, values in zip(built, saved["combatants"]):
+        restoreValues(c, values, byID, everyone)
+    encounter.refreshNames()
+    # Put tied combatants back in the order they were in
+    encounter.order.rebuild({byID[c["id"]]: c["tiebreak"] for c in saved["combatants"] if c.get("tiebreak") is not None})
+    encounter.unrolled.clear()
+    # Conditions go on once every combatant exists, since a source can be another combatant
+    for values in everyone:
+        for cond, sources in values["conditions"]:
+            for source in decodeSources(sources, byID):
+                byID[values["id"]].addCondition(cond, source)
+    encounter.order.moveTo(byID.get(saved["current"]), saved["round"])
+    # Timed effects replace the hooks the new encounter scheduled for itself
+    if "effects" in saved:
+        encounter.effects.reset()
+        for values in saved["effects"]:
+            args = values["args"]
+            if values["kind"] == "condition":
+                args = (args[0], decodeSources([args[1]], byID)[0])
+            encounter.rearm(values["kind"], byID[values["anchor"]], byID[values["target"]], values["round"],
+                            tuple(values["key"]), TurnPhase(values["phase"]), values["label"], tuple(args))
+    xp = saved["xp"]
+    # Replay everything that happened after the checkpoint
+    for record in records[start + 1:]:
+        for event in record["events"]:
+            log.apply(decodeEvent(event, byID, encounter.state), True)
+        xp = record["xp"]
+    log.tracking = True
+    log.reset()
+    encounter.xp = xp
+    return encounter
+
+
+# Puts the saved values back on a rebuilt combatant (and the members of a group)
+def restoreValues(c, values, byID, everyone):
+    byID[values["id"]] = c
+    c.name = values["name"]
+    c.notes = values["notes"]
+    if "members" in values:
+        for member, memberValues in zip(c.members, values["members"]):
+            restoreValues(member, memberValues, byID, everyone)
+        return
+    everyone.append(values)
+    c.maxHP = values["maxHP"]
+    c.currentHP = values["currentHP"]
+    c.tempHP = values["tempHP"]
+    c.ac = values["ac"]
+    c.concentration = values["concentration"]
+    c.legendaryActions = values["legendaryActions"]
+    c.legendaryResistances = values["legendaryResistances"]
+    c.setConscious(values["conscious"])
+    if values["deathSaves"] is not None:
+        c.deathSaves = values["deathSaves"]
+
+
+# Swaps the ids in an event from the file back to slots and combatants
+def decodeEvent(event, byID, state):
+    match event[0]:
+        case "set":
+            _, column, id, before, after = event
+            return ("set", column, byID[id].slot, before, after)
+        case "setMany":
+            _, column, ids, before, after = event
+            slots = state.slotsOf([byID[id] for id in ids])
+            dtype = EncounterState.columns[column]
+            return ("setMany", column, slots, np.array(before, dtype=dtype), np.array(after, dtype=dtype))
+        case "init":
+            _, id, before, after = event
+            return ("init", byID[id], before, after)
+        case "order":
+            _, before, after = event
+            return ("order", {byID[id]: t for id, t in before}, {byID[id]: t for id, t in after})
+        case "sources":
+            _, id, before, after = event
+            return ("sources", byID[id],
+                    tuple((bit, decodeSources(s, byID)) for bit, s in before),
+                    tuple((bit, decodeSources(s, byID)) for bit, s in after))
+        case "turn":
+            _, beforeID, beforeRound, afterID, afterRound = event
+            return ("turn", byID.get(beforeID), beforeRound, byID.get(afterID), afterRound)
+        case "xp":
+            return tuple(event)
+
+
+# Turns saved condition sources back into combatants (or leaves them as they were saved)
+def decodeSources(sources, byID):
+    return tuple(byID.get(s["id"]) if isinstance(s, dict) else s for s in sources)
@@ -9,6 +9,6 @@ TODO:
 """
 
 # Used for expressions like dice rolling with unexpected characters
-class UnexpectedSyntax:
+class UnexpectedSyntax(Exception):
     "Unexpected syntax in expression."
     pass
@@ -12,6 +12,7 @@ TODO:
 
 from GUIHelperClasses import *
 from HelperFunctions import *
+from CoreClasses import invalidateStatBlock
 
 """
 dbView: Parent class for all of the database views. Sets a header, scrollable area for content,
@@ -20,14 +21,17 @@ Constructor builds the basic layout including setting background and creating sc
 Includes shells for methods like populating the scrollable area, adding, and editing data.
 """
 class dbView(QMainWindow):
+    # Columns the entries can be sorted by, each backed by a key computed once in populate
+    sortColumns = []
+
     def __init__(self):
         super().__init__()
+        # Interaction window most recently opened from this view
+        self.interact = None
         # Set default size, layout, and background image for the menu
         self.resize(800, 450)
         layout = QVBoxLayout()
-        background = QLabel()
-        background.setPixmap(QPixmap("images/background_medium.png"))
-        background.setScaledContents(True)
+        background = Background()
 
         # Defines the label indicating what database the user is in
         self.label = QLabel('Another Menu')
@@ -45,6 +49,19 @@ class dbView(QMainWindow):
         self.search.addWidget(self.searchSubmit, 1, 0)
         layout.addLayout(self.search)
 
+        # Entries currently listed, as (sort keys, widget) pairs kept for re-sorting
+        self.records = []
+        # Define the sorting controls for views that have sortable columns
+        self.sortBox = QComboBox()
+        self.sortBox.addItems(self.sortColumns)
+        self.sortBox.currentTextChanged.connect(lambda: self.sortRecords())
+        self.sortDesc = QCheckBox("Descending")
+        self.sortDesc.toggled.connect(lambda: self.sortRecords())
+        if len(self.sortColumns) > 0:
+            self.search.addWidget(QLabel("Sort by:"), 2, 0)
+            self.search.addWidget(self.sortBox, 2, 1)
+            self.search.addWidget(self.sortDesc, 2, 2)
+
         # Create the layout for the area and populate it with the appropriate data
         self.data = QVBoxLayout()
         self.populate()
@@ -76,21 +93,28 @@ class dbView(QMainWindow):
     def add(self):
         match self.__class__.__name__:
             case "monsterView":
-                self.interact = monsterInteract(Interactions.ADD, source=self)
+                self.openInteract(monsterInteract, Interactions.ADD)
             case "playerView":
-                self.interact = playerInteract(Interactions.ADD, source=self)
+                self.openInteract(playerInteract, Interactions.ADD)
             case "partyView":
-                self.interact = partyInteract(Interactions.ADD, source=self)
+                self.openInteract(partyInteract, Interactions.ADD)
             case "speciesView":
-                self.interact = speciesInteract(Interactions.ADD, source=self)
+                self.openInteract(speciesInteract, Interactions.ADD)
             case "classView":
-                self.interact = classInteract(Interactions.ADD, source=self)
+                self.openInteract(classInteract, Interactions.ADD)
             case "monsterTypeView":
-                self.interact = monsterTypeInteract(Interactions.ADD, source=self)
+                self.openInteract(monsterTypeInteract, Interactions.ADD)
             case "conditionView":
-                self.interact = conditionInteract(Interactions.ADD, source=self)
+                self.openInteract(conditionInteract, Interactions.ADD)
             case _:
-                self.interact = dbInteract(Interactions.ADD, source=self)
+                self.openInteract(dbInteract, Interactions.ADD)
+
+    # Shows an interaction window for this view, rebinding the last one if it can be reused
+    def openInteract(self, interactClass, type, target=None):
+        if self.interact is not None and self.interact.reusable and self.interact.__class__ is interactClass:
+            self.interact.bind(type, target)
+        else:
+            self.interact = interactClass(type, target, self)
         self.interact.setWindowModality(Qt.WindowModality.ApplicationModal)
         self.hide()
         self.interact.show()
@@ -103,6 +127,23 @@ class dbView(QMainWindow):
             dbEntry = QLabel(f"Tex Label {i}")
             self.data.addWidget(dbEntry)
 
+    # Adds an entry to the scrollable area and remembers its sort keys
+    def addRecord(self, keys, widget):
+        self.records.append((keys, widget))
+        self.data.addWidget(widget)
+
+    # Reorders the listed entries by the selected column using the stored keys
+    def sortRecords(self):
+        if len(self.sortColumns) == 0 or len(self.records) == 0:
+            return
+        column = self.sortBox.currentText()
+        self.records.sort(key=lambda record: record[0][column], reverse=self.sortDesc.isChecked())
+        # Move the existing widgets into the new order without rebuilding them
+        for keys, widget in self.records:
+            self.data.removeWidget(widget)
+        for keys, widget in self.records:
+            self.data.addWidget(widget)
+
     def searchCheck(self, target, criteria):
         if criteria == None:
             return True
@@ -112,6 +153,7 @@ class dbView(QMainWindow):
         return True
 
     def cleanData(self):
+        self.records = []
         while (self.data.itemAt(0) != None):
             w = self.data.itemAt(0).wid
             # If this is one of the main tables, clear mini views.
@@ -129,6 +171,8 @@ Constructor sets the window label and text labels.
 Overrides all the shell methods set up in the superclass.
 """
 class monsterView(dbView):
+    sortColumns = ["Name", "CR", "XP", "AC", "HP", "Type"]
+
     def __init__(self):
         super().__init__()
         self.setWindowTitle('Monster Database')
@@ -138,21 +182,22 @@ class monsterView(dbView):
     def populate(self, criteria=None):
         # Clear all previous data in the section
         self.cleanData()
-        # Go through all monsters in the database and generate a miniView widget
-        for m in monsters.all():
-            # Skip this iteration if the entry doesn't meet search criteria
-            if not self.searchCheck(m, criteria):
-                continue
+        # Only read the fields shown in the list, full documents are loaded by edit()
+        summaries = project(monsters, ["name", "cr", "xp", "size", "hp", "type", "ac"],
+                            lambda m: self.searchCheck(m, criteria))
+        # Go through all monster summaries and generate a miniView widget
+        for doc_id, (mName, mCR, mXP, mSize, mHP, mType, mAC) in summaries:
             # Create a list of HBoxLayouts to send to the miniView constructor
             rows = [QHBoxLayout() for i in range(3)]
             # Pull information from database and assign them to widgets
-            name = QPushButton(m['name'])
-            name.clicked.connect(lambda checked=True, m=m: self.edit(m))
-            cr = QLabel('Challenge Rating: ' + str(m['cr']))
-            size = QLabel(sizes.get(doc_id=m["size"])["size"])
-            maxHP = QLabel('Max HP: ' + readHP(m['hp']))
-            type = QLabel(types.get(doc_id=m["type"])["name"])
-            ac = QLabel('AC: ' + str(m['ac']))
+            name = QPushButton(mName)
+            name.clicked.connect(lambda checked=True, doc_id=doc_id: self.edit(doc_id))
+            typeName = catalog.get("types", mType)["name"]
+            cr = QLabel('Challenge Rating: ' + str(mCR))
+            size = QLabel(catalog.get("sizes", mSize)["size"])
+            maxHP = QLabel('Max HP: ' + readHP(mHP))
+            type = QLabel(typeName)
+            ac = QLabel('AC: ' + str(mAC))
             # Add widgets to the appropriate layouts
             rows[0].addWidget(name)
             rows[0].addWidget(cr)
@@ -160,15 +205,23 @@ class monsterView(dbView):
             rows[1].addWidget(maxHP)
             rows[2].addWidget(type)
             rows[2].addWidget(ac)
+            # Compute the sort keys once so re-sorting never goes back to the document
+            keys = {
+                "Name": mName.lower(),
+                "CR": mCR,
+                "XP": mXP,
+                "AC": mAC,
+                "HP": parseHP(mHP),
+                "Type": typeName.lower(),
+            }
             # Generate miniView and add to the scrollable area in dbView
-            monster = miniView(m.doc_id, rows)
-            self.data.addWidget(monster)
+            monster = miniView(doc_id, rows)
+            self.addRecord(keys, monster)
+        self.sortRecords()
 
-    def edit(self, target):
-        self.interact = monsterInteract(Interactions.EDIT, target, self)
-        self.interact.setWindowModality(Qt.WindowModality.ApplicationModal)
-        self.hide()
-        self.interact.show()
+    # Loads the full monster document only now that it's being opened
+    def edit(self, doc_id):
+        self.openInteract(monsterInteract, Interactions.EDIT, monsters.get(doc_id=doc_id))
 
 
 """
@@ -177,6 +230,8 @@ Constructor sets the window label and text labels.
 Overrides all the shell methods set up in the superclass.
 """
 class playerView(dbView):
+    sortColumns = ["Name", "Level", "Class", "Species"]
+
     def __init__(self):
         super().__init__()
         self.setWindowTitle('Player Character Database')
@@ -186,24 +241,25 @@ class playerView(dbView):
     def populate(self, criteria=None):
         # Clear all previous data in the section
         self.cleanData()
-        # Go through all player characters in the database and generate a miniView widget
-        for p in players.all():
-            # Skip this iteration if the entry doesn't meet search criteria
-            if not self.searchCheck(p, criteria):
-                continue
+        # Only read the fields shown in the list, full documents are loaded by edit()
+        summaries = project(players, ["name", "level", "species", "hp", "class", "ac"],
+                            lambda p: self.searchCheck(p, criteria))
+        # Go through all player summaries and generate a miniView widget
+        for doc_id, (pName, pLevel, pSpecies, pHP, pClass, pAC) in summaries:
             # Create a list of HBoxLayouts to send to the miniView constructor
             rows = [QHBoxLayout() for i in range(3)]
             # Pull information from database and assign them to widgets
-            name = QPushButton(p["name"])
-            name.clicked.connect(lambda checked=True, p=p: self.edit(p))
-            level = QLabel("Level: " + str(p["level"]))
-            spec = QLabel(species.get(doc_id=p["species"])["name"])
-            maxHP = QLabel("Max HP: " + str(p["hp"]))
+            name = QPushButton(pName)
+            name.clicked.connect(lambda checked=True, doc_id=doc_id: self.edit(doc_id))
+            level = QLabel("Level: " + str(pLevel))
+            specName = catalog.get("species", pSpecies)["name"]
+            spec = QLabel(specName)
+            maxHP = QLabel("Max HP: " + str(pHP))
             classStr = ""
-            for k, v in p["class"].items():
+            for k, v in pClass.items():
                 classStr += f"{k} {v},"
             pclass = QLabel(classStr[0: -1])
-            ac = QLabel("AC: " + str(p["ac"]))
+            ac = QLabel("AC: " + str(pAC))
             # Add widgets to the appropriate layouts
             rows[0].addWidget(name)
             rows[0].addWidget(level)
@@ -211,15 +267,21 @@ class playerView(dbView):
             rows[1].addWidget(maxHP)
             rows[2].addWidget(pclass)
             rows[2].addWidget(ac)
+            # Compute the sort keys once so re-sorting never goes back to the document
+            keys = {
+                "Name": pName.lower(),
+                "Level": pLevel,
+                "Class": classStr.lower(),
+                "Species": specName.lower(),
+            }
             # Generate miniView and add to the scrollable area in dbView
-            player = miniView(p.doc_id, rows)
-            self.data.addWidget(player)
+            player = miniView(doc_id, rows)
+            self.addRecord(keys, player)
+        self.sortRecords()
 
-    def edit(self, target):
-        self.interact = playerInteract(Interactions.EDIT, target, self)
-        self.interact.setWindowModality(Qt.WindowModality.ApplicationModal)
-        self.hide()
-        self.interact.show()
+    # Loads the full player document only now that it's being opened
+    def edit(self, doc_id):
+        self.openInteract(playerInteract, Interactions.EDIT, players.get(doc_id=doc_id))
 
 
 """
@@ -238,10 +300,7 @@ class partyView(dbView):
         super().populate()
 
     def edit(self, target):
-        self.interact = partyInteract(Interactions.EDIT, target, self)
-        self.interact.setWindowModality(Qt.WindowModality.ApplicationModal)
-        self.hide()
-        self.interact.show()
+        self.openInteract(partyInteract, Interactions.EDIT, target)
 
 
 """
@@ -284,10 +343,7 @@ class speciesView(dbView):
             self.data.addWidget(species_entry)
 
     def edit(self, target):
-        self.interact = speciesInteract(Interactions.EDIT, target, self)
-        self.interact.setWindowModality(Qt.WindowModality.ApplicationModal)
-        self.hide()
-        self.interact.show()
+        self.openInteract(speciesInteract, Interactions.EDIT, target)
 
 
 """
@@ -326,10 +382,7 @@ class classView(dbView):
             self.data.addWidget(pclass)
 
     def edit(self, target):
-        self.interact = classInteract(Interactions.EDIT, target, self)
-        self.interact.setWindowModality(Qt.WindowModality.ApplicationModal)
-        self.hide()
-        self.interact.show()
+        self.openInteract(classInteract, Interactions.EDIT, target)
 
 
 """
@@ -371,10 +424,7 @@ class monsterTypeView(dbView):
             self.data.addWidget(pclass)
 
     def edit(self, target):
-        self.interact = monsterTypeInteract(Interactions.EDIT, target, self)
-        self.interact.setWindowModality(Qt.WindowModality.ApplicationModal)
-        self.hide()
-        self.interact.show()
+        self.openInteract(monsterTypeInteract, Interactions.EDIT, target)
 
 
 """
@@ -422,10 +472,7 @@ class conditionView(dbView):
             self.data.addWidget(species_entry)
 
     def edit(self, target):
-        self.interact = conditionInteract(Interactions.EDIT, target, self)
-        self.interact.setWindowModality(Qt.WindowModality.ApplicationModal)
-        self.hide()
-        self.interact.show()
+        self.openInteract(conditionInteract, Interactions.EDIT, target)
 
 
 """
@@ -433,47 +480,43 @@ dbInteract: A base template for database interactions like adding, editing, and
 Defines general purpose functionalities like a name field and button interactions.
 """
 class dbInteract(QMainWindow):
+    # Reusable editors are hidden and rebound with bind() instead of being rebuilt on every open
+    reusable = False
+
     def __init__(self, type, target=None, source=None):
         super().__init__()
         # Set default size, layout, and background image for the menu
         self.type = type
         self.resize(800, 450)
         self.layout = QGridLayout()
-        background = QLabel()
-        background.setPixmap(QPixmap("images/background_medium.png"))
-        background.setScaledContents(True)
+        background = Background()
 
         # Set the target object of the interaction and the data source
         self.target = target
         self.source = source
 
         # Set window title based on object type
-        subject = ""
+        self.subject = ""
         match self.__class__.__name__:
             case "monsterInteract":
-                subject = "Monster"
+                self.subject = "Monster"
             case "playerInteract":
-                subject = "Player Character"
+                self.subject = "Player Character"
             case "partyInteract":
-                subject = "Party"
+                self.subject = "Party"
             case "speciesInteract":
-                subject = "Species"
+                self.subject = "Species"
             case "classInteract":
-                subject = "Player Class"
+                self.subject = "Player Class"
             case "monsterTypeInteract":
-                subject = "Monster Type"
+                self.subject = "Monster Type"
             case "conditionInteract":
-                subject = "Condition"
-        match type:
-            case Interactions.ADD:
-                self.setWindowTitle(f"Add New {subject}")
-            case Interactions.EDIT:
-                self.setWindowTitle(f"Edit {subject}")
+                self.subject = "Condition"
 
         # Create a section for the name to be entered
         self.head = QGridLayout()
         self.name = QLineEdit()
-        self.name.setPlaceholderText(f"{subject} Name")
+        self.name.setPlaceholderText(f"{self.subject} Name")
         self.head.addWidget(self.name, 0, 0, 2, 1)
         self.layout.addLayout(self.head, 0, 0)
 
@@ -482,31 +525,43 @@ class dbInteract(QMainWindow):
         self.layout.addLayout(self.mid, 1, 0)
 
         self.foot = QGridLayout()
-        # Properly label the confirmation button depending on the requested action.
-        match type:
-            case Interactions.ADD:
-                cLabel = "Add Entry"
-            case Interactions.EDIT:
-                cLabel = "Save Changes"
-            case _:
-                # Set a default label for undefined types
-                cLabel = "Undefined"
-        self.confirm = QPushButton(cLabel)
+        self.confirm = QPushButton()
         self.confirm.clicked.connect(self.confirmAction)
-        # If the item is being edited, add a button for deleting the entry.
         cancel = QPushButton("Cancel")
         cancel.clicked.connect(self.destruct)
         self.foot.addWidget(self.confirm, 0, 0)
         self.foot.addWidget(cancel, 0, 1)
-        if type == Interactions.EDIT:
-            self.name.setText(target["name"])
-            self.delete = QPushButton("Delete")
-            self.delete.clicked.connect(lambda: self.deleteAction(subject, self.target))
-            self.foot.addWidget(self.delete, 1, 1)
+        # Button for deleting the entry, only shown when an item is being edited.
+        self.delete = QPushButton("Delete")
+        self.delete.clicked.connect(lambda: self.deleteAction(self.subject, self.target))
+        self.foot.addWidget(self.delete, 1, 1)
         self.layout.addLayout(self.foot, 2, 0)
 
         background.setLayout(self.layout)
         self.setCentralWidget(background)
+        self.bindHeader(type, target)
+
+    # Points the window at a new interaction type and target, updating the title and buttons
+    def bindHeader(self, type, target=None):
+        self.type = type
+        self.target = target
+        match type:
+            case Interactions.ADD:
+                self.setWindowTitle(f"Add New {self.subject}")
+            case Interactions.EDIT:
+                self.setWindowTitle(f"Edit {self.subject}")
+        # Properly label the confirmation button depending on the requested action.
+        match type:
+            case Interactions.ADD:
+                cLabel = "Add Entry"
+            case Interactions.EDIT:
+                cLabel = "Save Changes"
+            case _:
+                # Set a default label for undefined types
+                cLabel = "Undefined"
+        self.confirm.setText(cLabel)
+        self.delete.setVisible(type == Interactions.EDIT)
+        self.name.setText(target["name"] if type == Interactions.EDIT else "")
 
     def confirmAction(self):
         print(f"CONFIRM {self.type}")
@@ -518,8 +573,10 @@ class dbInteract(QMainWindow):
             match self.__class__.__name__:
                 case "monsterInteract":
                     monsters.remove(doc_ids=[self.target.doc_id])
+                    invalidateStatBlock(CombatantType.MONSTER, self.target.doc_id)
                 case "playerInteract":
                     players.remove(doc_ids=[self.target.doc_id])
+                    invalidateStatBlock(CombatantType.PLAYER, self.target.doc_id)
                 case "partyInteract":
                     parties.remove(doc_ids=[self.target.doc_id])
                 case "speciesInteract":
@@ -530,14 +587,20 @@ class dbInteract(QMainWindow):
                     types.remove(doc_ids=[self.target.doc_id])
                 case "conditionInteract":
                     conditions.remove(doc_ids=[self.target.doc_id])
+            catalog.refresh()
             self.destruct()
 
     def destruct(self):
-        self.setParent(None)
-        cleanWidget(self)
+        # Reusable editors are only hidden so the next open can rebind them
+        if self.reusable:
+            self.hide()
+        else:
+            self.setParent(None)
+            cleanWidget(self)
         self.source.populate()
         self.source.show()
-        self.close()
+        if not self.reusable:
+            self.close()
 
 
 """
@@ -547,6 +610,8 @@ Constructor sets additional fields for data entry/deletion
 Defines data entry, edit, and deletion methods.
 """
 class monsterInteract(dbInteract):
+    reusable = True
+
     def __init__(self, type, target=None, source=None):
         super().__init__(type, target, source)
         self.resize(1400, 1100)
@@ -555,6 +620,8 @@ class monsterInteract(dbInteract):
         # Add hp, ac, alignment, and initiative to the head layout
         self.maxHP = QPushButton("Enter HP")
         self.maxHP.clicked.connect(self.hitpointPopup)
+        # Structured hit points set by the hit point dialog (see makeHP), None until entered
+        self.hitPoints = None
         self.ac = QSpinBox(value=10)
         self.align = QComboBox()
         self.align.addItems(alignments)
@@ -569,15 +636,10 @@ class monsterInteract(dbInteract):
         self.head.addWidget(self.init, 1, 5)
 
         # Define and fill the layout with creature type, size, cr, and xp
+        # (type and size options are filled from the catalog on every reset)
         self.typeLayout = QHBoxLayout()
-        self.monType = QComboBox()\
-        # Pull data from reference tables to fill out monster types
-        for t in types.all():
-            self.monType.addItem(t["name"])
+        self.monType = QComboBox()
         self.monSize = QComboBox()
-        # Pull data from reference tables to fill out monster sizes
-        for s in sizes.all():
-            self.monSize.addItem(s["size"])
         self.cr = QDoubleSpinBox(decimals=2, singleStep=0.25)
         self.xp = QSpinBox(value=0)
         self.typeLayout.addWidget(QLabel("Monster Type: "))
@@ -601,14 +663,14 @@ class monsterInteract(dbInteract):
             self.statLayout.addWidget(self.statInputs[count], 0, 2 * count + 1)
             count += 1
         # Create a button group with all stats for saving throws
-        savesGroup = QButtonGroup(self)
-        savesGroup.setExclusive(False)
-        savesGroup.buttonToggled.connect(self.onToggle)
+        self.savesGroup = QButtonGroup(self)
+        self.savesGroup.setExclusive(False)
+        self.savesGroup.buttonToggled.connect(self.onToggle)
         count = 0
         for s in statDict.keys():
             checkBox = QCheckBox(s + " Save")
             self.statLayout.addWidget(checkBox, 1, 2 * count, 2, 1)
-            savesGroup.addButton(checkBox, statDict[s])
+            self.savesGroup.addButton(checkBox, statDict[s])
             count += 1
         # Add the layout to the main mid layout
         self.mid.addLayout(self.statLayout)
@@ -618,10 +680,10 @@ class monsterInteract(dbInteract):
         # Create a dropdown box for every skill and add it to the layout
         count = 0
         self.skillInputs = []
-        for sk in skills.all():
+        for sk in catalog.names("skills"):
             self.skillInputs.append(QComboBox())
             self.skillInputs[count].addItems(profDict.keys())
-            self.skillLayout.addWidget(QLabel(sk["skill"]), count, 0)
+            self.skillLayout.addWidget(QLabel(sk), count, 0)
             self.skillLayout.addWidget(self.skillInputs[count], count, 1)
             count += 1
         # Create and add entries for legendary tags and legendary resistances
@@ -633,15 +695,14 @@ class monsterInteract(dbInteract):
 
         # Define and fill the layout containing resistances and actions
         self.actionLayout = QVBoxLayout()
+        # Damage dialog shared by every action in this editor
+        self.damageEditor = damageDialog()
 
         self.actionLayout.addWidget(QLabel("Monster Actions"))
         # Define a list to track all actions
-        self.actionList = [actionView()]
+        self.actionList = []
         # Create a backdrop for the scrollable area
         self.actionBackdrop = QVBoxLayout()
-        if type != Interactions.EDIT:
-            self.actionList.append(actionView())
-            self.actionBackdrop.addWidget(self.actionList[0])
         self.actionEffectArea = Color("#F1E9D2")
         self.actionEffectArea.setLayout(self.actionBackdrop)
         # Define the scrollable area for monster actions
@@ -730,9 +791,9 @@ class monsterInteract(dbInteract):
         self.speedLayout.addWidget(QLabel("Senses"), countSp + 2, 0, 1, 2)
         countSe = 0
         self.senseInputs = []
-        for se in senses.all():
+        for se in catalog.names("senses"):
             self.senseInputs.append(QSpinBox())
-            self.speedLayout.addWidget(QLabel(se["sense"]), countSe + countSp + 3, 0)
+            self.speedLayout.addWidget(QLabel(se), countSe + countSp + 3, 0)
             self.speedLayout.addWidget(self.senseInputs[countSe], countSe + countSp + 3, 1)
             countSe += 1
 
@@ -755,57 +816,113 @@ class monsterInteract(dbInteract):
         # Add body layout to the form
         self.mid.addLayout(self.bodyLayout)
 
-        # Add previously saved data if this is an edit
+        # Popup for hit points, built now and reloaded each time it is opened
+        self.hpEditor = hitpointDialog(self)
+
+        self.reset()
         if type == Interactions.EDIT:
-            # Handle all numerical or text values
-            self.cr.setValue(target["cr"])
-            self.xp.setValue(target["xp"])
-            self.maxHP.setText(target["hp"])
-            self.ac.setValue(target["ac"])
-            self.init.setValue(target["initiative"])
-            self.notes.setPlainText(target["notes"])
-            # Handle legendary markers
-            if target["legendary"]:
-                self.legend.setChecked(True)
-                self.legend_res.setValue(target["legendary_resistances"])
-            # Prefill dropdown menus that aren't in groups
-            self.monSize.setCurrentIndex(target["size"] - 1)
-            self.monType.setCurrentIndex(target["type"] - 1)
-            self.align.setCurrentText(target["alignment"])
-            # Prefill stat list and saves
-            for st in range(6):
-                self.statInputs[st].setValue(target["ability_scores"][st])
-                if target["saves"][st] == 1:
-                    savesGroup.button(st).setChecked(True)
-                    self.saves[st] = 1
-            # Prefill all other grouped categories
-            # Speeds
-            for i in range(len(target["speed"])):
-                self.speedInputs[i].setValue(target["speed"][i])
-            # Senses
-            for i in range(len(target["senses"])):
-                self.senseInputs[i].setValue(target["senses"][i])
-            # Skills
-            for i in range(len(target["skills"])):
-                profInv = {val: key for key, val in profDict.items()}
-                self.skillInputs[i].setCurrentText(profInv[target["skills"][i]])
-            # Damage Types
-            for i in range(len(target["damage_types"])):
-                damageInv = {val: key for key, val in damageDict.items()}
-                self.damageInputs[i].setCurrentText(damageInv[target["damage_types"][i]])
-            # Preload actions and traits
-            # Actions
-            for name, data in target["actions"].items():
-                self.addElement(ActionType.ACTION, name, data)
-            # Traits
-            for name, data in target["special_traits"].items():
-                self.addElement(ActionType.TRAIT, name, data)
-            # Legendary Actions
-            for name, data in target["legendary_actions"].items():
-                self.addElement(ActionType.LEG_ACTION, name, data)
-            # Lair Actions
-            for name, data in target["lair_actions"].items():
-                self.addElement(ActionType.LAIR_ACTION, name, data)
+            self.prefill(target)
+
+    # Rebinds the pre-built form to a new interaction, clearing out the previous entry
+    def bind(self, type, target=None):
+        self.bindHeader(type, target)
+        self.reset()
+        if type == Interactions.EDIT:
+            self.prefill(target)
+
+    # Returns every form field to its default value and removes old actions and traits
+    def reset(self):
+        self.maxHP.setText("Enter HP")
+        self.hitPoints = None
+        self.ac.setValue(10)
+        self.align.setCurrentIndex(0)
+        self.init.setValue(0)
+        self.cr.setValue(0)
+        self.xp.setValue(0)
+        self.notes.clear()
+        # Refill the dropdowns backed by editable tables in case they changed
+        self.monType.clear()
+        self.monType.addItems(catalog.names("types"))
+        self.monSize.clear()
+        self.monSize.addItems(catalog.names("sizes"))
+        # Unchecking the save boxes clears the saves list through onToggle
+        for st in range(6):
+            self.statInputs[st].setValue(10)
+            self.savesGroup.button(st).setChecked(False)
+        self.saves = [0 for i in range(6)]
+        for skill in self.skillInputs:
+            skill.setCurrentIndex(0)
+        # A lone radio button can only be unchecked while it isn't auto-exclusive
+        self.legend.setAutoExclusive(False)
+        self.legend.setChecked(False)
+        self.legend.setAutoExclusive(True)
+        self.legend_res.setValue(0)
+        for i in range(len(self.speedInputs)):
+            self.speedInputs[i].setValue(30 if i == 0 else 0)
+        for sense in self.senseInputs:
+            sense.setValue(0)
+        for damage in self.damageInputs:
+            damage.setCurrentIndex(0)
+        # Remove the action and trait entries from the last open
+        for elements in [self.actionList, self.traitList, self.lActionList, self.lairActions]:
+            for element in elements:
+                element.setParent(None)
+                element.destruct()
+            elements.clear()
+        # New monsters start with one blank action to fill in
+        if self.type != Interactions.EDIT:
+            self.addElement(ActionType.ACTION)
+
+    # Fills the form with previously saved data for an edit
+    def prefill(self, target):
+        # Handle all numerical or text values
+        self.cr.setValue(target["cr"])
+        self.xp.setValue(target["xp"])
+        self.hitPoints = hitPoints(target["hp"])
+        self.maxHP.setText(readHP(self.hitPoints))
+        self.ac.setValue(target["ac"])
+        self.init.setValue(target["initiative"])
+        self.notes.setPlainText(target["notes"])
+        # Handle legendary markers
+        if target["legendary"]:
+            self.legend.setChecked(True)
+            self.legend_res.setValue(target["legendary_resistances"])
+        # Prefill dropdown menus that aren't in groups
+        self.monSize.setCurrentIndex(target["size"] - 1)
+        self.monType.setCurrentIndex(target["type"] - 1)
+        self.align.setCurrentText(target["alignment"])
+        # Prefill stat list and saves
+        for st in range(6):
+            self.statInputs[st].setValue(target["ability_scores"][st])
+            if target["saves"][st] == 1:
+                self.savesGroup.button(st).setChecked(True)
+                self.saves[st] = 1
+        # Prefill all other grouped categories
+        # Speeds
+        for i in range(len(target["speed"])):
+            self.speedInputs[i].setValue(target["speed"][i])
+        # Senses
+        for i in range(len(target["senses"])):
+            self.senseInputs[i].setValue(target["senses"][i])
+        # Skills
+        for i in range(len(target["skills"])):
+            self.skillInputs[i].setCurrentText(profInv[target["skills"][i]])
+        # Damage Types
+        for i in range(len(target["damage_types"])):
+            self.damageInputs[i].setCurrentText(damageInv[target["damage_types"][i]])
+        # Preload actions and traits
+        # Actions
+        for name, data in target["actions"].items():
+            self.addElement(ActionType.ACTION, name, data)
+        # Traits
+        for name, data in target["special_traits"].items():
+            self.addElement(ActionType.TRAIT, name, data)
+        # Legendary Actions
+        for name, data in target["legendary_actions"].items():
+            self.addElement(ActionType.LEG_ACTION, name, data)
+        # Lair Actions
+        for name, data in target["lair_actions"].items():
+            self.addElement(ActionType.LAIR_ACTION, name, data)
 
     def onToggle(self, button, checked):
         # Add to the saves list if checked, remove if unchecked.
@@ -817,7 +934,7 @@ class monsterInteract(dbInteract):
     def addElement(self, type, name=None, data=None):
         match type:
             case ActionType.ACTION:
-                element = actionView(name=name, preload=data)
+                element = actionView(name=name, preload=data, dialog=self.damageEditor)
                 self.actionList.append(element)
                 self.actionBackdrop.addWidget(element)
             case ActionType.TRAIT:
@@ -834,7 +951,8 @@ class monsterInteract(dbInteract):
                 self.lairBackdrop.addWidget(element)
 
     def hitpointPopup(self):
-        hitpointDialog(self).exec()
+        self.hpEditor.bind()
+        self.hpEditor.exec()
 
     def confirmAction(self):
         speeds = [0 for i in range(5)]
@@ -894,7 +1012,7 @@ class monsterInteract(dbInteract):
                         "name": self.name.text(),
                         "cr": self.cr.value(),
                         "xp": self.xp.value(),
-                        "hp": self.maxHP.text(),
+                        "hp": self.hitPoints if self.hitPoints is not None else makeHP(0, 4, 0),
                         "ac": self.ac.value(),
                         "size": self.monSize.currentIndex() + 1,
                         "alignment": self.align.currentText(),
@@ -922,7 +1040,7 @@ class monsterInteract(dbInteract):
                             "name": self.name.text(),
                             "cr": self.cr.value(),
                             "xp": self.xp.value(),
-                            "hp": self.maxHP.text(),
+                            "hp": self.hitPoints if self.hitPoints is not None else makeHP(0, 4, 0),
                             "ac": self.ac.value(),
                             "size": self.monSize.currentIndex() + 1,
                             "alignment": self.align.currentText(),
@@ -945,8 +1063,8 @@ class monsterInteract(dbInteract):
                         doc_id=self.target.doc_id,
                     )
                 )
-        self.source.populate()
-        self.source.show()
+                # Combatants built from now on should use the edited stats
+                invalidateStatBlock(CombatantType.MONSTER, self.target.doc_id)
         self.destruct()
 
 
@@ -957,6 +1075,8 @@ Constructor sets additional fields for data entry/deletion
 Defines data entry, edit, and deletion methods.
 """
 class playerInteract(dbInteract):
+    reusable = True
+
     def __init__(self, type, target=None, source=None):
         super().__init__(type, target, source)
         self.resize(1400, 1100)
@@ -979,18 +1099,13 @@ class playerInteract(dbInteract):
         self.head.addWidget(self.init, 1, 5)
 
         # Define and fill the layout with creature type, sepcies, size, and level
+        # (size and species options are filled from the catalog on every reset)
         self.typeLayout = QHBoxLayout()
         self.charClass = QPushButton("Enter Class")
         self.charClass.clicked.connect(self.classPopup)
         self.charSize = QComboBox()
         self.charSpec = QComboBox()
         self.classDict = {}
-        # Pull data from reference tables to fill out pc sizes
-        for s in sizes.all():
-            self.charSize.addItem(s["size"])
-        # Pull data from reference tables to fill out pc species
-        for s in species.all():
-            self.charSpec.addItem(s["name"])
         self.level = QSpinBox(value=0)
         self.typeLayout.addWidget(QLabel("Class(es): "))
         self.typeLayout.addWidget(self.charClass)
@@ -1014,14 +1129,14 @@ class playerInteract(dbInteract):
             self.statLayout.addWidget(self.statInputs[count], 0, 2 * count + 1)
             count += 1
         # Create a button group with all stats for saving throws
-        savesGroup = QButtonGroup(self)
-        savesGroup.setExclusive(False)
-        savesGroup.buttonToggled.connect(self.onToggle)
+        self.savesGroup = QButtonGroup(self)
+        self.savesGroup.setExclusive(False)
+        self.savesGroup.buttonToggled.connect(self.onToggle)
         count = 0
         for s in statDict.keys():
             checkBox = QCheckBox(s + " Save")
             self.statLayout.addWidget(checkBox, 1, 2 * count, 2, 1)
-            savesGroup.addButton(checkBox, statDict[s])
+            self.savesGroup.addButton(checkBox, statDict[s])
             count += 1
         # Add the layout to the main mid layout
         self.mid.addLayout(self.statLayout)
@@ -1031,10 +1146,10 @@ class playerInteract(dbInteract):
         # Create a dropdown box for every skill and add it to the layout
         count = 0
         self.skillInputs = []
-        for sk in skills.all():
+        for sk in catalog.names("skills"):
             self.skillInputs.append(QComboBox())
             self.skillInputs[count].addItems(profDict.keys())
-            self.skillLayout.addWidget(QLabel(sk["skill"]), count, 0)
+            self.skillLayout.addWidget(QLabel(sk), count, 0)
             self.skillLayout.addWidget(self.skillInputs[count], count, 1)
             count += 1
         # Create and add entries for legendary tags and legendary resistances
@@ -1075,9 +1190,9 @@ class playerInteract(dbInteract):
         self.speedLayout.addWidget(QLabel("Senses"), countSp + 2, 0, 1, 2)
         countSe = 0
         self.senseInputs = []
-        for se in senses.all():
+        for se in catalog.names("senses"):
             self.senseInputs.append(QSpinBox())
-            self.speedLayout.addWidget(QLabel(se["sense"]), countSe + countSp + 3, 0)
+            self.speedLayout.addWidget(QLabel(se), countSe + countSp + 3, 0)
             self.speedLayout.addWidget(self.senseInputs[countSe], countSe + countSp + 3, 1)
             countSe += 1
 
@@ -1090,49 +1205,95 @@ class playerInteract(dbInteract):
         # Add body layout to the form
         self.mid.addLayout(self.bodyLayout)
 
-        # Add previously saved data if this is an edit
+        # Popup for class levels, built now and reloaded each time it is opened
+        self.classEditor = classDialog(self)
+
+        self.reset()
         if type == Interactions.EDIT:
-            self.inPary = target["inparty"]
-            # Handle all numerical or text values
-            self.level.setValue(target["level"])
-            self.maxHP.setValue(target["hp"])
-            self.ac.setValue(target["ac"])
-            self.init.setValue(target["initiative"])
-            self.notes.setPlainText(target["notes"])
-            # Handle true/false markers
-            if target["jack_of_trades"]:
-                self.jackOfTrades.setChecked(True)
-            # Prefill dropdown menus that aren't in groups
-            self.charSize.setCurrentIndex(target["size"] - 1)
-            self.charSpec.setCurrentIndex(target["species"] - 1)
-            self.align.setCurrentText(target["alignment"])
-            # Prefill stat list and saves
-            for st in range(6):
-                self.statInputs[st].setValue(target["ability_scores"][st])
-                if target["saves"][st] == 1:
-                    savesGroup.button(st).setChecked(True)
-                    self.saves[st] = 1
-            # Prefill Character Classes
-            classStr = ""
-            for k, v in target["class"].items():
-                self.classDict[k] = v
-                classStr += f"{k} {v}, "
-            self.charClass.setText(classStr[0: -2])
-            # Prefill all other grouped categories
-            # Speeds
-            for i in range(len(target["speed"])):
-                self.speedInputs[i].setValue(target["speed"][i])
-            # Senses
-            for i in range(len(target["senses"])):
-                self.senseInputs[i].setValue(target["senses"][i])
-            # Skills
-            for i in range(len(target["skills"])):
-                profInv = {val: key for key, val in profDict.items()}
-                self.skillInputs[i].setCurrentText(profInv[target["skills"][i]])
-            # Damage Types
-            for i in range(len(target["damage_types"])):
-                damageInv = {val: key for key, val in damageDict.items()}
-                self.damageInputs[i].setCurrentText(damageInv[target["damage_types"][i]])
+            self.prefill(target)
+
+    # Rebinds the pre-built form to a new interaction, clearing out the previous entry
+    def bind(self, type, target=None):
+        self.bindHeader(type, target)
+        self.reset()
+        if type == Interactions.EDIT:
+            self.prefill(target)
+
+    # Returns every form field to its default value
+    def reset(self):
+        self.inPary = []
+        self.classDict = {}
+        self.charClass.setText("Enter Class")
+        self.level.setValue(0)
+        self.maxHP.setValue(0)
+        self.ac.setValue(10)
+        self.align.setCurrentIndex(0)
+        self.init.setValue(0)
+        self.notes.clear()
+        # Refill the dropdowns backed by editable tables in case they changed
+        self.charSize.clear()
+        self.charSize.addItems(catalog.names("sizes"))
+        self.charSpec.clear()
+        self.charSpec.addItems(catalog.names("species"))
+        # Unchecking the save boxes clears the saves list through onToggle
+        for st in range(6):
+            self.statInputs[st].setValue(10)
+            self.savesGroup.button(st).setChecked(False)
+        self.saves = [0 for i in range(6)]
+        for skill in self.skillInputs:
+            skill.setCurrentIndex(0)
+        # A lone radio button can only be unchecked while it isn't auto-exclusive
+        self.jackOfTrades.setAutoExclusive(False)
+        self.jackOfTrades.setChecked(False)
+        self.jackOfTrades.setAutoExclusive(True)
+        for i in range(len(self.speedInputs)):
+            self.speedInputs[i].setValue(30 if i == 0 else 0)
+        for sense in self.senseInputs:
+            sense.setValue(0)
+        for damage in self.damageInputs:
+            damage.setCurrentIndex(0)
+
+    # Fills the form with previously saved data for an edit
+    def prefill(self, target):
+        self.inPary = target["inparty"]
+        # Handle all numerical or text values
+        self.level.setValue(target["level"])
+        self.maxHP.setValue(target["hp"])
+        self.ac.setValue(target["ac"])
+        self.init.setValue(target["initiative"])
+        self.notes.setPlainText(target["notes"])
+        # Handle true/false markers
+        if target["jack_of_trades"]:
+            self.jackOfTrades.setChecked(True)
+        # Prefill dropdown menus that aren't in groups
+        self.charSize.setCurrentIndex(target["size"] - 1)
+        self.charSpec.setCurrentIndex(target["species"] - 1)
+        self.align.setCurrentText(target["alignment"])
+        # Prefill stat list and saves
+        for st in range(6):
+            self.statInputs[st].setValue(target["ability_scores"][st])
+            if target["saves"][st] == 1:
+                self.savesGroup.button(st).setChecked(True)
+                self.saves[st] = 1
+        # Prefill Character Classes
+        classStr = ""
+        for k, v in target["class"].items():
+            self.classDict[k] = v
+            classStr += f"{k} {v}, "
+        self.charClass.setText(classStr[0: -2])
+        # Prefill all other grouped categories
+        # Speeds
+        for i in range(len(target["speed"])):
+            self.speedInputs[i].setValue(target["speed"][i])
+        # Senses
+        for i in range(len(target["senses"])):
+            self.senseInputs[i].setValue(target["senses"][i])
+        # Skills
+        for i in range(len(target["skills"])):
+            self.skillInputs[i].setCurrentText(profInv[target["skills"][i]])
+        # Damage Types
+        for i in range(len(target["damage_types"])):
+            self.damageInputs[i].setCurrentText(damageInv[target["damage_types"][i]])
 
     def onToggle(self, button, checked):
         # Add to the saves list if checked, remove if unchecked.
@@ -1142,7 +1303,8 @@ class playerInteract(dbInteract):
             self.saves[statDict[button.text()[0: -5]]] = 0
 
     def classPopup(self):
-        classDialog(self).exec()
+        self.classEditor.bind()
+        self.classEditor.exec()
 
     def confirmAction(self):
         speeds = [0 for i in range(5)]
@@ -1215,8 +1377,8 @@ class playerInteract(dbInteract):
                         "notes": self.notes.toPlainText(),
                         "inparty": self.inPary
                     }, doc_id=self.target.doc_id))
-        self.source.populate()
-        self.source.show()
+                # Combatants built from now on should use the edited stats
+                invalidateStatBlock(CombatantType.PLAYER, self.target.doc_id)
         self.destruct()
 
 
@@ -1287,6 +1449,7 @@ class speciesInteract(dbInteract):
             case Interactions.EDIT:
                 species.upsert(Document({"name": self.name.text(), "size": self.sizes, "speed": self.speed.text()},
                               doc_id=self.target.doc_id))
+        catalog.refresh("species")
         self.source.populate()
         self.source.show()
         self.destruct()
@@ -1345,6 +1508,7 @@ class classInteract(dbInteract):
             case Interactions.EDIT:
                 classes.upsert(Document({"name": self.name.text(), "hit-die": self.hd.currentText(), "saving-throws": self.saves},
                               doc_id=self.target.doc_id))
+        catalog.refresh("classes")
         self.source.populate()
         self.source.show()
         self.destruct()
@@ -1377,6 +1541,7 @@ class monsterTypeInteract(dbInteract):
             case Interactions.EDIT:
                 types.upsert(Document({"name": self.name.text(), "description": self.description.text()},
                               doc_id=self.target.doc_id))
+        catalog.refresh("types")
         self.source.populate()
         self.source.show()
         self.destruct()
@@ -1439,6 +1604,131 @@ class conditionInteract(dbInteract):
             case Interactions.EDIT:
                 conditions.upsert(Document({"name": self.name.text(), "effects": effects},
                               doc_id=self.target.doc_id))
+        catalog.refresh("conditions")
         self.source.populate()
         self.source.show()
         self.destruct()
+
+
+"""
+gridToken: Round token for one combatant on a battleGridView
+Tokens can be dragged around the map, and snap to the nearest square (moving the combatant on the grid)
+    when dropped.
+"""
+class gridToken(QGraphicsEllipseItem):
+    def __init__(self, view, combatant):
+        size = view.grid.footprint(combatant) * view.squarePixels
+        super().__init__(0, 0, size, size)
+        self.view = view
+        self.combatant = combatant
+        self.setBrush(view.monsterBrush if combatant.kind == CombatantType.MONSTER else view.playerBrush)
+        self.setPen(view.tokenPen)
+        self.setToolTip(combatant.name)
+        self.setFlag(QGraphicsItem.ItemIsMovable)
+        # Tokens are drawn once into a cached image, so panning a busy map doesn't repaint each one
+        self.setCacheMode(QGraphicsItem.DeviceCoordinateCache)
+
+    def mouseReleaseEvent(self, event):
+        super().mouseReleaseEvent(event)
+        pixels = self.view.squarePixels
+        try:
+            self.view.grid.place(self.combatant, round(self.x() / pixels), round(self.y() / pixels))
+        except ValueError:
+            pass
+        # Line the token back up with its square (or put it back where it was if it didn't fit)
+        self.view.moveToken(self.combatant)
+
+
+"""
+battleGridView: Map of an encounter's BattleGrid drawn with a QGraphicsView
+Only the grid lines in view are drawn (and cached between repaints), and tokens follow the grid's
+    listeners, so the view stays responsive with hundreds of tokens on a large map.
+Scroll the wheel to zoom and drag the background to pan.
+"""
+class battleGridView(QGraphicsView):
+    def __init__(self, grid, squarePixels=32):
+        super().__init__()
+        self.grid = grid
+        self.squarePixels = squarePixels
+        self.playerBrush = QBrush(QColor(46, 134, 193))
+        self.monsterBrush = QBrush(QColor(176, 58, 46))
+        self.tokenPen = QPen(QColor(0, 0, 0), 1)
+        self.highlightPen = QPen(QColor(241, 196, 15), 4)
+        self.linePen = QPen(QColor(200, 191, 168), 0)
+        self.setScene(QGraphicsScene(0, 0, grid.width * squarePixels, grid.height * squarePixels))
+        self.setCacheMode(QGraphicsView.CacheBackground)
+        self.setViewportUpdateMode(QGraphicsView.SmartViewportUpdate)
+        self.setDragMode(QGraphicsView.ScrollHandDrag)
+        self.setTransformationAnchor(QGraphicsView.AnchorUnderMouse)
+        self.tokens = {}
+        self.highlighted = []
+        # Shaded squares a token can move to, drawn as one item under the tokens
+        self.reach = QGraphicsPathItem()
+        self.reach.setBrush(QBrush(QColor(88, 214, 141, 90)))
+        self.reach.setPen(QPen(Qt.NoPen))
+        self.reach.setZValue(-1)
+        self.scene().addItem(self.reach)
+        for combatant in grid.positions.keys():
+            self.addToken(combatant)
+        grid.listeners.append(self.tokenMoved)
+
+    def addToken(self, combatant):
+        token = gridToken(self, combatant)
+        self.scene().addItem(token)
+        self.tokens[combatant] = token
+        self.moveToken(combatant)
+
+    def moveToken(self, combatant):
+        x, y = self.grid.positions[combatant]
+        self.tokens[combatant].setPos(x * self.squarePixels, y * self.squarePixels)
+
+    # Called by the grid whenever a token is placed, moved or removed
+    def tokenMoved(self, combatant, before, after):
+        if after is None:
+            token = self.tokens.pop(combatant, None)
+            if token is not None:
+                self.scene().removeItem(token)
+        elif combatant not in self.tokens:
+            self.addToken(combatant)
+        else:
+            self.moveToken(combatant)
+
+    # Outlines the given combatants (like the targets of an area effect), clearing the last highlight
+    def highlight(self, combatants):
+        for combatant in self.highlighted:
+            if combatant in self.tokens:
+                self.tokens[combatant].setPen(self.tokenPen)
+        self.highlighted = [c for c in combatants if c in self.tokens]
+        for combatant in self.highlighted:
+            self.tokens[combatant].setPen(self.highlightPen)
+
+    # Shades the squares a combatant can reach (like the keys of Pathfinder.reachable), or clears them
+    def showReach(self, squares=(), combatant=None):
+        pixels = self.squarePixels
+        size = (self.grid.footprint(combatant) if combatant is not None else 1) * pixels
+        path = QPainterPath()
+        for x, y in squares:
+            path.addRect(x * pixels, y * pixels, size, size)
+        self.reach.setPath(path)
+
+    # Stops following the grid (call before throwing the view away)
+    def detach(self):
+        if self.tokenMoved in self.grid.listeners:
+            self.grid.listeners.remove(self.tokenMoved)
+
+    def drawBackground(self, painter, rect):
+        painter.fillRect(rect, QColor(244, 236, 216))
+        pixels = self.squarePixels
+        # Only the lines crossing the exposed part of the map
+        left = max(int(rect.left() // pixels), 0)
+        right = min(int(rect.right() // pixels) + 1, self.grid.width)
+        top = max(int(rect.top() // pixels), 0)
+        bottom = min(int(rect.bottom() // pixels) + 1, self.grid.height)
+        lines = [QLineF(x * pixels, top * pixels, x * pixels, bottom * pixels) for x in range(left, right + 1)]
+        lines.extend(QLineF(left * pixels, y * pixels, right * pixels, y * pixels) for y in range(top, bottom + 1))
+        painter.setPen(self.linePen)
+        painter.drawLines(lines)
+
+    def wheelEvent(self, event):
+        factor = 1.15 if event.angleDelta().y() > 0 else 1 / 1.15
+        self.scale(factor, factor)
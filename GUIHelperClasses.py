@@ -9,10 +9,24 @@ Last updated: 8/6/2025
 TODO:
 """
 
+import threading
 from HelperFunctions import *
-from PySide6.QtCore import QSize, Qt, QTimer
-from PySide6 import QtWidgets
-from PySide6.QtGui import QAction, QColor, QFont, QIcon, QKeySequence, QPalette, QPixmap
+from PySide6.QtCore import QLineF, QSize, Qt, QTimer
+from PySide6.QtGui import (
+    QAction,
+    QBrush,
+    QColor,
+    QFont,
+    QIcon,
+    QImage,
+    QKeySequence,
+    QPainter,
+    QPainterPath,
+    QPalette,
+    QPen,
+    QPixmap,
+    QPixmapCache
+)
 from PySide6.QtWidgets import (
     QApplication,
     QLayout,
@@ -26,6 +40,11 @@ from PySide6.QtWidgets import (
     QDialog,
     QDialogButtonBox,
     QDoubleSpinBox,
+    QGraphicsEllipseItem,
+    QGraphicsItem,
+    QGraphicsPathItem,
+    QGraphicsScene,
+    QGraphicsView,
     QLabel,
     QLineEdit,
     QMainWindow,
@@ -47,6 +66,21 @@ openFont.setPointSize(50)
 headerFont = QFont()
 headerFont.setPointSize(20)
 
+# Pre-scaled background assets paired with their native width (smallest first)
+backgroundAssets = [
+    (160, "images/background_small.png"),
+    (800, "images/background_medium.png"),
+    (1600, "images/background.png"),
+]
+
+
+# Picks the smallest background asset that covers the given width without being stretched up
+def backgroundFor(width):
+    for nativeWidth, path in backgroundAssets:
+        if width <= nativeWidth:
+            return path
+    return backgroundAssets[-1][1]
+
 
 # Method for clearing up spare widgets from memory
 def cleanWidget(widget):
@@ -68,6 +102,81 @@ class Color(QWidget):
         palette.setColor(QPalette.Window, QColor(color))
         self.setPalette(palette)
 
+"""
+ImageCache: Process-wide cache for decoded images and their scaled pixmaps.
+Each file is decoded into a QImage only once, either ahead of time on a background thread
+    through preload() or on first use, and every scaled variant is kept in QPixmapCache
+    under a key made from the path and target size.
+"""
+class ImageCache:
+    def __init__(self):
+        self.images = {}
+        # Guards the decoded images so the GUI thread waits on a preload instead of repeating it
+        self.lock = threading.Lock()
+        self.loader = None
+
+    # Decodes the given files on a background thread so windows don't wait on them later
+    def preload(self, paths):
+        self.loader = threading.Thread(target=lambda: [self.image(p) for p in paths], daemon=True)
+        self.loader.start()
+
+    # Returns the decoded image for a file, decoding it now if it hasn't been already
+    def image(self, path):
+        with self.lock:
+            if path not in self.images:
+                self.images[path] = QImage(path)
+            return self.images[path]
+
+    # Returns a pixmap of the file scaled to the given size, only scaling the first time it's asked for
+    def pixmap(self, path, size=None):
+        key = path if size is None else f"{path}@{size.width()}x{size.height()}"
+        pixmap = QPixmapCache.find(key)
+        if pixmap is None:
+            pixmap = QPixmap.fromImage(self.image(path))
+            if size is not None:
+                pixmap = pixmap.scaled(size, Qt.IgnoreAspectRatio, Qt.SmoothTransformation)
+            QPixmapCache.insert(key, pixmap)
+        return pixmap
+
+
+imageCache = ImageCache()
+# Leave room for the full size background and a few scaled copies of it
+QPixmapCache.setCacheLimit(51200)
+
+
+"""
+Background: Widget that paints a background image matched to its own size.
+The closest pre-scaled asset is fetched from the image cache, scaled once per size, and
+    redrawn as is, rather than being rescaled on every paint like setScaledContents does.
+"""
+class Background(QWidget):
+    def __init__(self):
+        super().__init__()
+        self.current = None
+        # Wait for resizing to settle before fetching a new smooth-scaled pixmap
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(50)
+        self.timer.timeout.connect(self.rescale)
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        if self.current is None:
+            self.rescale()
+        else:
+            self.timer.start()
+
+    # Picks the asset for the current size and gets its scaled copy from the image cache
+    def rescale(self):
+        self.current = imageCache.pixmap(backgroundFor(self.width()), self.size())
+        self.update()
+
+    def paintEvent(self, event):
+        if self.current is not None:
+            painter = QPainter(self)
+            painter.drawPixmap(self.rect(), self.current)
+
+
 # Dialog box making sure the user wants to delete selected data.
 class deleteDialog(QDialog):
     def __init__(self, type, name, parent=None):
@@ -137,7 +246,7 @@ Creates a container for the user to enter data for an action. This includes the
     name, hit bonus, range, targets, damage, type, and additional notes.
 """
 class actionView(QWidget):
-    def __init__(self, name=None, preload=None):
+    def __init__(self, name=None, preload=None, dialog=None):
         super().__init__()
         layout = QGridLayout()
         self.setLayout(layout)
@@ -147,6 +256,8 @@ class actionView(QWidget):
         self.targets = QComboBox()
         self.targets.addItems(["Single Target", "Area of Effect"])
         self.damageList = []
+        # Shared damage dialog from the owning editor (built on demand if none was given)
+        self.dialog = dialog
         self.damage = QPushButton()
         damageLabel = QLabel("N/A")
         self.damage.clicked.connect(lambda: self.damagePopup(damageLabel))
@@ -181,7 +292,10 @@ class actionView(QWidget):
         layout.addWidget(self.info, 4, 0, 1, -1)
 
     def damagePopup(self, label):
-        success = damageDialog(self).exec()
+        if self.dialog is None:
+            self.dialog = damageDialog()
+        self.dialog.bind(self)
+        success = self.dialog.exec()
         if success:
             labelText = ""
             for i in self.damageList:
@@ -236,9 +350,10 @@ class traitView(QWidget):
 """
 damageDialog
 Defines a popup dialog for defining the damage of an attack
+The form is built once and rebound to an action with bind() each time it is opened.
 """
 class damageDialog(QDialog):
-    def __init__(self, src):
+    def __init__(self, src=None):
         super().__init__()
 
         self.setWindowTitle("Assign Damage")
@@ -251,20 +366,6 @@ class damageDialog(QDialog):
         self.buttonBox.accepted.connect(self.accept)
         self.buttonBox.rejected.connect(self.reject)
 
-        # Set an attribute to point to the source of the dialog
-        self.source = src
-
-        # If there is already data in the damage list, parse it so it can be
-        # preloaded into the form fields
-        prefillFlag = False
-        prefillList = []
-        if len(self.source.damageList) > 0:
-            prefillFlag = True
-            for dmg in self.source.damageList:
-                prefillList.append(
-                    re.findall(r"[0-9]+d[0-9]{1,2}| [+-] |[0-9]+|[a-zA-Z]{3,20}", dmg)
-                )
-
         # Arrange and set the layout
         layout = QGridLayout()
         self.diceNum = []
@@ -279,30 +380,6 @@ class damageDialog(QDialog):
             self.operation.append(QComboBox())
             self.operation[count].addItems([" + ", " - "])
             self.additional.append(QSpinBox())
-            # If there is existing data and there are elements still unfilled
-            # Preload the form fields now
-            if prefillFlag and len(prefillList) > 0:
-                # Match the prefill type with current type
-                if prefillList[0][-1] == damageType[count]:
-                    # Determine the type of input
-                    # (Dice only, dice and static damage, or just static)
-                    if len(prefillList[0]) == 4:
-                        # Splid dice values into quantity and type
-                        diceSplit = re.split(r'd', prefillList[0][0])
-                        self.diceNum[count].setValue(int(diceSplit[0]))
-                        self.diceType[count].setCurrentText("d" + diceSplit[1])
-                        self.operation[count].setCurrentText(prefillList[0][1])
-                        self.additional[count].setValue(int(prefillList[0][2]))
-                    # Case with only dice damage
-                    elif "d" in prefillList[0][0]:
-                        diceSplit = re.split(r"d", prefillList[0][0])
-                        self.diceNum[count].setValue(int(diceSplit[0]))
-                        self.diceType[count].setCurrentText("d" + diceSplit[1])
-                    # Case with just static damage
-                    else:
-                        self.additional[count].setValue(int(prefillList[0][0]))
-                    # remove this item from the list
-                    prefillList.pop(0)
             layout.addWidget(self.diceNum[count], count, 0)
             layout.addWidget(self.diceType[count], count, 1)
             layout.addWidget(self.operation[count], count, 2)
@@ -311,6 +388,33 @@ class damageDialog(QDialog):
         layout.addWidget(self.buttonBox, count + 1, 0, 1, -1)
         self.setLayout(layout)
 
+        # Set an attribute to point to the source of the dialog
+        self.source = None
+        if src is not None:
+            self.bind(src)
+
+    # Clears the form and preloads it with the damage list of the given action
+    def bind(self, src):
+        self.source = src
+        for count in range(len(damageType)):
+            self.diceNum[count].setValue(0)
+            self.diceType[count].setCurrentIndex(0)
+            self.operation[count].setCurrentIndex(0)
+            self.additional[count].setValue(0)
+
+        # Preload the form from the damage list (parseDamage caches each entry it has read)
+        for dmg in self.source.damageList:
+            parsed = parseDamage(dmg)
+            if parsed is None:
+                continue
+            diceCount, sides, flat, count = parsed
+            if diceCount != 0:
+                self.diceNum[count].setValue(diceCount)
+                self.diceType[count].setCurrentText("d" + str(sides))
+            if flat != 0:
+                self.operation[count].setCurrentIndex(0 if flat > 0 else 1)
+                self.additional[count].setValue(abs(flat))
+
     def accept(self):
         super().accept()
         self.source.damageList = []
@@ -331,6 +435,7 @@ class damageDialog(QDialog):
 """
 hitpointDialog
 Defines a popup dialog for defining the hitpoints of a monster
+The form is built once and reloaded from its source with bind() each time it is opened.
 """
 class hitpointDialog(QDialog):
     def __init__(self, src):
@@ -349,12 +454,6 @@ class hitpointDialog(QDialog):
         # Set an attribute to point to the source of the dialog
         self.source = src
 
-        # If there is already data in the damage list, parse it so it can be
-        # preloaded into the form fields
-        prefillFlag = False
-        if self.source.maxHP.text() != "Enter HP":
-            prefillFlag = True
-
         # Arrange and set the layout
         layout = QGridLayout()
 
@@ -363,32 +462,39 @@ class hitpointDialog(QDialog):
         self.diceType = QComboBox()
         self.diceType.addItems(["d4", "d6", "d8", "d10", "d12", "d20"])
         self.additional = QSpinBox()
-        # If there is existing data and there are elements still unfilled
-        # Preload the form fields now
-        if prefillFlag:
-            data = re.split(r"[:d+]", self.source.maxHP.text())
-            # Toss the old average (recalculate at accept) and prefill form fields
-            self.diceNum.setValue(data[1])
-            self.diceType.setCurrentText(f"d{data[2]}")
-            self.additional.setValue(data[3])
+        # Creatures with a low Constitution subtract from their hit dice
+        self.additional.setMinimum(-99)
         # Arrange the layout with form elements
         layout.addWidget(self.diceNum, 0, 0)
         layout.addWidget(self.diceType, 0, 1)
         layout.addWidget(self.additional, 0, 2)
         layout.addWidget(self.buttonBox, 1, 0, 1, -1)
         self.setLayout(layout)
+        self.bind()
+
+    # Clears the form and preloads it with the source's current hit points
+    def bind(self):
+        self.diceNum.setValue(0)
+        self.diceType.setCurrentIndex(0)
+        self.additional.setValue(0)
+        # If there is existing data, preload the form fields now (the average is worked out again at accept)
+        hp = self.source.hitPoints
+        if hp is not None:
+            self.diceNum.setValue(hp["count"])
+            self.diceType.setCurrentText(f"d{hp['sides']}")
+            self.additional.setValue(hp["bonus"])
 
     def accept(self):
         super().accept()
-        avg = int(self.diceNum.value() * (float(self.diceType.currentText()[1:]) / 2 + 0.5) + self.additional.value())
-        self.source.maxHP.setText(
-                f"{avg}:{self.diceNum.value()}{self.diceType.currentText()}+{self.additional.value()}"
-            )
+        self.source.hitPoints = makeHP(self.diceNum.value(), int(self.diceType.currentText()[1:]),
+                                       self.additional.value())
+        self.source.maxHP.setText(readHP(self.source.hitPoints))
 
 
 """
-hitpointDialog
-Defines a popup dialog for defining the hitpoints of a monster
+classDialog
+Defines a popup dialog for entering the class levels of a player character
+The form is built from the cached class list and reloaded from its source with bind().
 """
 class classDialog(QDialog):
     def __init__(self, src):
@@ -407,48 +513,50 @@ class classDialog(QDialog):
         # Set an attribute to point to the source of the dialog
         self.source = src
 
-        # If there is already data in the damage list, parse it so it can be
-        # preloaded into the form fields
-        prefillFlag = False
-        prefillList = {}
-        if len(self.source.classDict.items()) > 0:
-            prefillFlag = True
-            for cl, lvl in self.source.classDict.items():
-                prefillList[cl] = lvl
-
         # Arrange and set the layout
-        layout = QGridLayout()
+        self.setLayout(QGridLayout())
+        self.classNames = None
+        self.classInputs = []
+        self.bind()
+
+    # Creates a spinbox for every class, replacing any rows from an older class list
+    def build(self):
+        layout = self.layout()
+        layout.removeWidget(self.buttonBox)
+        while layout.count() > 0:
+            w = layout.takeAt(0).widget()
+            w.setParent(None)
+            w.deleteLater()
+        self.classNames = catalog.names("classes")
         self.classInputs = []
         count = 0
-        for cls in classes.all():
+        for name in self.classNames:
             # Initialize all of the input areas for each class
             self.classInputs.append(QSpinBox())
-            # If there is existing data and there are elements still unfilled
-            # Preload the form fields now
-            if prefillFlag and len(prefillList.items()) > 0:
-                # Match the prefill type with current type
-                if cls["name"] in prefillList.keys():
-                    # Case with just static damage
-                    self.classInputs[count].setValue(prefillList[cls["name"]])
-                    # remove this item from the list
-                    prefillList.pop(cls["name"])
-            layout.addWidget(QLabel(cls["name"] + ": "), count, 0)
+            layout.addWidget(QLabel(name + ": "), count, 0)
             layout.addWidget(self.classInputs[count], count, 1)
             count += 1
         layout.addWidget(self.buttonBox, count + 1, 0, 1, -1)
-        self.setLayout(layout)
+
+    # Clears the form and preloads it with the source's current class levels
+    def bind(self):
+        # Only rebuild the rows if the class table changed since the last open
+        if self.classNames is not catalog.names("classes"):
+            self.build()
+        for count in range(len(self.classNames)):
+            self.classInputs[count].setValue(self.source.classDict.get(self.classNames[count], 0))
 
     def accept(self):
         super().accept()
-        count = 0
         level = 0
         classStr = ""
-        for cls in self.classInputs:
-            if cls.value() > 0:
-                name = classes.all()[count]["name"]
-                self.source.classDict[name] = cls.value()
-                classStr += f"{name} {cls.value()}, "
-                level += cls.value()
-            count += 1
+        self.source.classDict = {}
+        for count in range(len(self.classInputs)):
+            value = self.classInputs[count].value()
+            if value > 0:
+                name = self.classNames[count]
+                self.source.classDict[name] = value
+                classStr += f"{name} {value}, "
+                level += value
         self.source.level.setValue(level)
         self.source.charClass.setText(classStr[0: -2])
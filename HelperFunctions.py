@@ -10,11 +10,10 @@ Last updated: 4/10/2025
 TODO:
 """
 
-import gc
 import re
+from functools import lru_cache
 import math
 import random as rd
-import time
 from enum import Enum
 from tinydb import TinyDB, Query, where
 from tinydb.table import Document
@@ -31,8 +30,6 @@ senses = refs.table("senses")
 sizes = refs.table("sizes")
 skills = refs.table("skills")
 
-encounterXP = 0
-
 # List of all valid damage types in dnd 5e and 2024 edition
 damageType = [
     "Piercing",
@@ -98,12 +95,80 @@ damageDict = {
     "Immune": -2
 }
 
+# Reverse lookups for turning stored values back into their display names
+profInv = {val: key for key, val in profDict.items()}
+damageInv = {val: key for key, val in damageDict.items()}
+
+"""
+Catalog keeps an in-memory copy of the reference tables that forms and views read from, so
+    opening an editor doesn't go back to the database for every dropdown.
+Entries are loaded on first use and dropped by refresh() whenever their table is written to.
+"""
+class Catalog:
+    def __init__(self):
+        # Maps each catalog entry to its table and the field used as its display name
+        self.tables = {
+            "skills": (skills, "skill"),
+            "senses": (senses, "sense"),
+            "sizes": (sizes, "size"),
+            "types": (types, "name"),
+            "classes": (classes, "name"),
+            "species": (species, "name"),
+            "conditions": (conditions, "name"),
+        }
+        self.docs = {}
+        self.labels = {}
+        self.byId = {}
+        self.positions = {}
+
+    # Returns every document in the requested table, reading the database only once
+    def all(self, name):
+        if name not in self.docs:
+            self.docs[name] = self.tables[name][0].all()
+        return self.docs[name]
+
+    # Returns the display names for the requested table in doc_id order
+    def names(self, name):
+        if name not in self.labels:
+            field = self.tables[name][1]
+            self.labels[name] = [doc[field] for doc in self.all(name)]
+        return self.labels[name]
+
+    # Returns where a display name sits in names() without scanning the list
+    def position(self, name, label):
+        if name not in self.positions:
+            self.positions[name] = {value: i for i, value in enumerate(self.names(name))}
+        return self.positions[name][label]
+
+    # Returns a single document from the requested table by its doc_id
+    def get(self, name, doc_id):
+        if name not in self.byId:
+            self.byId[name] = {doc.doc_id: doc for doc in self.all(name)}
+        return self.byId[name][doc_id]
+
+    # Drops cached data for one table (or all of them) so the next read sees database changes
+    def refresh(self, name=None):
+        for key in ([name] if name is not None else list(self.tables.keys())):
+            self.docs.pop(key, None)
+            self.labels.pop(key, None)
+            self.byId.pop(key, None)
+            self.positions.pop(key, None)
+
+
+catalog = Catalog()
+
+
 class Interactions(Enum):
     ADD = 1
     EDIT = 2
     DELETE = 3
 
 
+class CombatantType(Enum):
+    PLAYER = 1
+    MONSTER = 2
+
+
 class ActionType(Enum):
     ACTION = 1
     TRAIT = 2
@@ -111,20 +176,169 @@ class ActionType(Enum):
     LAIR_ACTION = 4
 
 
+class TurnPhase(Enum):
+    START = 0
+    END = 1
+
+
+class Difficulty(Enum):
+    EASY = 0
+    MEDIUM = 1
+    HARD = 2
+    DEADLY = 3
+
+
+# What covers a square of the battle grid (see terrainCosts in Pathfinder)
+class Terrain(Enum):
+    OPEN = 0
+    DIFFICULT = 1
+    WATER = 2
+    CLIFF = 3
+    CHASM = 4
+    WALL = 5
+
+
+# How monsters added to an encounter get their hit points
+class HitPointMethod(Enum):
+    AVERAGE = 0
+    ROLLED = 1
+    MAX = 2
+
+
+# XP thresholds for a single character of each level, in Difficulty order (easy, medium, hard, deadly)
+xpThresholds = {
+    1: (25, 50, 75, 100),
+    2: (50, 100, 150, 200),
+    3: (75, 150, 225, 400),
+    4: (125, 250, 375, 500),
+    5: (250, 500, 750, 1100),
+    6: (300, 600, 900, 1400),
+    7: (350, 750, 1100, 1700),
+    8: (450, 900, 1400, 2100),
+    9: (550, 1100, 1600, 2400),
+    10: (600, 1200, 1900, 2800),
+    11: (800, 1600, 2400, 3600),
+    12: (1000, 2000, 3000, 4500),
+    13: (1100, 2200, 3400, 5100),
+    14: (1250, 2500, 3800, 5700),
+    15: (1400, 2800, 4300, 6400),
+    16: (1600, 3200, 4800, 7200),
+    17: (2000, 3900, 5900, 8800),
+    18: (2100, 4200, 6300, 9500),
+    19: (2400, 4900, 7300, 10900),
+    20: (2800, 5700, 8500, 12700),
+}
+
+# XP multipliers for groups of monsters, see groupMultiplier
+groupMultipliers = [0.5, 1, 1.5, 2, 2.5, 3, 4, 5]
+
+
 # Takes in a player level or creature CR and outputs the corresponding proviciency modifier.
 def profByLevel(level):
     return 2 + int((level - 1) / 4)
 
 
+# Takes in the number of monsters and party members and returns the encounter's XP multiplier
+def groupMultiplier(count, partySize):
+    if count <= 0:
+        return 0
+    # Position in groupMultipliers for a party of three to five characters
+    step = 1 if count == 1 else 2 if count == 2 else 3 if count <= 6 else 4 if count <= 10 else 5 if count <= 14 else 6
+    # Smaller parties find groups harder, larger parties find them easier
+    if partySize < 3:
+        step += 1
+    elif partySize >= 6:
+        step -= 1
+    return groupMultipliers[step]
+
+
 # Takes in an ability score and returns the associated bonus score
 def getBonus(score):
     return math.floor((score - 10) / 2)
 
 
-# Takes in a string for a monster's HP and returns something readable
-def readHP(hpString):
-    slice = re.split(":", hpString)
-    return slice[0] + ' (' + slice[1] + ')'
+"""
+project reads through a table keeping only a few fields from each document
+table: The TinyDB table to read
+fields: List of field names to keep, in the order they should appear in each summary
+keep: Optional check on the full document, documents that fail it are skipped
+Returns: A list of (doc_id, summary tuple) pairs, so full documents never outlive the read
+"""
+def project(table, fields, keep=None):
+    summaries = []
+    for doc in table:
+        if keep is None or keep(doc):
+            summaries.append((doc.doc_id, tuple(doc[f] for f in fields)))
+    return summaries
+
+
+# Matches a stored damage entry like "(1d8 + 3)piercing", "(2d6)fire" or "(5)slashing"
+damagePattern = re.compile(r"\(\s*(?:(\d*)d(\d+))?\s*(?:([+-])?\s*(\d+))?\s*\)\s*([a-zA-Z]+)")
+
+"""
+parseDamage splits a stored damage entry into its parts
+Results are cached, so each distinct entry is only run through the pattern once
+dmg: String in the format the damage dialog saves
+Returns: A tuple of (dice count, dice sides, flat bonus, index into damageType), or None if it can't be read
+"""
+@lru_cache(maxsize=None)
+def parseDamage(dmg):
+    match = damagePattern.search(dmg)
+    if match is None or match.group(5).capitalize() not in damageType:
+        return None
+    count, sides, sign, flat, type = match.groups()
+    # Dice written without a count (like "d6") roll one die
+    count = 0 if sides is None else int(count or 1)
+    sides = 0 if sides is None else int(sides)
+    flat = 0 if flat is None else int(flat)
+    if sign == "-":
+        flat = -flat
+    return (count, sides, flat, damageType.index(type.capitalize()))
+
+
+"""
+Monster hit points are stored as {"average": 58, "count": 9, "sides": 8, "bonus": 18}
+Older records hold the same values as a string ("58:9d8+18"), which hitPoints converts and migrateHP
+    rewrites in the database
+"""
+hpPattern = re.compile(r"\s*(\d+)\s*:\s*(\d+)d(\d+)\s*(?:([+-])\s*(\d+))?\s*")
+
+
+# Builds the stored form of a monster's hit points from its hit dice
+def makeHP(count, sides, bonus):
+    return {"average": int(count * (sides / 2 + 0.5) + bonus), "count": count, "sides": sides, "bonus": bonus}
+
+
+# Returns a monster's hit points in the stored form, converting the older string format
+def hitPoints(hp):
+    if isinstance(hp, dict):
+        return hp
+    match = hpPattern.fullmatch(hp)
+    if match is None:
+        raise ValueError(f"Unreadable hit points: {hp}")
+    average, count, sides, sign, bonus = match.groups()
+    bonus = 0 if bonus is None else int(bonus)
+    return {"average": int(average), "count": int(count), "sides": int(sides), "bonus": -bonus if sign == "-" else bonus}
+
+
+# Takes in a monster's HP and returns its average as an integer
+def parseHP(hp):
+    return hitPoints(hp)["average"]
+
+
+# Takes in a monster's HP and returns something readable, like "58 (9d8+18)"
+def readHP(hp):
+    hp = hitPoints(hp)
+    bonus = f"{hp['bonus']:+d}" if hp["bonus"] != 0 else ""
+    return f"{hp['average']} ({hp['count']}d{hp['sides']}{bonus})"
+
+
+# Rewrites monsters stored with string hit points in the structured form, returns how many changed
+def migrateHP(table=monsters):
+    old = [doc for doc in table.all() if isinstance(doc["hp"], str)]
+    for doc in old:
+        table.update({"hp": hitPoints(doc["hp"])}, doc_ids=[doc.doc_id])
+    return len(old)
 
 """
 rollDice takes in a string expression representing a series of dice and randomizes a total in that range
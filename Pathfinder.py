@@ -0,0 +1,203 @@
+"""
+File: Pathfinder.py
+Brief: Movement over the battle grid, who can get where this turn and by which way.
+Description: Each creature's speeds (walk, swim, climb, burrow and fly) are turned into a cost for every
+    square of the map in one numpy pass, using the cheapest way the creature has of crossing each kind
+    of terrain. A flood fill from the creature's square finds everywhere it can reach this turn and an
+    A* search finds the cheapest path to a square. Results are cached for the creature, and the cache is
+    dropped whenever the turn moves on, a token moves, the terrain changes or anyone goes down or gets up.
+Author: Brandon Dennis
+Version: 0.0.0
+Last updated: 4/3/2025
+TODO:
+"""
+
+import heapq
+import math
+import numpy as np
+from HelperFunctions import *
+from BattleGrid import squareFeet
+
+# Cost of crossing a square of each terrain, in squares of movement, for each way of moving
+# (columns follow movements: Walk, Swim, Climb, Burrow, Fly, math.inf where that way can't be used)
+# Swimming or climbing without a speed for it costs an extra foot for every foot, like difficult terrain
+terrainCosts = {
+    Terrain.OPEN: (1, math.inf, math.inf, 1, 1),
+    Terrain.DIFFICULT: (2, math.inf, math.inf, 2, 1),
+    Terrain.WATER: (2, 1, math.inf, math.inf, 1),
+    Terrain.CLIFF: (2, math.inf, 1, math.inf, 1),
+    Terrain.CHASM: (math.inf, math.inf, math.inf, math.inf, 1),
+    Terrain.WALL: (math.inf, math.inf, math.inf, math.inf, math.inf),
+}
+
+# Steps to the eight neighbouring squares (diagonals cost the same as straight moves)
+steps = ((1, 0), (-1, 0), (0, 1), (0, -1), (1, 1), (1, -1), (-1, 1), (-1, -1))
+
+"""
+Pathfinder answers movement questions for the combatants on an encounter's battle grid
+Costs are measured in feet of the creature's fastest speed: a creature that walks 30 and swims 15 spends
+    10 of its 30 feet on every square of water, so moving by different means in one turn adds up
+    the way the rules describe.
+Conscious enemies can't be moved through, and no square anyone else stands in can be the end of a move.
+grid: BattleGrid to move over
+encounter: Encounter the grid belongs to (its round and current combatant mark the turn for the cache)
+"""
+class Pathfinder:
+    def __init__(self, grid, encounter):
+        self.grid = grid
+        self.encounter = encounter
+        self.cache = {}
+        self.stamp = None
+
+    # Cached result for a key, after dropping the cache if anything movement depends on changed since it was filled
+    # (the grid version covers tokens and terrain, conscious flags decide which enemies block the way)
+    def cached(self, key):
+        stamp = (self.grid.version, self.turn(), self.encounter.state.conscious.tobytes())
+        if stamp != self.stamp:
+            self.cache = {}
+            self.stamp = stamp
+        return self.cache.get(key)
+
+    def turn(self):
+        return (self.encounter.round, self.encounter.current)
+
+    """
+    costs works out what it costs a combatant to move its token onto each square
+    combatant: Combatant moving (a Large or bigger creature needs room for its whole footprint)
+    Returns: (cost array indexed [x, y] with math.inf where the token can't go, array of squares the move
+        can't end on, fastest speed) or None if the combatant has no speed
+    """
+    def costs(self, combatant):
+        grid = self.grid
+        speeds = np.array(combatant.speed, dtype=np.float64)
+        fastest = speeds.max()
+        if fastest <= 0:
+            return None
+        # Cheapest way of crossing each terrain, in feet of the fastest speed
+        usable = np.where(speeds > 0, fastest / np.where(speeds > 0, speeds, 1), math.inf)
+        table = np.full(len(Terrain), math.inf)
+        for terrain, multiples in terrainCosts.items():
+            table[terrain.value] = (np.array(multiples) * usable).min() * squareFeet
+        square = table[grid.terrain]
+        taken = np.zeros(grid.terrain.shape, dtype=np.bool_)
+        for other, (x, y) in grid.positions.items():
+            if other is combatant:
+                continue
+            m = grid.footprint(other)
+            taken[x:x + m, y:y + m] = True
+            if other.conscious and other.kind != combatant.kind:
+                square[x:x + m, y:y + m] = math.inf
+        # A token covering several squares pays for the worst of them and can't end overlapping anyone
+        n = grid.footprint(combatant)
+        width, height = square.shape
+        cost = np.full(square.shape, math.inf)
+        blocked = np.ones(square.shape, dtype=np.bool_)
+        cost[:width - n + 1, :height - n + 1] = square[:width - n + 1, :height - n + 1]
+        blocked[:width - n + 1, :height - n + 1] = taken[:width - n + 1, :height - n + 1]
+        for i in range(n):
+            for j in range(n):
+                if i == 0 and j == 0:
+                    continue
+                window = (slice(0, width - n + 1), slice(0, height - n + 1))
+                shifted = (slice(i, width - n + 1 + i), slice(j, height - n + 1 + j))
+                cost[window] = np.maximum(cost[window], square[shifted])
+                blocked[window] |= taken[shifted]
+        return cost, blocked, fastest
+
+    """
+    reachable floods out from a combatant to every square it can move to this turn
+    combatant: Combatant moving
+    budget: Feet of movement to spend (defaults to the combatant's fastest speed)
+    Returns: A dictionary from each square the move can end on (the top left square of the token) to
+        the feet spent getting there, including the square the combatant starts on
+    """
+    def reachable(self, combatant, budget=None):
+        if combatant not in self.grid:
+            return {}
+        key = ("reach", combatant, budget)
+        found = self.cached(key)
+        if found is not None:
+            return found
+        costs = self.costs(combatant)
+        start = self.grid.positions[combatant]
+        if costs is None:
+            found = {start: 0}
+            self.cache[key] = found
+            return found
+        cost, blocked, fastest = costs
+        budget = fastest if budget is None else budget
+        # Every square costs at least 5 feet, so the flood never leaves this window
+        reach = int(budget // squareFeet)
+        width, height = cost.shape
+        x0, y0 = max(start[0] - reach, 0), max(start[1] - reach, 0)
+        x1, y1 = min(start[0] + reach, width - 1), min(start[1] + reach, height - 1)
+        window = cost[x0:x1 + 1, y0:y1 + 1].tolist()
+        spent = {start: 0}
+        queue = [(0, start)]
+        while len(queue) > 0:
+            used, (x, y) = heapq.heappop(queue)
+            if used > spent[(x, y)]:
+                continue
+            for dx, dy in steps:
+                nx, ny = x + dx, y + dy
+                if nx < x0 or nx > x1 or ny < y0 or ny > y1:
+                    continue
+                step = window[nx - x0][ny - y0]
+                # No cutting across the corner of a square that can't be entered
+                if dx != 0 and dy != 0 and (window[nx - x0][y - y0] == math.inf or window[x - x0][ny - y0] == math.inf):
+                    continue
+                total = used + step
+                if total <= budget and total < spent.get((nx, ny), math.inf):
+                    spent[(nx, ny)] = total
+                    heapq.heappush(queue, (total, (nx, ny)))
+        found = {square: used for square, used in spent.items() if square == start or not blocked[square]}
+        self.cache[key] = found
+        return found
+
+    """
+    path finds the cheapest way for a combatant to move its token to a square (A* search)
+    combatant: Combatant moving
+    goal: (x, y) top left square the token should end on
+    Returns: (list of squares from the start to the goal, feet spent), or None if the goal can't be reached
+    """
+    def path(self, combatant, goal):
+        if combatant not in self.grid:
+            return None
+        key = ("path", combatant, goal)
+        found = self.cached(key)
+        if found is not None:
+            return found
+        costs = self.costs(combatant)
+        start = self.grid.positions[combatant]
+        if costs is None or (goal != start and costs[1][goal]) or costs[0][goal] == math.inf:
+            return None
+        cost = costs[0].tolist()
+        width, height = len(cost), len(cost[0])
+        # Straight line distance in squares times 5 feet never overestimates what is left
+        guess = lambda x, y: max(abs(goal[0] - x), abs(goal[1] - y)) * squareFeet
+        spent = {start: 0}
+        came = {}
+        queue = [(guess(*start), 0, start)]
+        while len(queue) > 0:
+            _, used, (x, y) = heapq.heappop(queue)
+            if (x, y) == goal:
+                squares = [goal]
+                while squares[-1] != start:
+                    squares.append(came[squares[-1]])
+                found = (squares[::-1], used)
+                self.cache[key] = found
+                return found
+            if used > spent[(x, y)]:
+                continue
+            for dx, dy in steps:
+                nx, ny = x + dx, y + dy
+                if nx < 0 or nx >= width or ny < 0 or ny >= height:
+                    continue
+                if dx != 0 and dy != 0 and (cost[nx][y] == math.inf or cost[x][ny] == math.inf):
+                    continue
+                total = used + cost[nx][ny]
+                if total < spent.get((nx, ny), math.inf):
+                    spent[(nx, ny)] = total
+                    came[(nx, ny)] = (x, y)
+                    heapq.heappush(queue, (total + guess(nx, ny), total, (nx, ny)))
+        return None
@@ -0,0 +1,256 @@
+"""
+File: combat_companion/Session.py
+Brief: Text commands for running an encounter without the Qt interface.
+Description: Builds encounters from database doc_ids and runs them one command per line, from stdin or a
+    script file, so fights can be driven by scripts, regression tests and simulations on machines with no
+    display. Names with spaces can be quoted, and any unique start of a name is enough.
+Author: Brandon Dennis
+Version: 0.0.0
+Last updated: 4/3/2025
+TODO:
+"""
+
+import sys
+import shlex
+import inspect
+from CoreClasses import *
+from Commands import runCommand
+
+"""
+buildEncounter creates an encounter from database doc_ids, rolling initiative for everyone
+monsters: List of (doc_id, count) pairs, each monster is added count times
+players: List of player doc_ids
+groups: List of (doc_id, count) pairs, each added as one MonsterGroup of count members
+hp: HitPointMethod the monsters get their hit points with
+Returns: The Encounter, with repeated names numbered so every combatant can be told apart
+"""
+def buildEncounter(monsters=(), players=(), groups=(), hp=HitPointMethod.AVERAGE):
+    entries = []
+    for doc_id, count in monsters:
+        entries.extend(monsterEntries(doc_id, count, hp))
+    for doc_id, count in groups:
+        entries.extend(monsterEntries(doc_id, count, hp, group=True))
+    for doc_id in players:
+        block = loadStatBlock(CombatantType.PLAYER, doc_id)
+        entries.append([False, block, 0, block.hp])
+    encounter = Encounter(entries)
+    # Groups are called "<name> group" so their members never share a name with a lone monster
+    counts = {}
+    for c in encounter.combatants:
+        if isinstance(c, MonsterGroup):
+            c.name += " group"
+        counts[c.name] = counts.get(c.name, 0) + 1
+    seen = {}
+    for c in encounter.combatants:
+        if counts[c.name] > 1:
+            seen[c.name] = seen.get(c.name, 0) + 1
+            c.name = f"{c.name} {seen[c.name]}"
+        if isinstance(c, MonsterGroup):
+            for i, member in enumerate(c.members):
+                member.name = f"{c.name} {i + 1}"
+    encounter.refreshNames()
+    encounter.rollInitiative()
+    return encounter
+
+
+"""
+Session runs text commands against an encounter
+encounter: Encounter to run
+out: File-like object the results are written to
+"""
+class Session:
+    def __init__(self, encounter, out=sys.stdout):
+        self.encounter = encounter
+        self.out = out
+        self.commands = {
+            "status": self.status,
+            "next": self.next,
+            "previous": self.previous,
+            "hp": self.hp,
+            "temp": self.temp,
+            "condition": self.condition,
+            "uncondition": self.uncondition,
+            "attack": self.attack,
+            "area": self.area,
+            "undo": self.undo,
+            "redo": self.redo,
+            "roll": self.roll,
+            "help": self.help,
+        }
+
+    def write(self, text):
+        print(text, file=self.out)
+
+    # Runs every line, stopping early on quit, returns False if the session was quit
+    def run(self, lines):
+        for line in lines:
+            if not self.execute(line):
+                return False
+        return True
+
+    """
+    execute runs one command
+    line: Text of the command (blank lines and lines starting with # are skipped)
+    Returns: False if the command was quit, True otherwise
+    """
+    def execute(self, line):
+        words = shlex.split(line, comments=True)
+        if len(words) == 0:
+            return True
+        name = words[0].lower()
+        if name in ("quit", "exit"):
+            return False
+        command = self.commands.get(name)
+        # Only mistakes in what was typed are reported here, anything else is a bug and is raised
+        try:
+            if command is None:
+                # Anything else is a batch command like "goblin* -2d6 fire dex 14"
+                self.batch(line)
+            else:
+                inspect.signature(command).bind(*words[1:])
+                command(*words[1:])
+        except UnexpectedSyntax as error:
+            self.write(f"Unknown command: {line.strip()} ({error}, try help)")
+        except TypeError as error:
+            self.write(f"Wrong number of arguments for {name} ({error}, try help)")
+        except KeyError as error:
+            # A KeyError's text comes out quoted, so its message is written instead
+            self.write(f"Error: {error.args[0] if len(error.args) > 0 else error}")
+        except ValueError as error:
+            self.write(f"Error: {error}")
+        return True
+
+    # Finds a combatant (or member of a group) by a unique start of their name
+    def find(self, name):
+        candidates = []
+        for c in self.encounter.combatants:
+            candidates.append(c)
+            if isinstance(c, MonsterGroup):
+                candidates.extend(c.members)
+        lowered = name.lower()
+        for c in candidates:
+            if c.name.lower() == lowered:
+                return c
+        matches = [c for c in candidates if c.name.lower().startswith(lowered)]
+        if len(matches) != 1:
+            raise KeyError(f"{len(matches)} combatants match '{name}'")
+        return matches[0]
+
+    # Prints the turn order with HP, AC and conditions
+    def status(self):
+        encounter = self.encounter
+        self.write(f"Round {encounter.round}")
+        for c in encounter.combatants:
+            marker = ">" if c is encounter.current else " "
+            hp = f"{c.currentHP}/{c.maxHP}" + (f" +{c.tempHP}" if c.tempHP > 0 else "")
+            extra = []
+            if isinstance(c, MonsterGroup):
+                extra.append(f"{len(c.living())}/{len(c.members)} standing")
+            if c.concentration:
+                extra.append("concentrating")
+            extra.extend(c.conditions)
+            if not c.conscious:
+                extra.append("down")
+            self.write(f"{marker} {c.init:>3} {c.name:<24} HP {hp:<12} AC {c.ac:<3} {', '.join(extra)}")
+
+    def next(self):
+        self.write(f"{self.encounter.next().name}'s turn (round {self.encounter.round})")
+
+    def previous(self):
+        self.write(f"{self.encounter.previous().name}'s turn (round {self.encounter.round})")
+
+    # Checks an HP expression before it reaches the combatant
+    def amount(self, expr):
+        if re.fullmatch(r"[+-]?\d+", expr) is None:
+            raise ValueError(f"'{expr}' isn't an amount like 5, +5 or -5")
+        return expr
+
+    # hp NAME EXPR (+N heals, -N damages, N sets)
+    def hp(self, name, expr):
+        target = self.find(name)
+        target.setCurrentHP(self.amount(expr))
+        self.write(f"{target.name}: {target.currentHP}/{target.maxHP}")
+
+    # temp NAME EXPR
+    def temp(self, name, expr):
+        target = self.find(name)
+        target.updateTempHP(self.amount(expr))
+        self.write(f"{target.name}: {target.tempHP} temp HP")
+
+    # condition NAME CONDITION [ROUNDS], with ROUNDS the condition ends at the end of the target's turn
+    def condition(self, name, cond, rounds=None):
+        target = self.find(name)
+        cond = cond.capitalize()
+        if rounds is None:
+            target.addCondition(cond)
+        else:
+            self.encounter.effects.condition(target, cond, rounds=int(rounds))
+        self.write(f"{target.name}: {', '.join(target.conditions)}")
+
+    # uncondition NAME CONDITION
+    def uncondition(self, name, cond):
+        target = self.find(name)
+        target.removeCondition(cond.capitalize())
+        self.write(f"{target.name}: {', '.join(target.conditions) or 'no conditions'}")
+
+    # attack ATTACKER ACTION TARGET (a group attacks with every standing member)
+    def attack(self, attacker, action, target):
+        attacker = self.find(attacker)
+        target = self.find(target)
+        if attacker.kind == CombatantType.PLAYER:
+            raise ValueError(f"{attacker.name} is a player, players have no stat-block attacks")
+        names = {name.lower(): name for name in attacker.attacks.keys()}
+        if action.lower() not in names:
+            raise KeyError(f"{attacker.name} has no action '{action}'")
+        action = names[action.lower()]
+        if isinstance(attacker, MonsterGroup):
+            result = self.encounter.mobAttack(attacker, action, target)
+            self.write(f"{result['hits']}/{result['attackers']} hit for {result['damage']} "
+                       f"(expected {result['expectedDamage']:.1f}), {target.name} at {target.currentHP}")
+            return
+        result = self.encounter.attack(attacker, action, target)
+        if result["hit"]:
+            crit = " (critical)" if result["critical"] else ""
+            self.write(f"{result['roll']} hits{crit} for {result['damage']}, {target.name} at {target.currentHP}")
+        else:
+            self.write(f"{result['roll']} misses")
+
+    # area STAT|none DC DICE TYPE NAME... (like: area dexterity 15 8d6 fire goblin orc)
+    def area(self, stat, dc, dice, type, *names):
+        stat = None if stat.lower() == "none" else stat.capitalize()
+        results = self.encounter.applyAreaEffect([self.find(n) for n in names], stat, int(dc), dice, type)
+        for r in results:
+            saved = "" if r["save"] is None else f" save {r['save']} {'made' if r['saved'] else 'failed'},"
+            self.write(f"{r['combatant'].name}:{saved} takes {r['damage']}, at {r['currentHP']}")
+
+    # TARGETS STEP... (see Commands.py), one line per combatant for each step
+    def batch(self, line):
+        for step, results in runCommand(self.encounter, line):
+            for r in results:
+                c = r["combatant"]
+                if step[0] == "damage":
+                    saved = "" if r["save"] is None else f" save {r['save']} {'made' if r['saved'] else 'failed'},"
+                    self.write(f"{c.name}:{saved} takes {r['damage']}, at {r['currentHP']}")
+                elif step[0] == "condition":
+                    self.write(f"{c.name}: {', '.join(r['conditions']) or 'no conditions'}")
+                else:
+                    temp = f" +{r['tempHP']}" if r["tempHP"] > 0 else ""
+                    self.write(f"{c.name}: {r['currentHP']}/{c.maxHP}{temp}")
+
+    def undo(self, steps="1"):
+        self.encounter.undo(int(steps))
+        self.write(f"Undone, {self.encounter.current.name}'s turn (round {self.encounter.round})")
+
+    def redo(self, steps="1"):
+        self.encounter.redo(int(steps))
+        self.write(f"Redone, {self.encounter.current.name}'s turn (round {self.encounter.round})")
+
+    def roll(self, expr):
+        self.write(str(rollDice(expr, hasAvg=False)))
+
+    def help(self):
+        self.write("Commands: status, next, previous, hp NAME EXPR, temp NAME EXPR, condition NAME COND [ROUNDS],\n"
+                   "    uncondition NAME COND, attack ATTACKER ACTION TARGET, area STAT|none DC DICE TYPE NAME...,\n"
+                   "    undo [N], redo [N], roll EXPR, quit\n"
+                   "Batch commands: TARGETS STEP..., like 'goblin* -2d6+3 fire half-on-save dex 14',\n"
+                   "    'all-enemies +frightened 1r', 'all-allies +1d8+3' or 'mimic* =20 -prone'")
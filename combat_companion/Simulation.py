@@ -0,0 +1,94 @@
+"""
+File: combat_companion/Simulation.py
+Brief: Plays out encounters automatically to estimate how they go.
+Description: Every trial builds a fresh encounter and lets each side attack until one side is down or the
+    round limit is reached. Monsters use their first action against a random standing character, and
+    characters (who have no actions stored) make a simple weapon attack at the weakest standing monster.
+Author: Brandon Dennis
+Version: 0.0.0
+Last updated: 4/3/2025
+TODO:
+"""
+
+import CoreClasses
+from CoreClasses import *
+from combat_companion.Session import buildEncounter
+
+# Weapon attacks made up for player characters, keyed by their stat block
+playerAttacks = {}
+
+
+# A one handed weapon attack using the character's better of strength and dexterity
+def playerAttack(block):
+    if block not in playerAttacks:
+        mod = max(getBonus(block.stats[statDict["Strength"]]), getBonus(block.stats[statDict["Dexterity"]]))
+        sign = "+" if mod >= 0 else "-"
+        playerAttacks[block] = Attack("Weapon", {
+            "hit_bonus": block.proficiency + mod,
+            "range": 5,
+            "targets": "Single Target",
+            "damage": [f"(1d8 {sign} {abs(mod)})Slashing"],
+            "extra": "",
+        })
+    return playerAttacks[block]
+
+
+# Combatants on one side still standing (group rows left out, their members count instead)
+def standing(encounter, monsters):
+    state = encounter.state
+    return state.combatantsAt(np.flatnonzero(state.inUse & ~state.group & state.conscious & (state.monster == monsters)))
+
+
+"""
+simulate plays an encounter out several times
+monsters, players, groups: Passed to buildEncounter
+trials: Number of fights to play
+maxRounds: Fights still going after this many rounds count as neither side winning
+seed: Optional seed so runs can be repeated
+hp: HitPointMethod the monsters get their hit points with (rolled HP is rolled again for every fight)
+Returns: A dictionary with the number of party wins, monster wins and draws, the average number of
+    rounds and the average share of party HP left at the end
+"""
+def simulate(monsters=(), players=(), groups=(), trials=100, maxRounds=20, seed=None, hp=HitPointMethod.AVERAGE):
+    if seed is not None:
+        rd.seed(seed)
+        CoreClasses.rng = np.random.default_rng(seed)
+    wins = losses = draws = 0
+    rounds = 0
+    hpLeft = 0.0
+    for trial in range(trials):
+        encounter = buildEncounter(monsters, players, groups, hp)
+        party = [c for c in encounter.combatants if c.kind == CombatantType.PLAYER]
+        while encounter.round <= maxRounds:
+            foes = standing(encounter, False)
+            allies = standing(encounter, True)
+            if len(foes) == 0 or len(allies) == 0:
+                break
+            current = encounter.current
+            if current.kind == CombatantType.PLAYER:
+                encounter.attack(current, playerAttack(current.block), encounter.lowestHP(True))
+            elif len(current.attacks) > 0:
+                action = next(iter(current.attacks.values()))
+                target = rd.choice(foes)
+                if isinstance(current, MonsterGroup):
+                    encounter.mobAttack(current, action, target)
+                else:
+                    encounter.attack(current, action, target)
+            encounter.next()
+        if len(standing(encounter, True)) == 0:
+            wins += 1
+        elif len(standing(encounter, False)) == 0:
+            losses += 1
+        else:
+            draws += 1
+        rounds += min(encounter.round, maxRounds)
+        total = sum(c.maxHP for c in party)
+        hpLeft += sum(c.currentHP for c in party) / total if total > 0 else 0
+    return {
+        "trials": trials,
+        "partyWins": wins,
+        "monsterWins": losses,
+        "draws": draws,
+        "averageRounds": rounds / trials if trials > 0 else 0,
+        "averageHPLeft": hpLeft / trials if trials > 0 else 0,
+    }
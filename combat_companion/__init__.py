@@ -0,0 +1,11 @@
+"""
+File: combat_companion/__init__.py
+Brief: Command line entry point for running the combat engine without the Qt interface.
+Description: Run from the project folder (the databases are found by relative path) with
+    python -m combat_companion run-encounter | simulate | roll
+    See __main__.py for the options of each command and Session.py for the commands an encounter accepts.
+Author: Brandon Dennis
+Version: 0.0.0
+Last updated: 4/3/2025
+TODO:
+"""
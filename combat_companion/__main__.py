@@ -0,0 +1,88 @@
+"""
+File: combat_companion/__main__.py
+Brief: Runs the combat engine from the command line, without Qt.
+Description: python -m combat_companion run-encounter --monster 1x3 --player 1 [--script FILE]
+    python -m combat_companion simulate --monster 1x2 --player 1 --player 2 --trials 500
+    python -m combat_companion roll 2d6+3
+    Monsters are given as DOC_ID or DOC_IDxCOUNT, groups (one initiative entry for many) as DOC_IDxCOUNT.
+Author: Brandon Dennis
+Version: 0.0.0
+Last updated: 4/3/2025
+TODO:
+"""
+
+import sys
+import argparse
+
+
+# Reads DOC_ID or DOC_IDxCOUNT
+def countedID(text):
+    doc_id, _, count = text.lower().partition("x")
+    return (int(doc_id), int(count) if count != "" else 1)
+
+
+def addRoster(parser):
+    parser.add_argument("--monster", action="append", type=countedID, default=[], metavar="ID[xCOUNT]",
+                        help="monster doc_id, repeated COUNT times")
+    parser.add_argument("--group", action="append", type=countedID, default=[], metavar="IDxCOUNT",
+                        help="monster doc_id as one group of COUNT members sharing a turn")
+    parser.add_argument("--player", action="append", type=int, default=[], metavar="ID",
+                        help="player character doc_id")
+    parser.add_argument("--hp", choices=["average", "rolled", "max"], default="average",
+                        help="how monsters get their hit points")
+
+
+def parseArgs(argv):
+    parser = argparse.ArgumentParser(prog="combat_companion", description="Combat Companion without the window")
+    commands = parser.add_subparsers(dest="command", required=True)
+    run = commands.add_parser("run-encounter", help="run an encounter from commands on stdin or a script")
+    addRoster(run)
+    run.add_argument("--script", metavar="FILE", help="read commands from FILE instead of stdin")
+    sim = commands.add_parser("simulate", help="play an encounter out automatically many times")
+    addRoster(sim)
+    sim.add_argument("--trials", type=int, default=100)
+    sim.add_argument("--rounds", type=int, default=20, help="round limit for each fight")
+    sim.add_argument("--seed", type=int)
+    roll = commands.add_parser("roll", help="roll a dice expression")
+    roll.add_argument("expression")
+    roll.add_argument("-n", type=int, default=1, help="number of times to roll")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parseArgs(argv)
+    # Each command only imports what it needs, so rolling dice doesn't load the combat engine
+    match args.command:
+        case "roll":
+            from HelperFunctions import rollDice
+            for i in range(args.n):
+                print(rollDice(args.expression, hasAvg=False))
+        case "run-encounter":
+            from combat_companion.Session import Session, buildEncounter, HitPointMethod
+            session = Session(buildEncounter(args.monster, args.player, args.group, HitPointMethod[args.hp.upper()]))
+            session.status()
+            if args.script is not None:
+                with open(args.script) as script:
+                    session.run(script)
+            else:
+                # Prompt only when someone is typing
+                interactive = sys.stdin.isatty()
+                while True:
+                    if interactive:
+                        print("> ", end="", flush=True)
+                    line = sys.stdin.readline()
+                    if line == "" or not session.execute(line):
+                        break
+        case "simulate":
+            from combat_companion.Simulation import simulate, HitPointMethod
+            result = simulate(args.monster, args.player, args.group, args.trials, args.rounds, args.seed,
+                              HitPointMethod[args.hp.upper()])
+            print(f"{result['trials']} fights: party won {result['partyWins']}, monsters won {result['monsterWins']}, "
+                  f"{result['draws']} unfinished after {args.rounds} rounds")
+            print(f"Average length {result['averageRounds']:.1f} rounds, party ended with "
+                  f"{result['averageHPLeft']:.0%} of their HP")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())